@@ -0,0 +1,52 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+
+from production_config import ProductionConfig
+
+# Format of every log line written by the sink
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+# Background listener draining the log queue (None until setup_logging runs)
+_listener = None
+
+class SamplingFilter(logging.Filter):
+    """Let one DEBUG/INFO record in every `rate` through, for per-row diagnostics in hot loops"""
+    
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self._counter = itertools.count()
+    
+    def filter(self, record):
+        # Warnings and errors report real per-row failures and are never sampled out
+        if record.levelno >= logging.WARNING:
+            return True
+        return next(self._counter) % self.rate == 0
+
+def setup_logging(level=None):
+    """Route every logger through a QueueHandler so request threads never block on stream I/O"""
+    global _listener
+    if _listener is not None:
+        return
+    
+    # Records are queued by the caller and written to stderr by a single listener thread
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level or ProductionConfig.LOG_LEVEL)
+
+def get_row_logger(name, rate=None):
+    """Return the sampled child logger used for per-row diagnostics of a module"""
+    row_logger = logging.getLogger(f'{name}.rows')
+    if not any(isinstance(f, SamplingFilter) for f in row_logger.filters):
+        row_logger.addFilter(SamplingFilter(rate or ProductionConfig.LOG_SAMPLE_RATE))
+    return row_logger
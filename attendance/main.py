@@ -2,6 +2,8 @@ import sqlite3
 import datetime
 import os
 import socket
+import asyncio
+import ipaddress
 
 # SQLite DB setup
 DB_PATH = 'attendance.db'
@@ -23,17 +25,60 @@ def test_device_connection(ip, port=4370, timeout=5):
     except:
         return False
 
-def discover_devices(network_prefix="192.168.1", start_ip=1, end_ip=254, port=4370):
+def scan_hosts(network, start_ip=1, end_ip=254):
+    """Expand a CIDR block (192.168.1.0/24), single IP or legacy prefix (192.168.1) into host addresses"""
+    if '/' in network:
+        return [str(host) for host in ipaddress.ip_network(network, strict=False).hosts()]
+    if network.count('.') == 3:
+        return [network]
+    return [f"{network}.{i}" for i in range(start_ip, end_ip + 1)]
+
+async def probe_device(ip, port, timeout, semaphore):
+    """Return (ip, port) if a TCP connection opens within timeout, otherwise None"""
+    async with semaphore:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return ip, port
+
+async def scan_devices(hosts, ports=(4370,), timeout=1.0, concurrency=256):
+    """Probe every host/port pair concurrently and yield each hit as soon as it answers"""
+    semaphore = asyncio.Semaphore(concurrency)
+    probes = [asyncio.ensure_future(probe_device(ip, port, timeout, semaphore)) 
+              for ip in hosts for port in ports]
+    try:
+        for probe in asyncio.as_completed(probes):
+            hit = await probe
+            if hit:
+                yield hit
+    finally:
+        for probe in probes:
+            probe.cancel()
+
+def discover_devices(network="192.168.1.0/24", ports=(4370,), timeout=1.0, concurrency=256, 
+                     start_ip=1, end_ip=254, on_found=None):
     """Scan network for potential biometric devices"""
-    print(f"Scanning network {network_prefix}.{start_ip} to {network_prefix}.{end_ip} for devices...")
+    if isinstance(ports, int):
+        ports = (ports,)
+    hosts = scan_hosts(network, start_ip, end_ip)
+    print(f"Scanning {len(hosts)} hosts in {network} on port(s) {', '.join(map(str, ports))} for devices...")
     found_devices = []
     
-    for i in range(start_ip, end_ip + 1):
-        ip = f"{network_prefix}.{i}"
-        if test_device_connection(ip, port, timeout=1):
-            found_devices.append(ip)
+    async def run_scan():
+        async for ip, port in scan_devices(hosts, ports, timeout, concurrency):
+            found_devices.append((ip, port))
             print(f"Found device at {ip}:{port}")
+            if on_found:
+                on_found(ip, port)
     
+    asyncio.run(run_scan())
     return found_devices
 
 def pull_users_from_device(conn):
@@ -377,15 +422,17 @@ def device_mode():
                 print(f"❌ Device at {ip}:{port} is not reachable!")
         
         elif choice == '2':
-            network = input("Enter network prefix (e.g., 192.168.1): ").strip()
+            network = input("Enter network (e.g., 192.168.1.0/24 or 192.168.1): ").strip()
             if not network:
-                network = "192.168.1"
+                network = "192.168.1.0/24"
+            ports = input("Enter device port(s), comma separated (default 4370): ").strip()
+            ports = [int(p) for p in ports.split(',') if p.strip().isdigit()] or [4370]
             
-            devices = discover_devices(network)
+            devices = discover_devices(network, ports)
             if devices:
                 print(f"\nFound {len(devices)} devices:")
-                for device in devices:
-                    print(f"  - {device}:4370")
+                for ip, port in devices:
+                    print(f"  - {ip}:{port}")
             else:
                 print("No devices found on the network.")
         
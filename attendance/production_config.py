@@ -6,6 +6,32 @@ class ProductionConfig:
     # Database configuration
     DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attendance.db')
     
+    # SQLite connection profile (applied to every pooled connection)
+    SQLITE_JOURNAL_MODE = 'WAL'  # Readers keep running while a device sync writes
+    SQLITE_SYNCHRONOUS = 'NORMAL'  # Safe with WAL; fsync only at checkpoints
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # Milliseconds to wait for a lock
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # Negative means KiB (64 MB)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))  # Bytes (256 MB)
+    SQLITE_TEMP_STORE = 'MEMORY'
+    SQLITE_CHECKPOINT_INTERVAL = int(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 300))  # Seconds
+    SQLITE_CHECKPOINT_MODE = os.environ.get('SQLITE_CHECKPOINT_MODE', 'PASSIVE')
+    
+    @classmethod
+    def sqlite_pragmas(cls):
+        """PRAGMA statements for a new SQLite connection"""
+        return (
+            f'journal_mode = {cls.SQLITE_JOURNAL_MODE}',
+            f'synchronous = {cls.SQLITE_SYNCHRONOUS}',
+            f'busy_timeout = {cls.SQLITE_BUSY_TIMEOUT}',
+            f'cache_size = {cls.SQLITE_CACHE_SIZE}',
+            f'mmap_size = {cls.SQLITE_MMAP_SIZE}',
+            f'temp_store = {cls.SQLITE_TEMP_STORE}',
+        )
+    
+    # Logging configuration
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_SAMPLE_RATE = int(os.environ.get('LOG_SAMPLE_RATE', 100))  # Per-row DEBUG/INFO diagnostics: log 1 in N (warnings are never sampled)
+    
     # Flask configuration
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-change-this-in-production'
     DEBUG = False
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# web_app opens attendance.db relative to the working directory and starts its
+# scheduler jobs on import, so move to a scratch directory before importing it
+os.chdir(tempfile.mkdtemp(prefix='attendance-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_app  # noqa: E402
+
+# Background jobs would race the tests for each fresh database
+web_app.scheduler.pause()
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Fresh database created by setup_db, with its own pool and writer; yields a cursor"""
+    web_app.db_pool.close_all()
+    monkeypatch.setattr(web_app, 'DB_PATH', str(tmp_path / 'attendance.db'))
+    monkeypatch.setattr(web_app, 'db_writer', web_app.DatabaseWriter())
+    web_app.setup_db()
+    
+    conn = web_app.get_db_connection()
+    yield conn.cursor()
+    conn.rollback()
+    conn.close()
+    web_app.db_pool.close_all()
@@ -0,0 +1,31 @@
+from collections import namedtuple
+from datetime import datetime
+
+import web_app
+
+Punch = namedtuple('Punch', 'uid user_id timestamp')
+
+def test_night_shift_late_arrival_uses_check_in(db):
+    db.execute("INSERT INTO users (userid, name, shift_type) VALUES (900, 'Night Worker', 'night')")
+    # The first punch of the day is the morning check-out; the evening check-in is late
+    punches = [Punch(900, '900', datetime(2024, 3, 5, 4, 30)), Punch(900, '900', datetime(2024, 3, 5, 19, 30))]
+    web_app.ingest_device_punches(db, '10.0.0.1', 4370, punches, web_app.load_user_shift_map(db))
+    
+    late = db.execute("SELECT SUM(late_count) FROM daily_rollup WHERE date = '2024-03-05'").fetchone()[0]
+    assert late == 1
+
+def test_company_filter_counts_users_without_company_id(db):
+    # Users added from a device get a company name but no company_id
+    db.executemany('INSERT INTO users (userid, name, company_name, company_id) VALUES (?, ?, ?, NULL)', 
+                   [(900, 'Device User', 'Acme'), (901, 'Other User', 'Globex')])
+    punches = [Punch(userid, str(userid), datetime(2024, 3, 5, hour, 0)) 
+               for userid in (900, 901) for hour in (9, 17)]
+    web_app.ingest_device_punches(db, '10.0.0.1', 4370, punches, web_app.load_user_shift_map(db))
+    db.connection.commit()
+    
+    bundle = web_app.build_analytics('Acme', '2024-03-05', '2024-03-05')
+    assert bundle['attendanceTrend']['present'] == [1]
+    assert bundle['quickStats']['avgWorkingHours'] == 8.0
+    
+    bundle = web_app.build_analytics('Globex', '2024-03-05', '2024-03-05')
+    assert bundle['attendanceTrend']['present'] == [1]
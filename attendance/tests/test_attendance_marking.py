@@ -0,0 +1,26 @@
+import web_app
+
+def marking(db, userid, date):
+    return db.execute('SELECT status, version FROM attendance_marking WHERE userid = ? AND date = ?', 
+                      (userid, date)).fetchone()
+
+def test_stale_version_is_reported_as_conflict(db):
+    saved, conflicts = web_app.save_attendance_changes(db, [(1, '2024-03-05', 'present', 8, 0, 0, '', 0)])
+    assert saved == [{'userid': 1, 'date': '2024-03-05', 'version': 1}] and conflicts == []
+    
+    # Another user saves the cell first, then a client still holding version 1 saves
+    web_app.save_attendance_changes(db, [(1, '2024-03-05', 'leave', 0, 0, 0, '', 1)])
+    saved, conflicts = web_app.save_attendance_changes(db, [(1, '2024-03-05', 'absent', 0, 0, 0, '', 1), 
+                                                            (1, '2024-03-06', 'present', 8, 0, 0, '', 0)])
+    assert conflicts == [{'userid': 1, 'date': '2024-03-05', 'version': 2, 'status': 'leave'}]
+    assert saved == [{'userid': 1, 'date': '2024-03-06', 'version': 1}]
+    assert tuple(marking(db, 1, '2024-03-05')) == ('leave', 2)
+
+def test_overlapping_holiday_range_splits_inserted_and_updated(db):
+    assert web_app.assign_holiday_markings(db, '2024-03-01', '2024-03-03', 'Festival', employee_ids=[1, 12]) == (6, 0)
+    
+    # 03-02 and 03-03 already carry a marking for both employees
+    assert web_app.assign_holiday_markings(db, '2024-03-02', '2024-03-05', 'Extended', employee_ids=[1, 12]) == (4, 4)
+    assert tuple(marking(db, 12, '2024-03-03')) == ('holiday', 2)
+    assert tuple(marking(db, 12, '2024-03-05')) == ('holiday', 1)
+    assert db.execute("SELECT COUNT(*) FROM attendance_marking WHERE remarks = 'Extended'").fetchone()[0] == 8
@@ -0,0 +1,16 @@
+import pytest
+
+import web_app
+
+@pytest.mark.parametrize('limit, expected', [(0, 1), (-5, 1), (3, 3)])
+def test_attendance_records_limit_is_clamped(db, limit, expected):
+    client = web_app.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    
+    response = client.get('/api/attendance_records', query_string={
+        'from_date': '2025-08-01', 'to_date': '2025-08-31', 'limit': limit})
+    data = response.get_json()
+    assert data['success'], data
+    assert len(data['records']) == expected
+    assert data['next_cursor'] is not None
@@ -0,0 +1,33 @@
+import gc
+
+import pytest
+
+import web_app
+
+def test_pool_caps_open_connections(db):
+    pool = web_app.ConnectionPool(max_size=2, timeout=0.05)
+    first, second = pool.acquire(), pool.acquire()
+    
+    # Both connections are in use, so a third caller waits and then gives up
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    
+    # A connection handed back (even twice) is reused, not duplicated
+    first.close()
+    first.close()
+    assert pool.acquire() is first
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    
+    first.close()
+    second.close()
+    pool.close_all()
+
+def test_leaked_connection_gives_its_slot_back(db):
+    pool = web_app.ConnectionPool(max_size=1, timeout=0.05)
+    pool.acquire().execute('SELECT 1')
+    
+    # The connection above was never closed; once collected its slot is free again
+    gc.collect()
+    pool.acquire().close()
+    pool.close_all()
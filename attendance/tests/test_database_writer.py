@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+import web_app
+
+def insert_holiday(cursor, date, name):
+    cursor.execute('INSERT INTO holidays (date, name) VALUES (?, ?)', (date, name))
+
+def holiday_names(db):
+    return [row[0] for row in db.execute("SELECT name FROM holidays WHERE date LIKE '2024-03-%' ORDER BY date")]
+
+def test_timed_out_write_never_commits(db, monkeypatch):
+    monkeypatch.setattr(web_app, 'DB_WRITE_TIMEOUT', 0.05)
+    release = threading.Event()
+    slow = web_app.db_writer.submit(lambda cursor: release.wait(5))
+    
+    # Queued behind the slow operation past the timeout: reported as failed and withdrawn
+    with pytest.raises(TimeoutError):
+        web_app.db_writer.execute(insert_holiday, '2024-03-05', 'Too late')
+    
+    release.set()
+    slow.result(timeout=5)
+    web_app.db_writer.execute(insert_holiday, '2024-03-06', 'On time')
+    assert holiday_names(db) == ['On time']
+
+def hold_writer(writer):
+    """Occupy the writer thread until the returned event is set"""
+    started = threading.Event()
+    release = threading.Event()
+    writer.submit(lambda cursor: started.set() or release.wait(5))
+    assert started.wait(5)
+    return release
+
+def fail(cursor):
+    insert_holiday(cursor, '2024-03-07', 'Rolled back')
+    raise ValueError('bad row')
+
+def test_failing_operation_rolls_back_only_its_savepoint(db):
+    writer = web_app.db_writer
+    release = hold_writer(writer)
+    
+    # Queued while the writer is busy, so all three are applied in one transaction
+    futures = [writer.submit(insert_holiday, '2024-03-06', 'Before'), 
+               writer.submit(fail), 
+               writer.submit(insert_holiday, '2024-03-08', 'After')]
+    release.set()
+    
+    assert futures[0].result(timeout=5) is None
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) is None
+    assert holiday_names(db) == ['Before', 'After']
+    
+    stats = writer.stats()
+    assert (stats['transactions'], stats['operations'], stats['failures']) == (2, 4, 1)
+
+def test_full_queue_rejects_new_writes(db, monkeypatch):
+    monkeypatch.setattr(web_app, 'DB_WRITE_TIMEOUT', 0.05)
+    writer = web_app.DatabaseWriter(max_queue=1)
+    release = hold_writer(writer)
+    
+    queued = writer.submit(insert_holiday, '2024-03-06', 'Queued')
+    with pytest.raises(RuntimeError):
+        writer.submit(insert_holiday, '2024-03-07', 'Rejected')
+    
+    release.set()
+    queued.result(timeout=5)
+    assert holiday_names(db) == ['Queued']
@@ -0,0 +1,56 @@
+from collections import namedtuple
+from datetime import datetime
+
+import web_app
+
+Punch = namedtuple('Punch', 'uid user_id timestamp')
+
+def sync(db, records, full_sync=False):
+    return web_app.store_device_punches(db, '10.0.0.1', 4370, records, web_app.load_user_shift_map(db),
+                                        full_sync=full_sync)
+
+def test_same_second_punch_from_lower_uid_is_imported(db):
+    first = Punch(5, '5', datetime(2024, 3, 5, 9, 0))
+    sync(db, [first])
+    
+    # A lower device slot punching in the watermark's second must not be skipped
+    late = Punch(2, '2', datetime(2024, 3, 5, 9, 0))
+    new_records = sync(db, [first, late])
+    assert new_records == [late]
+    assert db.execute("SELECT COUNT(*) FROM device_punches WHERE punch_date = '2024-03-05'").fetchone()[0] == 2
+    assert db.execute("SELECT COUNT(*) FROM attendance WHERE punch_date = '2024-03-05'").fetchone()[0] == 2
+    
+    # Nothing new: no punches stored and no days re-paired
+    new_records = sync(db, [first, late])
+    assert new_records == []
+
+def test_first_sync_keeps_existing_attendance(db):
+    before = db.execute('SELECT COUNT(*) FROM attendance').fetchone()[0]
+    assert before > 0
+    
+    # No watermark yet for this device: punches are merged, not used to rebuild the table
+    new_records = sync(db, [Punch(1, '1', datetime(2024, 3, 5, 9, 0)), Punch(1, '1', datetime(2024, 3, 5, 18, 0))])
+    assert len(new_records) == 2
+    assert db.execute('SELECT COUNT(*) FROM attendance').fetchone()[0] == before + 1
+
+def test_full_fleet_sync_rebuilds_once(db, monkeypatch):
+    db.executemany('INSERT INTO devices (name, ip, port) VALUES (?, ?, 4370)', 
+                   [('Gate', '10.0.0.1'), ('Office', '10.0.0.2')])
+    db.execute("INSERT INTO users (userid, name, shift_type) VALUES (900, 'Day Worker', 'day')")
+    db.connection.commit()
+    
+    punches = {'10.0.0.1': [Punch(900, '900', datetime(2024, 3, 5, 9, 0))], 
+               '10.0.0.2': [Punch(900, '900', datetime(2024, 3, 5, 18, 0))]}
+    monkeypatch.setattr(web_app, 'fetch_device_data', 
+                        lambda ip, port, timeout, retries: ([], punches[ip]))
+    rebuilds = []
+    rebuild_attendance = web_app.rebuild_attendance
+    monkeypatch.setattr(web_app, 'rebuild_attendance', 
+                        lambda cursor, shift_map: rebuilds.append(1) or rebuild_attendance(cursor, shift_map))
+    
+    # The device seeded by setup_db is unreachable here and simply fails
+    success, _, results = web_app.sync_device_fleet(full_sync=True)
+    assert success and sum(result['success'] for result in results) == 2
+    assert len(rebuilds) == 1
+    row = db.execute("SELECT check_in, check_out FROM attendance WHERE userid = 900 AND punch_date = '2024-03-05'").fetchone()
+    assert (row['check_in'], row['check_out']) == ('2024-03-05 09:00:00', '2024-03-05 18:00:00')
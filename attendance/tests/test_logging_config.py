@@ -0,0 +1,14 @@
+import logging
+
+from logging_config import get_row_logger
+
+def test_row_logger_samples_only_debug_and_info(caplog):
+    row_logger = get_row_logger('tests.sampling', rate=10)
+    with caplog.at_level(logging.DEBUG, logger='tests.sampling.rows'):
+        for row in range(50):
+            row_logger.debug("row %d", row)
+            row_logger.warning("bad row %d", row)
+    
+    levels = [record.levelno for record in caplog.records]
+    assert levels.count(logging.WARNING) == 50
+    assert levels.count(logging.DEBUG) == 5
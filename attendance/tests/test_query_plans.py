@@ -0,0 +1,32 @@
+import pytest
+
+# Date-range and company filters as the app issues them, and the index each must search with.
+# Per-user day lookups go through ux_attendance_userid_punch_date, which replaced
+# the plain idx_attendance_userid_punch_date index when attendance became one row per user-day.
+INDEXED_QUERIES = [
+    ('SELECT * FROM attendance WHERE punch_date >= ? AND punch_date <= ?', 
+     'idx_attendance_punch_date'),
+    ('SELECT * FROM attendance WHERE userid = ? AND punch_date >= ? AND punch_date <= ?', 
+     'ux_attendance_userid_punch_date'),
+    ('SELECT * FROM device_punches WHERE punch_date >= ? AND punch_date <= ?', 
+     'idx_device_punches_punch_date'),
+    ('SELECT * FROM attendance_marking WHERE date >= ? AND date <= ?', 
+     'idx_attendance_marking_date'),
+    ('SELECT * FROM users WHERE company_id = ?', 
+     'idx_users_company_id'),
+]
+
+def query_plan(db, query, params):
+    return ' | '.join(row['detail'] for row in db.execute(f'EXPLAIN QUERY PLAN {query}', params))
+
+@pytest.mark.parametrize('query, index', INDEXED_QUERIES)
+def test_filter_searches_index(db, query, index):
+    params = [1, '2024-03-01', '2024-03-31'][-query.count('?'):]
+    plan = query_plan(db, query, params)
+    assert f'USING INDEX {index}' in plan or f'USING COVERING INDEX {index}' in plan, plan
+    assert plan.startswith('SEARCH'), plan
+
+def test_date_function_predicate_scans_attendance(db):
+    # The DATE(timestamp) form the range predicates replaced cannot use an index
+    assert query_plan(db, 'SELECT * FROM attendance WHERE DATE(timestamp) = ?', ['2024-03-05']) == 'SCAN attendance'
+    assert query_plan(db, 'SELECT * FROM attendance WHERE punch_date = ?', ['2024-03-05']).startswith('SEARCH attendance')
@@ -0,0 +1,40 @@
+from collections import namedtuple
+from datetime import datetime
+
+import web_app
+
+Punch = namedtuple('Punch', 'uid user_id timestamp')
+
+def test_night_shift_hours_survive_recalculation(db):
+    db.execute("INSERT INTO users (userid, name, shift_type) VALUES (900, 'Night Worker', 'night')")
+    punches = [Punch(900, '900', datetime(2024, 3, 5, 4, 30)), Punch(900, '900', datetime(2024, 3, 5, 19, 30))]
+    
+    web_app.ingest_device_punches(db, '10.0.0.1', 4370, punches, web_app.load_user_shift_map(db))
+    row = db.execute('SELECT check_in, check_out, working_hours FROM attendance WHERE userid = 900').fetchone()
+    assert (row['check_in'], row['check_out']) == ('2024-03-05 19:30:00', '2024-03-05 04:30:00')
+    assert row['working_hours'] == 9.0
+    
+    web_app.recalculate_attendance_hours(db)
+    assert db.execute('SELECT working_hours FROM attendance WHERE userid = 900').fetchone()[0] == 9.0
+    # The seeded night shifts (check-out stored on the next date) keep their 9 hours too
+    assert {hours for (hours,) in db.execute('SELECT working_hours FROM attendance WHERE userid != 900')} == {9.0}
+
+def test_recalculated_working_hours():
+    assert web_app.recalculated_working_hours('2024-03-05 09:00:00', '2024-03-05 17:30:00', 'day') == 8.5
+    assert web_app.recalculated_working_hours('2024-03-05 19:30:00', '2024-03-05 04:30:00', 'night') == 9.0
+    assert web_app.recalculated_working_hours('2024-03-05 19:00:00', '2024-03-06 07:00:00', 'night') == 10.0
+    assert web_app.recalculated_working_hours('2024-03-05 09:00:00', '2024-03-05 09:00:00', 'day') == 0.0
+    assert web_app.recalculated_working_hours('2024-03-05 09:00:00', 'n/a', 'day') is None
+
+def test_full_recalculation_runs_in_chunks(db, monkeypatch):
+    rows = db.execute('SELECT COUNT(*) FROM attendance WHERE check_out IS NOT NULL').fetchone()[0]
+    chunks = []
+    recalculate_attendance_chunk = web_app.recalculate_attendance_chunk
+    monkeypatch.setattr(web_app, 'recalculate_attendance_chunk', 
+                        lambda cursor: chunks.append(1) or recalculate_attendance_chunk(cursor, limit=5))
+    
+    response = web_app.app.test_client().post('/api/recalculate_working_hours', json={'full': True})
+    assert response.get_json() == {'success': True, 
+                                   'message': f'Successfully recalculated working hours for {rows} records'}
+    assert len(chunks) == -(-rows // 5)
+    assert db.execute('SELECT COUNT(*) FROM attendance_dirty').fetchone()[0] == 0
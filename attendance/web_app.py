@@ -1,14 +1,35 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_file
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_file, g, has_app_context
 from flask_mail import Mail, Message
+import click
 import sqlite3
 from datetime import datetime, timedelta
 import os
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
 from zk import ZK
 import socket
 import hashlib
+import itertools
+import logging
 import secrets
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from production_config import ProductionConfig
+from logging_config import setup_logging, get_row_logger
+
+# Logging: every record goes through one queued sink; per-row diagnostics in hot
+# loops use the sampled row logger and are only emitted at DEBUG level
+setup_logging()
+logger = logging.getLogger(__name__)
+row_logger = get_row_logger(__name__)
+
+# APScheduler logs every run of the 30-second health probe at INFO
+logging.getLogger('apscheduler').setLevel(logging.WARNING)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -40,10 +61,57 @@ def inject_company_name():
 # Database path
 DB_PATH = 'attendance.db'
 
+# Most connections the pool keeps open at once (idle or in use), and seconds a
+# caller waits for one to be handed back when all of them are busy
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT = 30
+
+# PRAGMAs applied once when the pool opens a new connection (WAL, busy timeout,
+# cache and mmap sizes; see ProductionConfig)
+DB_PRAGMAS = ProductionConfig.sqlite_pragmas()
+
+# Single writer thread: pending write operations it queues, how many it group-commits
+# per transaction, and seconds a request waits for its write to be committed
+DB_WRITE_QUEUE_SIZE = 256
+DB_WRITE_BATCH_SIZE = 64
+DB_WRITE_TIMEOUT = 30
+
+# Long writes: a full recalculation is applied in chunks of this many user-days so
+# queued saves are committed in between (device syncs wait without a time limit)
+DB_WRITE_CHUNK_SIZE = 500
+
+# Excel exports: widest auto-sized column, and how many leading rows are buffered
+# to size the columns before a write-only sheet starts streaming
+EXCEL_MAX_COLUMN_WIDTH = 50
+EXCEL_WIDTH_SAMPLE_ROWS = 500
+
+# Rows fetched from the cursor and encoded per chunk of a streamed CSV export
+CSV_EXPORT_CHUNK_ROWS = 1000
+
+# Analytics result cache: most filter combinations kept, and seconds before an entry expires
+ANALYTICS_CACHE_SIZE = 64
+ANALYTICS_CACHE_TTL = 300
+
 # Device configuration
 DEFAULT_DEVICE_IP = '192.168.1.201'
 DEFAULT_DEVICE_PORT = 4370
 
+# Maximum number of devices read concurrently during a fleet sync
+FLEET_SYNC_WORKERS = 8
+
+# Seconds between background device health probes (and each probe's timeout)
+DEVICE_HEALTH_INTERVAL = 30
+DEVICE_HEALTH_TIMEOUT = 3
+
+# Rows per page on the attendance view (and its JSON endpoint)
+ATTENDANCE_PAGE_SIZE = 100
+
+# Seconds between background passes filling in missing attendance working hours
+WORKING_HOURS_BACKFILL_INTERVAL = 300
+
+# Longest date range (in days) a single bulk holiday assignment may cover
+HOLIDAY_ASSIGN_MAX_DAYS = 366
+
 # Admin credentials (you can change these)
 ADMIN_USERNAME = 'admin'
 ADMIN_PASSWORD = 'admin123'  # Change this to a secure password
@@ -70,11 +138,425 @@ def login_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection that is handed back to the pool instead of being closed"""
+    
+    pool = None
+    request_scoped = False
+    # Hands the pool slot back on release, or when a connection that was never
+    # closed (e.g. on an error path) is garbage collected
+    slot = None
+    
+    def close(self):
+        # Request-scoped connections are released once, at app context teardown
+        if not self.request_scoped:
+            self.pool.release(self)
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared by requests, threads and background jobs"""
+    
+    def __init__(self, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        # One slot per connection the pool may have open, taken on acquire and given back on release
+        self._slots = threading.BoundedSemaphore(max_size)
+    
+    def _connect(self):
+        """Open a new connection and apply the PRAGMA profile once"""
+        conn = sqlite3.connect(DB_PATH, factory=PooledConnection, check_same_thread=False,
+                               timeout=ProductionConfig.SQLITE_BUSY_TIMEOUT / 1000)
+        conn.pool = self
+        conn.row_factory = sqlite3.Row
+        for pragma in DB_PRAGMAS:
+            conn.execute(f'PRAGMA {pragma}')
+        return conn
+    
+    def acquire(self):
+        """Take an idle connection, opening a new one below max_size; waits up to timeout when all are in use"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RuntimeError('No database connection available, try again shortly')
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+        conn.slot = weakref.finalize(conn, self._slots.release)
+        return conn
+    
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        # Closing a connection twice must not hand it out twice
+        if conn.slot is None or not conn.slot.alive:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+            self._idle.put_nowait(conn)
+        finally:
+            conn.slot()
+    
+    def close_all(self):
+        """Close every idle connection (e.g. before replacing the database file)"""
+        while True:
+            try:
+                sqlite3.Connection.close(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+db_pool = ConnectionPool()
+
 def get_db_connection():
-    """Create a database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get a database connection (one per request, pooled for background jobs)"""
+    # Inside a request the same connection is reused until app context teardown;
+    # elsewhere a connection is borrowed from the pool and returned by close()
+    if has_app_context():
+        conn = g.get('db_conn')
+        if conn is None:
+            conn = db_pool.acquire()
+            conn.request_scoped = True
+            g.db_conn = conn
+        return conn
+    return db_pool.acquire()
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Hand the request's connection back to the pool"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.request_scoped = False
+        db_pool.release(conn)
+
+class DatabaseWriter:
+    """Single writer thread that applies queued write operations in group-committed transactions"""
+    
+    def __init__(self, max_queue=DB_WRITE_QUEUE_SIZE, max_batch=DB_WRITE_BATCH_SIZE):
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.transactions = 0
+        self.operations = 0
+        self.failures = 0
+    
+    def _start(self):
+        """Start the writer thread on first use (after any worker fork)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+    
+    def submit(self, operation, *args, **kwargs):
+        """Queue operation(cursor, *args, **kwargs) for the writer; returns a Future with its result"""
+        self._start()
+        future = Future()
+        try:
+            self._queue.put((operation, args, kwargs, future), timeout=DB_WRITE_TIMEOUT)
+        except queue.Full:
+            raise RuntimeError('Database write queue is full, try again shortly')
+        return future
+    
+    def execute(self, operation, *args, **kwargs):
+        """Run a write operation on the writer thread and wait until it is committed"""
+        future = self.submit(operation, *args, **kwargs)
+        try:
+            return future.result(timeout=DB_WRITE_TIMEOUT)
+        except FutureTimeoutError:
+            # Still queued (e.g. behind a device sync): withdraw it so a reported
+            # failure never commits later; once running it is waited for instead
+            if future.cancel():
+                raise
+            return future.result()
+    
+    def execute_long(self, operation, *args, **kwargs):
+        """Run a long write operation (e.g. a device sync) and wait for its commit however long it takes"""
+        return self.submit(operation, *args, **kwargs).result()
+    
+    def _run(self):
+        """Writer loop: take whatever is queued (up to max_batch) and commit it as one transaction"""
+        # The writer keeps a dedicated connection for its lifetime, outside the pool's
+        # limit, so a pool exhausted by readers can never stall the writes
+        conn = db_pool._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(conn, batch)
+    
+    def _apply(self, conn, batch):
+        """Apply a batch in one transaction; each operation runs in a savepoint so a failure only undoes itself"""
+        cursor = conn.cursor()
+        outcomes = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for operation, args, kwargs, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute('SAVEPOINT write_operation')
+                try:
+                    result = operation(cursor, *args, **kwargs)
+                    cursor.execute('RELEASE write_operation')
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_operation')
+                    cursor.execute('RELEASE write_operation')
+                    outcomes.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            # The transaction itself failed (e.g. the lock could not be taken), so nothing was written
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            with self._lock:
+                self.failures += len(batch)
+            logger.error("Database write batch of %d failed: %s", len(batch), e)
+            return
+        
+        with self._lock:
+            self.transactions += 1
+            self.operations += len(outcomes)
+            self.failures += sum(1 for outcome in outcomes if outcome[2] is not None)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+    
+    def stats(self):
+        """Return queue depth and group-commit counters"""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'transactions': self.transactions,
+                'operations': self.operations,
+                'failures': self.failures,
+                'operationsPerTransaction': round(self.operations / self.transactions, 2) if self.transactions else 0,
+                'maxBatch': self.max_batch
+            }
+
+db_writer = DatabaseWriter()
+
+def checkpoint_wal():
+    """Scheduler job: fold the WAL back into the database file so it stays small"""
+    try:
+        conn = get_db_connection()
+        busy, log_frames, checkpointed = conn.execute(
+            f'PRAGMA wal_checkpoint({ProductionConfig.SQLITE_CHECKPOINT_MODE})').fetchone()
+        conn.close()
+        
+        if busy or checkpointed < log_frames:
+            logger.warning("WAL checkpoint incomplete: %d/%d frames copied", checkpointed, log_frames)
+    except Exception as e:
+        logger.error("Error checkpointing WAL: %s", e)
+
+scheduler.add_job(
+    func=checkpoint_wal,
+    trigger=IntervalTrigger(seconds=ProductionConfig.SQLITE_CHECKPOINT_INTERVAL),
+    id='wal_checkpoint',
+    name='Checkpoint SQLite WAL',
+    max_instances=1,
+    coalesce=True,
+    replace_existing=True
+)
+
+def month_date_range(year, month):
+    """Return (first day, first day of next month) for sargable punch_date/date range filters"""
+    year, month = int(year), int(month)
+    if month == 12:
+        return f"{year:04d}-{month:02d}-01", f"{year + 1:04d}-01-01"
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month + 1:02d}-01"
+
+def create_export_workbook():
+    """Create a write-only workbook with the shared export named styles registered"""
+    from openpyxl import Workbook
+    from openpyxl.styles import NamedStyle, Font, PatternFill, Alignment, Border, Side
+    
+    workbook = Workbook(write_only=True)
+    
+    # Styles are registered once per workbook and referenced by name from every cell
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    center = Alignment(horizontal='center', vertical='center')
+    
+    def fill(color):
+        return PatternFill(start_color=color, end_color=color, fill_type='solid')
+    
+    for style in (
+        NamedStyle('export_title', font=Font(size=16, bold=True), alignment=Alignment(horizontal='center')),
+        NamedStyle('export_subtitle', font=Font(size=12), alignment=Alignment(horizontal='center')),
+        NamedStyle('export_section', font=Font(size=14, bold=True)),
+        NamedStyle('export_label', font=Font(bold=True)),
+        NamedStyle('export_value', font=Font(bold=True, color='007ACC')),
+        NamedStyle('export_header', font=Font(bold=True, color='FFFFFF'), fill=fill('366092'), 
+                   alignment=center, border=border),
+        NamedStyle('export_header_grey', font=Font(bold=True), fill=fill('CCCCCC')),
+        NamedStyle('export_header_employee', font=Font(bold=True, color='000000'), fill=fill('FFC107'), 
+                   alignment=center, border=border),
+        NamedStyle('export_header_date', font=Font(bold=True, color='000000'), fill=fill('FFA500'), 
+                   alignment=center, border=border),
+        NamedStyle('export_cell', border=border),
+        NamedStyle('export_cell_centered', border=border, alignment=center),
+        NamedStyle('export_hours', border=border, number_format='0.00'),
+        NamedStyle('export_decimal', border=border, number_format='0.0'),
+        NamedStyle('export_currency', border=border, number_format='#,##0.00'),
+        NamedStyle('export_legend_complete', font=Font(color='007ACC')),
+        NamedStyle('export_legend_single', font=Font(color='FF6B35')),
+        NamedStyle('export_legend_missing', font=Font(color='999999')),
+    ):
+        workbook.add_named_style(style)
+    
+    return workbook
+
+class ExportSheet:
+    """Write-only worksheet that sizes its columns from the rows written before it starts streaming"""
+    
+    def __init__(self, workbook, title, column_widths=None, max_width=EXCEL_MAX_COLUMN_WIDTH):
+        self.ws = workbook.create_sheet(title=title[:31])
+        self.fixed_widths = dict(column_widths or {})
+        self.max_width = max_width
+        self.widths = {}
+        self.pending = []
+        self.row_count = 0
+        self.streaming = False
+    
+    def append(self, values, styles=None, track_width=True):
+        """Append a row; styles is one named style for every cell or a list with one per column"""
+        from openpyxl.cell import WriteOnlyCell
+        
+        values = list(values)
+        if styles is None:
+            cells = values
+        else:
+            if isinstance(styles, str):
+                styles = [styles] * len(values)
+            cells = []
+            for value, style in zip(values, styles):
+                if style:
+                    cell = WriteOnlyCell(self.ws, value=value)
+                    cell.style = style
+                    cells.append(cell)
+                else:
+                    cells.append(value)
+        
+        # Column widths are only needed until the sheet header has been written
+        if track_width and not self.streaming:
+            for column, value in enumerate(values, 1):
+                if value is not None:
+                    self.widths[column] = max(self.widths.get(column, 0), len(str(value)))
+        
+        self.row_count += 1
+        if self.streaming:
+            self.ws.append(cells)
+        else:
+            self.pending.append(cells)
+            if len(self.pending) >= EXCEL_WIDTH_SAMPLE_ROWS:
+                self.start_streaming()
+        return self.row_count
+    
+    def title(self, text, span, style='export_title'):
+        """Append a title row merged across the first span columns"""
+        from openpyxl.utils import get_column_letter
+        
+        row = self.append([text], style, track_width=False)
+        if span > 1:
+            self.ws.merged_cells.add(f"A{row}:{get_column_letter(span)}{row}")
+        return row
+    
+    def blank(self):
+        """Append an empty row"""
+        return self.append([], track_width=False)
+    
+    def start_streaming(self):
+        """Fix the column widths, flush the buffered rows and write every later row straight through"""
+        from openpyxl.utils import get_column_letter
+        
+        if self.streaming:
+            return
+        
+        for column, width in self.widths.items():
+            if column not in self.fixed_widths:
+                self.ws.column_dimensions[get_column_letter(column)].width = min(width + 2, self.max_width)
+        for column, width in self.fixed_widths.items():
+            self.ws.column_dimensions[get_column_letter(column)].width = width
+        
+        for cells in self.pending:
+            self.ws.append(cells)
+        self.pending = []
+        self.streaming = True
+
+class ExcelExport:
+    """Streaming Excel export built on openpyxl's write-only mode and shared named styles"""
+    
+    def __init__(self):
+        self.workbook = create_export_workbook()
+        self.sheets = []
+    
+    def add_sheet(self, title, column_widths=None, max_width=EXCEL_MAX_COLUMN_WIDTH):
+        """Add a sheet; column_widths ({column number: width}) overrides the tracked widths"""
+        sheet = ExportSheet(self.workbook, title, column_widths, max_width)
+        self.sheets.append(sheet)
+        return sheet
+    
+    def send(self, filename):
+        """Finish every sheet and send the workbook as an .xlsx download"""
+        from io import BytesIO
+        
+        for sheet in self.sheets:
+            sheet.start_streaming()
+        
+        buffer = BytesIO()
+        self.workbook.save(buffer)
+        buffer.seek(0)
+        
+        return send_file(
+            buffer,
+            as_attachment=True,
+            download_name=filename,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+
+def iter_csv_chunks(header, rows, compress=False):
+    """Yield CSV bytes for header and rows one chunk at a time, optionally gzip-compressed"""
+    import csv
+    import io
+    import zlib
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # wbits=31 writes a gzip container rather than a raw zlib stream
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    
+    def encode():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+        return compressor.compress(data) if compressor else data
+    
+    writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CSV_EXPORT_CHUNK_ROWS:
+            chunk = encode()
+            pending = 0
+            if chunk:
+                yield chunk
+    
+    chunk = encode()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
 
 def send_email_notification(subject, recipients, html_content, attachments=None):
     """Send email notification with optional attachments"""
@@ -92,7 +574,7 @@ def send_email_notification(subject, recipients, html_content, attachments=None)
         mail.send(msg)
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        logger.error("Error sending email: %s", e)
         return False
 
 def generate_attendance_summary_email():
@@ -106,7 +588,7 @@ def generate_attendance_summary_email():
         cursor.execute('''
             SELECT u.name, u.company_name, a.status, a.check_in, a.check_out, a.working_hours
             FROM users u
-            LEFT JOIN attendance a ON u.userid = a.userid AND DATE(a.timestamp) = ?
+            LEFT JOIN attendance a ON u.userid = a.userid AND a.punch_date = ?
             ORDER BY u.company_name, u.name
         ''', (today,))
         
@@ -180,7 +662,7 @@ def generate_attendance_summary_email():
         return html_content
         
     except Exception as e:
-        print(f"Error generating attendance summary: {e}")
+        logger.error("Error generating attendance summary: %s", e)
         return None
 
 def generate_salary_summary_email(month, year):
@@ -192,15 +674,15 @@ def generate_salary_summary_email(month, year):
         # Get salary data for the month
         cursor.execute('''
             SELECT u.name, u.company_name, u.monthly_salary,
-                   COUNT(DISTINCT DATE(a.timestamp)) as present_days,
+                   COUNT(DISTINCT a.punch_date) as present_days,
                    SUM(a.working_hours) as total_hours,
                    SUM(CASE WHEN a.working_hours > 8 THEN a.working_hours - 8 ELSE 0 END) as overtime_hours
             FROM users u
             LEFT JOIN attendance a ON u.userid = a.userid 
-                AND strftime('%Y-%m', a.timestamp) = ?
+                AND a.punch_date >= ? AND a.punch_date < ?
             GROUP BY u.userid, u.name, u.company_name, u.monthly_salary
             ORDER BY u.company_name, u.name
-        ''', (f"{year}-{month:02d}",))
+        ''', month_date_range(year, month))
         
         records = cursor.fetchall()
         conn.close()
@@ -281,35 +763,32 @@ def generate_salary_summary_email(month, year):
         return html_content
         
     except Exception as e:
-        print(f"Error generating salary summary: {e}")
+        logger.error("Error generating salary summary: %s", e)
         return None
 
 def save_email_config(email, password):
     """Save email configuration to database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if config exists
-        cursor.execute('SELECT id FROM email_config LIMIT 1')
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing config
-            cursor.execute('''UPDATE email_config 
-                             SET email = ?, password = ?, updated_date = CURRENT_TIMESTAMP 
-                             WHERE id = ?''', (email, password, existing['id']))
-        else:
-            # Insert new config
-            cursor.execute('''INSERT INTO email_config (email, password) 
-                             VALUES (?, ?)''', (email, password))
+        def save(cursor):
+            # Check if config exists
+            cursor.execute('SELECT id FROM email_config LIMIT 1')
+            existing = cursor.fetchone()
+            
+            if existing:
+                # Update existing config
+                cursor.execute('''UPDATE email_config 
+                                 SET email = ?, password = ?, updated_date = CURRENT_TIMESTAMP 
+                                 WHERE id = ?''', (email, password, existing['id']))
+            else:
+                # Insert new config
+                cursor.execute('''INSERT INTO email_config (email, password) 
+                                 VALUES (?, ?)''', (email, password))
         
-        conn.commit()
-        conn.close()
+        db_writer.execute(save)
         return True
         
     except Exception as e:
-        print(f"Error saving email config: {e}")
+        logger.error("Error saving email config: %s", e)
         return False
 
 def load_email_config():
@@ -330,386 +809,330 @@ def load_email_config():
         return None
         
     except Exception as e:
-        print(f"Error loading email config: {e}")
+        logger.error("Error loading email config: %s", e)
         return None
 
+# Daily Rollup Functions
+
+# Aggregates one daily_rollup row per (date, company, shift) from the attendance rows
+# it is given; late means arriving after 9 AM for the day shift, 7 PM for the night shift
+DAILY_ROLLUP_SELECT = '''
+    SELECT a.punch_date, IFNULL(u.company_name, ''), IFNULL(u.shift_type, ''),
+           COUNT(*),
+           SUM(CASE WHEN a.working_hours > 0 THEN a.working_hours ELSE 0 END),
+           COUNT(CASE WHEN a.working_hours > 0 THEN 1 END),
+           SUM(CASE WHEN a.working_hours > 8 THEN a.working_hours - 8 ELSE 0 END),
+           COUNT(CASE WHEN 
+               (u.shift_type = 'day' AND TIME(a.check_in) > '09:00:00') OR
+               (u.shift_type = 'night' AND TIME(a.check_in) > '19:00:00')
+           THEN 1 END)
+    FROM attendance a
+    JOIN users u ON u.userid = a.userid
+'''
+
+def refresh_daily_rollup(cursor, dates=None):
+    """Recompute the daily_rollup rows for dates from attendance (every date when dates is None)"""
+    insert = '''INSERT INTO daily_rollup 
+                  (date, company_name, shift_type, present_count, total_hours, hours_count, 
+                   overtime_hours, late_count)'''
+    group_by = ' GROUP BY a.punch_date, IFNULL(u.company_name, \'\'), IFNULL(u.shift_type, \'\')'
+    
+    if dates is None:
+        cursor.execute('DELETE FROM daily_rollup')
+        cursor.execute(insert + DAILY_ROLLUP_SELECT + group_by)
+        return
+    
+    dates = sorted(set(date for date in dates if date))
+    # Keep each statement well under SQLite's bound-parameter limit
+    for start in range(0, len(dates), 500):
+        chunk = dates[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'DELETE FROM daily_rollup WHERE date IN ({placeholders})', chunk)
+        cursor.execute(insert + DAILY_ROLLUP_SELECT + f' WHERE a.punch_date IN ({placeholders})' + group_by, chunk)
+
+def refresh_user_rollup(cursor, userids):
+    """Recompute the daily_rollup rows for every date the given users have attendance on"""
+    userids = list(userids)
+    dates = set()
+    for start in range(0, len(userids), 500):
+        chunk = userids[start:start + 500]
+        cursor.execute(f'''SELECT DISTINCT punch_date FROM attendance 
+                          WHERE userid IN ({','.join('?' * len(chunk))})''', chunk)
+        dates.update(row[0] for row in cursor.fetchall())
+    refresh_daily_rollup(cursor, dates)
+
+def rebuild_daily_rollup():
+    """Recompute the whole daily_rollup table; returns the number of rollup rows"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    refresh_daily_rollup(cursor)
+    conn.commit()
+    bump_data_version()
+    row_count = cursor.execute('SELECT COUNT(*) FROM daily_rollup').fetchone()[0]
+    conn.close()
+    return row_count
+
+@app.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """Recompute the daily attendance rollup from scratch"""
+    row_count = rebuild_daily_rollup()
+    print(f"Rebuilt daily_rollup: {row_count} rows")
+
 # Analytics Functions
-def get_analytics_quick_stats(company=None, from_date=None, to_date=None, shift=None):
-    """Get quick statistics for analytics dashboard"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+
+# Bumped after every committed write to attendance, markings or users; cached
+# analytics built from an older version are discarded on lookup
+data_version = 0
+data_version_lock = threading.Lock()
+
+def bump_data_version():
+    """Invalidate analytics results computed before the latest committed write"""
+    global data_version
+    with data_version_lock:
+        data_version += 1
+
+class AnalyticsCache:
+    """LRU/TTL cache of analytics bundles keyed by filters and tagged with the data version"""
+    
+    def __init__(self, max_size=ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing, expired or stale"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                version, created, value = entry
+                if version == data_version and time.monotonic() - created < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key, version, value):
+        """Store value for key as computed from data version"""
+        with self.lock:
+            self.entries[key] = (version, time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def stats(self):
+        """Return hit/miss counters and the current hit rate"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else 0,
+                'entries': len(self.entries),
+                'maxSize': self.max_size,
+                'ttl': self.ttl,
+                'dataVersion': data_version
+            }
+
+analytics_cache = AnalyticsCache()
+
+def compute_analytics(company=None, from_date=None, to_date=None, shift=None):
+    """Return the analytics bundle for the filters, served from the cache while the data is unchanged"""
+    key = (company or None, from_date or None, to_date or None, shift or None)
+    bundle = analytics_cache.get(key)
+    if bundle is None:
+        # Read the version first so a write committed during the build invalidates the result
+        version = data_version
+        bundle = build_analytics(company, from_date, to_date, shift)
+        analytics_cache.put(key, version, bundle)
+    return bundle
+
+def build_analytics(company=None, from_date=None, to_date=None, shift=None):
+    """Build every analytics widget's data from the daily rollup and one per-employee aggregate"""
+    # Date filter
+    if from_date and to_date:
+        start_dt = datetime.strptime(from_date, '%Y-%m-%d')
+        end_dt = datetime.strptime(to_date, '%Y-%m-%d')
+        total_days = (end_dt - start_dt).days + 1
+    else:
+        # Default to last 30 days if no dates provided
+        end_dt = datetime.now()
+        start_dt = end_dt - timedelta(days=30)
+        total_days = 30
+    start_date = start_dt.strftime('%Y-%m-%d')
+    end_date = end_dt.strftime('%Y-%m-%d')
+    today = datetime.now().strftime('%Y-%m-%d')
+    
+    # Company and shift filters
+    user_conditions = []
+    user_params = []
+    if company:
+        user_conditions.append('u.company_name = ?')
+        user_params.append(company)
+    if shift:
+        user_conditions.append('u.shift_type = ?')
+        user_params.append(shift)
+    user_filter = ''.join(f' AND {condition}' for condition in user_conditions)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Company distribution covers every user; the other widgets only the filtered ones
+    cursor.execute('SELECT company_name, COUNT(*) as count FROM users GROUP BY company_name')
+    distribution = sorted(cursor.fetchall(), key=lambda record: -record['count'])
+    
+    cursor.execute(f'''SELECT u.userid, u.name, u.company_name, u.shift_type 
+                      FROM users u WHERE 1=1{user_filter} 
+                      ORDER BY u.company_name, u.name''', user_params)
+    users = cursor.fetchall()
+    
+    # Per-day totals from the rollup (plus today's row for the quick stats)
+    rollup_conditions = []
+    rollup_params = []
+    if company:
+        rollup_conditions.append('company_name = ?')
+        rollup_params.append(company)
+    if shift:
+        rollup_conditions.append('shift_type = ?')
+        rollup_params.append(shift)
+    rollup_filter = ''.join(f' AND {condition}' for condition in rollup_conditions)
+    
+    cursor.execute(f'''SELECT date, SUM(present_count) as present, SUM(total_hours) as hours, 
+                             SUM(hours_count) as hours_count, SUM(overtime_hours) as overtime, 
+                             SUM(late_count) as late
+                      FROM daily_rollup 
+                      WHERE ((date >= ? AND date <= ?) OR date = ?){rollup_filter} 
+                      GROUP BY date''', [start_date, end_date, today] + rollup_params)
+    
+    daily_present = {}
+    daily_overtime = {}
+    weekly_hours = {}
+    range_hours = 0.0
+    range_hours_count = 0
+    present_today = 0
+    late_today = 0
+    
+    for record in cursor.fetchall():
+        date_str = record['date']
+        if date_str == today:
+            present_today = record['present']
+            late_today = record['late']
+        
+        if not start_date <= date_str <= end_date:
+            continue
         
-        # Date filter
-        if from_date and to_date:
-            start_date = from_date
-            end_date = to_date
+        daily_present[date_str] = record['present']
+        daily_overtime[date_str] = record['overtime']
+        
+        if record['hours_count']:
+            range_hours += record['hours']
+            range_hours_count += record['hours_count']
+            week = datetime.strptime(date_str, '%Y-%m-%d').strftime('%W')
+            week_totals = weekly_hours.setdefault(week, [0.0, 0])
+            week_totals[0] += record['hours']
+            week_totals[1] += record['hours_count']
+    
+    # Per-employee totals for the performance table
+    cursor.execute(f'''SELECT a.userid, 
+                             COUNT(DISTINCT a.punch_date) as present_days,
+                             AVG(a.working_hours) as avg_working_hours,
+                             SUM(CASE WHEN a.working_hours > 8 THEN a.working_hours - 8 ELSE 0 END) as overtime_hours,
+                             COUNT(CASE WHEN 
+                                 (u.shift_type = 'day' AND TIME(a.check_in) > '09:00:00') OR
+                                 (u.shift_type = 'night' AND TIME(a.check_in) > '19:00:00')
+                             THEN 1 END) as late_arrivals
+                      FROM attendance a 
+                      JOIN users u ON u.userid = a.userid 
+                      WHERE a.punch_date >= ? AND a.punch_date <= ?{user_filter} 
+                      GROUP BY a.userid''', [start_date, end_date] + user_params)
+    performance = {record['userid']: record for record in cursor.fetchall()}
+    
+    conn.close()
+    
+    # Daily series over every date in the range
+    labels = []
+    present_data = []
+    absent_data = []
+    overtime_data = []
+    current_date = start_dt
+    while current_date <= end_dt:
+        date_str = current_date.strftime('%Y-%m-%d')
+        labels.append(date_str)
+        
+        if date_str in daily_present:
+            present_data.append(daily_present[date_str])
+            absent_data.append(len(users) - daily_present[date_str])
+            overtime_data.append(round(daily_overtime[date_str], 1))
         else:
-            # Default to last 30 days if no dates provided
-            from datetime import datetime, timedelta
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-            start_date = start_date.strftime('%Y-%m-%d')
-            end_date = end_date.strftime('%Y-%m-%d')
-        
-        # Company filter
-        company_filter = ""
-        if company:
-            company_filter = f"AND u.company_name = '{company}'"
-        
-        # Shift filter
-        shift_filter = ""
-        if shift:
-            shift_filter = f"AND u.shift_type = '{shift}'"
-        
-        # Total employees
-        cursor.execute(f'''
-            SELECT COUNT(*) as total
-            FROM users u
-            WHERE 1=1 {company_filter} {shift_filter}
-        ''')
-        total_employees = cursor.fetchone()['total']
-        
-        # Present today
-        today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute(f'''
-            SELECT COUNT(DISTINCT u.userid) as present
-            FROM users u
-            JOIN attendance a ON u.userid = a.userid
-            WHERE DATE(a.timestamp) = ? {company_filter} {shift_filter}
-        ''', (today,))
-        present_today = cursor.fetchone()['present']
-        
-        # Late today (assuming 9 AM start for day shift, 7 PM for night shift)
-        cursor.execute(f'''
-            SELECT COUNT(DISTINCT u.userid) as late
-            FROM users u
-            JOIN attendance a ON u.userid = a.userid
-            WHERE DATE(a.timestamp) = ? {company_filter} {shift_filter}
-            AND (
-                (u.shift_type = 'day' AND TIME(a.timestamp) > '09:00:00') OR
-                (u.shift_type = 'night' AND TIME(a.timestamp) > '19:00:00')
-            )
-        ''', (today,))
-        late_today = cursor.fetchone()['late']
-        
-        # Average working hours
-        cursor.execute(f'''
-            SELECT AVG(a.working_hours) as avg_hours
-            FROM users u
-            JOIN attendance a ON u.userid = a.userid
-            WHERE DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ? {company_filter} {shift_filter}
-            AND a.working_hours > 0
-        ''', (start_date, end_date))
-        result = cursor.fetchone()
-        avg_working_hours = result['avg_hours'] if result['avg_hours'] else 0
-        
-        conn.close()
+            present_data.append(0)
+            absent_data.append(0)
+            overtime_data.append(0)
         
-        return {
-            'totalEmployees': total_employees,
+        current_date += timedelta(days=1)
+    
+    # Weekly working hours average, first 8 weeks of the range
+    weeks = sorted(weekly_hours)[:8]
+    
+    # Calculate performance metrics
+    performance_data = []
+    for user in users:
+        totals = performance.get(user['userid'])
+        present_days = totals['present_days'] if totals else 0
+        avg_working_hours = (totals['avg_working_hours'] if totals else None) or 0
+        overtime_hours = (totals['overtime_hours'] if totals else None) or 0
+        late_arrivals = totals['late_arrivals'] if totals else 0
+        
+        # Calculate attendance rate
+        attendance_rate = (present_days / total_days) * 100 if total_days > 0 else 0
+        
+        # Calculate performance score (0-10)
+        attendance_score = min(attendance_rate / 10, 4)  # Max 4 points
+        working_hours_score = min(avg_working_hours / 8, 3)  # Max 3 points
+        overtime_score = min(overtime_hours / 10, 2)  # Max 2 points
+        punctuality_score = max(0, 1 - (late_arrivals / 10))  # Max 1 point
+        
+        performance_score = attendance_score + working_hours_score + overtime_score + punctuality_score
+        
+        performance_data.append({
+            'name': user['name'],
+            'company_name': user['company_name'],
+            'attendanceRate': round(attendance_rate, 1),
+            'avgWorkingHours': round(avg_working_hours, 1),
+            'overtimeHours': round(overtime_hours, 1),
+            'lateArrivals': late_arrivals,
+            'performanceScore': round(performance_score, 1)
+        })
+    
+    return {
+        'quickStats': {
+            'totalEmployees': len(users),
             'presentToday': present_today,
             'lateToday': late_today,
-            'avgWorkingHours': round(avg_working_hours, 1)
-        }
-        
-    except Exception as e:
-        print(f"Error getting quick stats: {e}")
-        return {
-            'totalEmployees': 0,
-            'presentToday': 0,
-            'lateToday': 0,
-            'avgWorkingHours': 0
-        }
-
-def get_attendance_trend_data(company=None, from_date=None, to_date=None, shift=None):
-    """Get attendance trend data for charts"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Date filter
-        if from_date and to_date:
-            start_date = datetime.strptime(from_date, '%Y-%m-%d')
-            end_date = datetime.strptime(to_date, '%Y-%m-%d')
-        else:
-            # Default to last 30 days if no dates provided
-            from datetime import datetime, timedelta
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-        
-        # Company and shift filters
-        company_filter = f"AND u.company_name = '{company}'" if company else ""
-        shift_filter = f"AND u.shift_type = '{shift}'" if shift else ""
-        
-        # Get daily attendance data
-        cursor.execute(f'''
-            SELECT 
-                DATE(a.timestamp) as date,
-                COUNT(DISTINCT u.userid) as present,
-                (SELECT COUNT(*) FROM users u2 WHERE 1=1 {company_filter} {shift_filter}) - COUNT(DISTINCT u.userid) as absent
-            FROM users u
-            JOIN attendance a ON u.userid = a.userid
-            WHERE DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ? {company_filter} {shift_filter}
-            GROUP BY DATE(a.timestamp)
-            ORDER BY date
-        ''', (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-        
-        records = cursor.fetchall()
-        conn.close()
-        
-        # Prepare chart data
-        labels = []
-        present_data = []
-        absent_data = []
-        
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            labels.append(date_str)
-            
-            # Find data for this date
-            record = next((r for r in records if r['date'] == date_str), None)
-            if record:
-                present_data.append(record['present'])
-                absent_data.append(record['absent'])
-            else:
-                present_data.append(0)
-                absent_data.append(0)
-            
-            current_date += timedelta(days=1)
-        
-        return {
+            'avgWorkingHours': round(range_hours / range_hours_count, 1) if range_hours_count else 0
+        },
+        'attendanceTrend': {
             'labels': labels,
             'present': present_data,
             'absent': absent_data
-        }
-        
-    except Exception as e:
-        print(f"Error getting attendance trend: {e}")
-        return {'labels': [], 'present': [], 'absent': []}
-
-def get_company_distribution_data():
-    """Get company distribution data for pie chart"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT company_name, COUNT(*) as count
-            FROM users
-            GROUP BY company_name
-            ORDER BY count DESC
-        ''')
-        
-        records = cursor.fetchall()
-        conn.close()
-        
-        labels = [record['company_name'] for record in records]
-        values = [record['count'] for record in records]
-        
-        return {
-            'labels': labels,
-            'values': values
-        }
-        
-    except Exception as e:
-        print(f"Error getting company distribution: {e}")
-        return {'labels': [], 'values': []}
-
-def get_working_hours_data(company=None, from_date=None, to_date=None, shift=None):
-    """Get working hours data for bar chart"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Date filter
-        if from_date and to_date:
-            start_date = from_date
-            end_date = to_date
-        else:
-            # Default to last 30 days if no dates provided
-            from datetime import datetime, timedelta
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-            start_date = start_date.strftime('%Y-%m-%d')
-            end_date = end_date.strftime('%Y-%m-%d')
-        
-        # Company and shift filters
-        company_filter = f"AND u.company_name = '{company}'" if company else ""
-        shift_filter = f"AND u.shift_type = '{shift}'" if shift else ""
-        
-        # Get weekly working hours average
-        cursor.execute(f'''
-            SELECT 
-                strftime('%W', a.timestamp) as week,
-                AVG(a.working_hours) as avg_hours
-            FROM users u
-            JOIN attendance a ON u.userid = a.userid
-            WHERE DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ? {company_filter} {shift_filter}
-            AND a.working_hours > 0
-            GROUP BY strftime('%W', a.timestamp)
-            ORDER BY week
-            LIMIT 8
-        ''', (start_date, end_date))
-        
-        records = cursor.fetchall()
-        conn.close()
-        
-        labels = [f"Week {record['week']}" for record in records]
-        values = [round(record['avg_hours'], 1) for record in records]
-        
-        return {
-            'labels': labels,
-            'values': values
-        }
-        
-    except Exception as e:
-        print(f"Error getting working hours data: {e}")
-        return {'labels': [], 'values': []}
-
-def get_overtime_trend_data(company=None, from_date=None, to_date=None, shift=None):
-    """Get overtime trend data for area chart"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Date filter
-        if from_date and to_date:
-            start_date = datetime.strptime(from_date, '%Y-%m-%d')
-            end_date = datetime.strptime(to_date, '%Y-%m-%d')
-        else:
-            # Default to last 30 days if no dates provided
-            from datetime import datetime, timedelta
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-        
-        # Company and shift filters
-        company_filter = f"AND u.company_name = '{company}'" if company else ""
-        shift_filter = f"AND u.shift_type = '{shift}'" if shift else ""
-        
-        # Get daily overtime data
-        cursor.execute(f'''
-            SELECT 
-                DATE(a.timestamp) as date,
-                SUM(CASE WHEN a.working_hours > 8 THEN a.working_hours - 8 ELSE 0 END) as overtime
-            FROM users u
-            JOIN attendance a ON u.userid = a.userid
-            WHERE DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ? {company_filter} {shift_filter}
-            GROUP BY DATE(a.timestamp)
-            ORDER BY date
-        ''', (start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
-        
-        records = cursor.fetchall()
-        conn.close()
-        
-        # Prepare chart data
-        labels = []
-        values = []
-        
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            labels.append(date_str)
-            
-            # Find data for this date
-            record = next((r for r in records if r['date'] == date_str), None)
-            if record:
-                values.append(round(record['overtime'], 1))
-            else:
-                values.append(0)
-            
-            current_date += timedelta(days=1)
-        
-        return {
+        },
+        'companyDistribution': {
+            'labels': [record['company_name'] for record in distribution],
+            'values': [record['count'] for record in distribution]
+        },
+        'workingHours': {
+            'labels': [f"Week {week}" for week in weeks],
+            'values': [round(weekly_hours[week][0] / weekly_hours[week][1], 1) for week in weeks]
+        },
+        'overtimeTrend': {
             'labels': labels,
-            'values': values
-        }
-        
-    except Exception as e:
-        print(f"Error getting overtime trend: {e}")
-        return {'labels': [], 'values': []}
-
-def get_performance_table_data(company=None, from_date=None, to_date=None, shift=None):
-    """Get employee performance data for table"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Date filter
-        if from_date and to_date:
-            start_date = from_date
-            end_date = to_date
-            # Calculate total days between dates
-            from datetime import datetime
-            start_dt = datetime.strptime(from_date, '%Y-%m-%d')
-            end_dt = datetime.strptime(to_date, '%Y-%m-%d')
-            total_days = (end_dt - start_dt).days + 1
-        else:
-            # Default to last 30 days if no dates provided
-            from datetime import datetime, timedelta
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-            start_date = start_date.strftime('%Y-%m-%d')
-            end_date = end_date.strftime('%Y-%m-%d')
-            total_days = 30
-        
-        # Company and shift filters
-        company_filter = f"AND u.company_name = '{company}'" if company else ""
-        shift_filter = f"AND u.shift_type = '{shift}'" if shift else ""
-        
-        # Get employee performance data
-        cursor.execute(f'''
-            SELECT 
-                u.name,
-                u.company_name,
-                COUNT(DISTINCT DATE(a.timestamp)) as present_days,
-                AVG(a.working_hours) as avg_working_hours,
-                SUM(CASE WHEN a.working_hours > 8 THEN a.working_hours - 8 ELSE 0 END) as overtime_hours,
-                COUNT(CASE WHEN 
-                    (u.shift_type = 'day' AND TIME(a.timestamp) > '09:00:00') OR
-                    (u.shift_type = 'night' AND TIME(a.timestamp) > '19:00:00')
-                THEN 1 END) as late_arrivals
-            FROM users u
-            LEFT JOIN attendance a ON u.userid = a.userid 
-                AND DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ? {company_filter} {shift_filter}
-            WHERE 1=1 {company_filter} {shift_filter}
-            GROUP BY u.userid, u.name, u.company_name
-            ORDER BY u.company_name, u.name
-        ''', (start_date, end_date))
-        
-        records = cursor.fetchall()
-        conn.close()
-        
-        # Calculate performance metrics
-        performance_data = []
-        for record in records:
-            # Calculate attendance rate
-            attendance_rate = (record['present_days'] / total_days) * 100 if total_days > 0 else 0
-            
-            # Calculate performance score (0-10)
-            attendance_score = min(attendance_rate / 10, 4)  # Max 4 points
-            working_hours_score = min((record['avg_working_hours'] or 0) / 8, 3)  # Max 3 points
-            overtime_score = min((record['overtime_hours'] or 0) / 10, 2)  # Max 2 points
-            punctuality_score = max(0, 1 - ((record['late_arrivals'] or 0) / 10))  # Max 1 point
-            
-            performance_score = attendance_score + working_hours_score + overtime_score + punctuality_score
-            
-            performance_data.append({
-                'name': record['name'],
-                'company_name': record['company_name'],
-                'attendanceRate': round(attendance_rate, 1),
-                'avgWorkingHours': round(record['avg_working_hours'] or 0, 1),
-                'overtimeHours': round(record['overtime_hours'] or 0, 1),
-                'lateArrivals': record['late_arrivals'] or 0,
-                'performanceScore': round(performance_score, 1)
-            })
-        
-        return performance_data
-        
-    except Exception as e:
-        print(f"Error getting performance data: {e}")
-        return []
+            'values': overtime_data
+        },
+        'performance': performance_data
+    }
 
 def setup_db():
     """Initialize database and create tables if they don't exist"""
@@ -734,6 +1157,7 @@ def setup_db():
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         userid INTEGER NOT NULL,
         timestamp TEXT NOT NULL,
+        punch_date TEXT,
         check_in TEXT,
         check_out TEXT,
         working_hours REAL DEFAULT 0.0,
@@ -782,6 +1206,7 @@ def setup_db():
         remarks TEXT,
         marked_by TEXT DEFAULT 'system',
         created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        version INTEGER DEFAULT 1,
         FOREIGN KEY (userid) REFERENCES users (userid),
         UNIQUE(userid, date)
     )''')
@@ -807,17 +1232,98 @@ def setup_db():
         UNIQUE(userid, month, year)
     )''')
     
-    # Check if working_hours column exists in attendance table
-    c.execute("PRAGMA table_info(attendance)")
+    # Create device_sync_state table (per-device high-water mark for incremental pulls)
+    c.execute('''CREATE TABLE IF NOT EXISTS device_sync_state (
+        device_ip TEXT NOT NULL,
+        device_port INTEGER NOT NULL,
+        last_timestamp TEXT,
+        last_uid INTEGER DEFAULT 0,
+        last_sync TEXT,
+        PRIMARY KEY (device_ip, device_port)
+    )''')
+    
+    # Create devices table (terminals included in fleet syncs)
+    c.execute('''CREATE TABLE IF NOT EXISTS devices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        ip TEXT NOT NULL,
+        port INTEGER NOT NULL DEFAULT 4370,
+        timeout INTEGER DEFAULT 5,
+        retries INTEGER DEFAULT 2,
+        is_active INTEGER DEFAULT 1,
+        created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(ip, port)
+    )''')
+    
+    # Create device_punches table (raw punch log; attendance holds one paired row per user-day)
+    c.execute('''CREATE TABLE IF NOT EXISTS device_punches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        userid INTEGER NOT NULL,
+        timestamp TEXT NOT NULL,
+        punch_date TEXT NOT NULL,
+        device_ip TEXT,
+        device_port INTEGER,
+        uid INTEGER,
+        UNIQUE(userid, timestamp)
+    )''')
+    
+    # Create attendance_dirty table (user-days whose working hours need recalculating)
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'attendance_dirty'")
+    dirty_table_exists = c.fetchone() is not None
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance_dirty (
+        userid INTEGER NOT NULL,
+        punch_date TEXT NOT NULL,
+        PRIMARY KEY (userid, punch_date)
+    )''')
+    
+    # The rollup used to be keyed on company_id, which users added from a device leave
+    # NULL; it only holds derived data, so an old-layout table is dropped and rebuilt
+    c.execute("PRAGMA table_info(daily_rollup)")
+    if 'company_id' in [column[1] for column in c.fetchall()]:
+        c.execute('DROP TABLE daily_rollup')
+        logger.info("Dropped company_id-keyed daily rollup")
+    
+    # Create daily_rollup table (per-day attendance aggregates for analytics and the dashboard,
+    # keyed on the company name the analytics filter uses)
+    c.execute('''CREATE TABLE IF NOT EXISTS daily_rollup (
+        date TEXT NOT NULL,
+        company_name TEXT NOT NULL,
+        shift_type TEXT NOT NULL,
+        present_count INTEGER DEFAULT 0,
+        total_hours REAL DEFAULT 0,
+        hours_count INTEGER DEFAULT 0,
+        overtime_hours REAL DEFAULT 0,
+        late_count INTEGER DEFAULT 0,
+        PRIMARY KEY (date, company_name, shift_type)
+    )''')
+    
+    # Check if working_hours column exists in attendance table
+    c.execute("PRAGMA table_info(attendance)")
     columns = [column[1] for column in c.fetchall()]
     
     if 'working_hours' not in columns:
         c.execute('ALTER TABLE attendance ADD COLUMN working_hours REAL DEFAULT 0.0')
-        print("Added working_hours column to attendance table")
+        logger.info("Added working_hours column to attendance table")
     
     if 'status' not in columns:
         c.execute('ALTER TABLE attendance ADD COLUMN status TEXT DEFAULT "present"')
-        print("Added status column to attendance table")
+        logger.info("Added status column to attendance table")
+    
+    if 'punch_date' not in columns:
+        c.execute('ALTER TABLE attendance ADD COLUMN punch_date TEXT')
+        logger.info("Added punch_date column to attendance table")
+    
+    # Keep punch_date (the stored DATE(timestamp)) in step for writers that don't set it
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_attendance_punch_date_insert
+        AFTER INSERT ON attendance WHEN NEW.punch_date IS NULL
+        BEGIN
+            UPDATE attendance SET punch_date = DATE(NEW.timestamp) WHERE id = NEW.id;
+        END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_attendance_punch_date_update
+        AFTER UPDATE OF timestamp ON attendance
+        BEGIN
+            UPDATE attendance SET punch_date = DATE(NEW.timestamp) WHERE id = NEW.id;
+        END''')
     
     # Check if company_id column exists in users table
     c.execute("PRAGMA table_info(users)")
@@ -825,11 +1331,50 @@ def setup_db():
     
     if 'company_id' not in user_columns:
         c.execute('ALTER TABLE users ADD COLUMN company_id INTEGER')
-        print("Added company_id column to users table")
+        logger.info("Added company_id column to users table")
     
     if 'monthly_salary' not in user_columns:
         c.execute('ALTER TABLE users ADD COLUMN monthly_salary REAL DEFAULT 15000.0')
-        print("Added monthly_salary column to users table")
+        logger.info("Added monthly_salary column to users table")
+    
+    # Markings carry a row version so concurrent monthly saves can detect conflicting edits
+    c.execute("PRAGMA table_info(attendance_marking)")
+    marking_columns = [column[1] for column in c.fetchall()]
+    
+    if 'version' not in marking_columns:
+        c.execute('ALTER TABLE attendance_marking ADD COLUMN version INTEGER DEFAULT 1')
+        logger.info("Added version column to attendance_marking table")
+    
+    # Backfill punch_date for rows written before the column existed
+    c.execute('UPDATE attendance SET punch_date = DATE(timestamp) WHERE punch_date IS NULL')
+    
+    # Older databases kept one attendance row per punch: move the punches into
+    # device_punches and collapse attendance to the first row of each user-day
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'ux_attendance_userid_punch_date'")
+    if not c.fetchone():
+        c.execute('''INSERT OR IGNORE INTO device_punches (userid, timestamp, punch_date) 
+                     SELECT userid, timestamp, punch_date FROM attendance''')
+        c.execute('''DELETE FROM attendance WHERE id NOT IN (
+                        SELECT id FROM (
+                            SELECT id, ROW_NUMBER() OVER (PARTITION BY userid, punch_date ORDER BY timestamp, id) AS rn
+                            FROM attendance
+                        ) WHERE rn = 1
+                     )''')
+        if c.rowcount > 0:
+            logger.info("Collapsed %d per-punch attendance rows into daily records", c.rowcount)
+        # Superseded by the unique ux_attendance_userid_punch_date below
+        c.execute('DROP INDEX IF EXISTS idx_attendance_userid_punch_date')
+    
+    # Indexes for the date-range and per-user filters used throughout the app
+    # (plans checked in tests/test_query_plans.py)
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_userid_punch_date ON attendance (userid, punch_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_attendance_punch_date ON attendance (punch_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_device_punches_punch_date ON device_punches (punch_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_attendance_marking_date ON attendance_marking (date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_company_id ON users (company_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance (timestamp)')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_attendance_missing_hours ON attendance (id) 
+                 WHERE working_hours IS NULL OR working_hours = 0''')
     
     # Insert default companies
     c.execute('INSERT OR IGNORE INTO companies (name, description) VALUES (?, ?)', 
@@ -837,6 +1382,10 @@ def setup_db():
     c.execute('INSERT OR IGNORE INTO companies (name, description) VALUES (?, ?)', 
               ('Default Company', 'Default company for existing users'))
     
+    # Register the default device so fleet syncs include it
+    c.execute('INSERT OR IGNORE INTO devices (name, ip, port) VALUES (?, ?, ?)', 
+              ('Main Gate', DEFAULT_DEVICE_IP, DEFAULT_DEVICE_PORT))
+    
     # Update company_id for existing users
     c.execute('''UPDATE users SET company_id = (
         SELECT id FROM companies WHERE companies.name = users.company_name
@@ -877,7 +1426,7 @@ def setup_db():
             SELECT id FROM companies WHERE companies.name = 'Absolute Global Outsourcing'
         )''')
         
-        print("Added sample users to database")
+        logger.info("Added sample users to database")
     
     # Add sample attendance records if table is empty
     c.execute('SELECT COUNT(*) FROM attendance')
@@ -906,206 +1455,81 @@ def setup_db():
                         (userid, timestamp, check_in, check_out, working_hours) 
                         VALUES (?, ?, ?, ?, ?)''', record)
         
-        print("Added sample attendance records to database")
+        logger.info("Added sample attendance records to database")
+    
+    # Existing rows have never been through the recalculation rules, so the first recalc covers them
+    if not dirty_table_exists:
+        c.execute('''INSERT OR IGNORE INTO attendance_dirty (userid, punch_date) 
+                     SELECT userid, punch_date FROM attendance WHERE punch_date IS NOT NULL''')
+    
+    # Populate the rollup for databases created before it existed
+    c.execute('SELECT COUNT(*) FROM daily_rollup')
+    if c.fetchone()[0] == 0:
+        refresh_daily_rollup(c)
+        logger.info("Built daily attendance rollup")
     
     conn.commit()
     conn.close()
-    print("Database setup completed!")
+    logger.info("Database setup completed")
+    
+    # Background jobs that read the schema get their first run once it exists
+    scheduler.modify_job('device_health_monitor', next_run_time=datetime.now())
+    scheduler.modify_job('working_hours_backfill', next_run_time=datetime.now())
 
 def test_device_connection(ip, port=4370, timeout=5):
     """Test if a device is reachable at the given IP and port"""
     try:
-        print(f"Testing connection to {ip}:{port}...")
+        logger.debug("Testing connection to %s:%s", ip, port)
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(timeout)
         result = sock.connect_ex((ip, port))
         sock.close()
         
         if result == 0:
-            print(f"✓ Connection to {ip}:{port} successful")
+            logger.debug("Connection to %s:%s successful", ip, port)
             return True
         else:
-            print(f"✗ Connection to {ip}:{port} failed (error code: {result})")
+            logger.warning("Connection to %s:%s failed (error code: %s)", ip, port, result)
             return False
     except Exception as e:
-        print(f"✗ Connection test error: {e}")
+        logger.warning("Connection test error: %s", e)
         return False
 
-def pull_data_from_device(device_ip, device_port):
-    """Pull users and attendance data from device"""
+def fetch_device_data(device_ip, device_port, timeout=5, retries=0):
+    """Read users and attendance punches from a device, retrying failed attempts"""
     try:
-        # Test connection first
-        if not test_device_connection(device_ip, device_port):
-            return False, "Device connection failed"
-        
-        # Import ZK library
-        try:
-            from zk import ZK, const
-        except ImportError:
-            return False, "ZK library not available. Please install it with: pip install pyzk"
-        
-        # Connect to device
-        print(f"Attempting to connect to ZK device at {device_ip}:{device_port}...")
-        zk = ZK(device_ip, port=device_port, timeout=5)
-        
+        from zk import ZK, const
+    except ImportError:
+        raise RuntimeError("ZK library not available. Please install it with: pip install pyzk")
+    
+    last_error = None
+    for attempt in range(retries + 1):
+        zk = None
+        conn = None
         try:
+            # Test connection first
+            if not test_device_connection(device_ip, device_port, timeout=timeout):
+                raise ConnectionError(f"Device at {device_ip}:{device_port} is not reachable")
+            
+            logger.debug("Attempting to connect to ZK device at %s:%s", device_ip, device_port)
+            zk = ZK(device_ip, port=device_port, timeout=timeout)
             conn = zk.connect()
             if not conn:
-                return False, f"Failed to establish ZK connection to {device_ip}:{device_port}"
-            print(f"✓ ZK connection established successfully")
-        except Exception as e:
-            return False, f"ZK connection error: {str(e)}"
-        
-        try:
-            # Get users
-            users = conn.get_users()
-            print(f"Found {len(users)} users on device")
+                raise ConnectionError(f"Failed to establish ZK connection to {device_ip}:{device_port}")
             
-            # Get attendance records
+            users = conn.get_users()
             attendance_records = conn.get_attendance()
-            print(f"Found {len(attendance_records)} attendance records on device")
-            
-            # Process users
-            db_conn = get_db_connection()
-            cursor = db_conn.cursor()
-            
-            # Clear existing attendance only (preserve user data)
-            cursor.execute('DELETE FROM attendance')
-            
-            # Insert or update users (preserve existing custom data)
-            for user in users:
-                # Check if user already exists
-                existing_user = cursor.execute('SELECT * FROM users WHERE userid = ?', (user.user_id,)).fetchone()
-                
-                if existing_user:
-                    # User exists - only update name if it changed, preserve all other custom data
-                    if existing_user['name'] != user.name:
-                        cursor.execute('UPDATE users SET name = ? WHERE userid = ?', (user.name, user.user_id))
-                        print(f"Updated name for user {user.user_id}: {user.name}")
-                else:
-                    # New user - insert with default values
-                    cursor.execute('''INSERT INTO users 
-                        (userid, name, company_name, shift_start_time, shift_end_time, shift_type, working_hours_per_day, monthly_salary, created_date) 
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                        (user.user_id, user.name, 'Absolute Global Outsourcing', '09:00', '18:00', 'day', 8.0, 15000.0, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-                    print(f"Added new user: {user.name} (ID: {user.user_id})")
-            
-            # Process attendance records for night shift employees
-            # For night shifts: early morning times are check-out, evening times are check-in
-            night_shift_employees = set()  # Track which employees are night shifts
-            
-            for record in attendance_records:
-                user_id = record.user_id
-                timestamp = record.timestamp
-                
-                # Check if this user is a night shift employee
-                user_conn = get_db_connection()
-                user_info = user_conn.execute('SELECT shift_type FROM users WHERE userid = ?', (user_id,)).fetchone()
-                user_conn.close()
-                
-                is_night_shift = user_info and user_info['shift_type'] == 'night' if user_info else False
-                
-                if is_night_shift:
-                    night_shift_employees.add(user_id)
-                
-                # Insert raw attendance record
-                cursor.execute('''INSERT INTO attendance 
-                    (userid, timestamp, check_in, check_out, working_hours) 
-                    VALUES (?, ?, ?, ?, ?)''', 
-                    (user_id, timestamp.strftime('%Y-%m-%d %H:%M:%S'), 
-                     timestamp.strftime('%Y-%m-%d %H:%M:%S'), None, 0.0))
-            
-            # Now process the attendance records to properly assign check-in/check-out
-            # Group records by user and date, but handle multiple punches intelligently
-            cursor.execute('''SELECT userid, DATE(timestamp) as date, timestamp
-                             FROM attendance 
-                             ORDER BY userid, DATE(timestamp), timestamp''')
-            
-            all_records = cursor.fetchall()
-            
-            # Group records by user and date
-            user_date_punches = {}
-            for record in all_records:
-                user_id = record['userid']
-                date = record['date']
-                timestamp = record['timestamp']
-                
-                if user_id not in user_date_punches:
-                    user_date_punches[user_id] = {}
-                if date not in user_date_punches[user_id]:
-                    user_date_punches[user_id][date] = []
-                
-                user_date_punches[user_id][date].append({'timestamp': timestamp})
-            
-            # Process each user's daily punches
-            for user_id, dates in user_date_punches.items():
-                for date, punches in dates.items():
-                    # Use intelligent punch processing
-                    check_in_time, check_out_time = process_multiple_punches(user_id, date, punches)
-                    
-                    if check_in_time and check_out_time:
-                        # Update the attendance records with proper check-in/check-out times
-                        cursor.execute('''UPDATE attendance 
-                                         SET check_in = ?, check_out = ? 
-                                         WHERE userid = ? AND DATE(timestamp) = ?''', 
-                                      (check_in_time, check_out_time, user_id, date))
-                        
-                        # Calculate working hours
-                        try:
-                            check_in_dt = datetime.strptime(check_in_time, '%Y-%m-%d %H:%M:%S')
-                            check_out_dt = datetime.strptime(check_out_time, '%Y-%m-%d %H:%M:%S')
-                            
-                            # Get user's shift information
-                            user_conn = get_db_connection()
-                            user_info = user_conn.execute('SELECT shift_type FROM users WHERE userid = ?', (user_id,)).fetchone()
-                            user_conn.close()
-                            
-                            is_night_shift = user_info and user_info['shift_type'] == 'night' if user_info else False
-                            
-                            # For night shifts, if check-out is earlier than check-in, add 24 hours
-                            if is_night_shift and check_out_dt < check_in_dt:
-                                check_out_dt += timedelta(days=1)
-                            
-                            # Calculate working hours
-                            time_diff = check_out_dt - check_in_dt
-                            working_hours = time_diff.total_seconds() / 3600.0
-                            
-                            # Cap working hours at 10 for night shifts
-                            if is_night_shift and working_hours > 10.0:
-                                working_hours = 10.0
-                            
-                            # Update working hours
-                            cursor.execute('''UPDATE attendance 
-                                             SET working_hours = ? 
-                                             WHERE userid = ? AND DATE(timestamp) = ?''', 
-                                          (working_hours, user_id, date))
-                            
-                            print(f"Calculated working hours for user {user_id}: {working_hours:.2f} hours")
-                            
-                        except Exception as e:
-                            print(f"Error calculating working hours for user {user_id}: {e}")
-            
-            db_conn.commit()
-            db_conn.close()
-            
-            # Properly disconnect from device
-            if conn and hasattr(conn, 'disconnect'):
-                try:
-                    conn.disconnect()
-                except:
-                    pass
-            
-            if zk and hasattr(zk, 'disconnect'):
-                try:
-                    zk.disconnect()
-                except:
-                    pass
-            
-            print("✓ Successfully pulled data from device")
-            return True, f"Successfully pulled {len(users)} users and {len(attendance_records)} attendance records"
+            logger.info("Found %d users and %d attendance records on %s:%s", len(users), len(attendance_records), 
+                        device_ip, device_port)
+            return users, attendance_records
             
         except Exception as e:
-            # Properly disconnect from device on error
+            last_error = e
+            if attempt < retries:
+                logger.warning("Retrying %s:%s (attempt %d of %d): %s", device_ip, device_port, attempt + 2, retries + 1, e)
+                time.sleep(min(2 ** attempt, 5))
+        finally:
+            # Properly disconnect from device
             if conn and hasattr(conn, 'disconnect'):
                 try:
                     conn.disconnect()
@@ -1117,12 +1541,240 @@ def pull_data_from_device(device_ip, device_port):
                     zk.disconnect()
                 except:
                     pass
-            
-            return False, f"Error processing device data: {str(e)}"
-            
+    
+    raise last_error
+
+def store_device_users(cursor, users):
+    """Insert new device users and update changed names (preserve existing custom data)"""
+    existing_names = {str(row['userid']): row['name'] 
+                      for row in cursor.execute('SELECT userid, name FROM users').fetchall()}
+    added_users = []
+    
+    for user in users:
+        user_id = str(user.user_id)
+        
+        if user_id in existing_names:
+            # User exists - only update name if it changed, preserve all other custom data
+            if existing_names[user_id] != user.name:
+                cursor.execute('UPDATE users SET name = ? WHERE userid = ?', (user.name, user.user_id))
+                row_logger.debug("Updated name for user %s: %s", user.user_id, user.name)
+        else:
+            # New user - insert with default values
+            cursor.execute('''INSERT INTO users 
+                (userid, name, company_name, shift_start_time, shift_end_time, shift_type, working_hours_per_day, monthly_salary, created_date) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
+                (user.user_id, user.name, 'Absolute Global Outsourcing', '09:00', '18:00', 'day', 8.0, 15000.0, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            row_logger.debug("Added new user: %s (ID: %s)", user.name, user.user_id)
+            added_users.append(user.user_id)
+        
+        # The same user is enrolled on every terminal, so later devices see it as existing
+        existing_names[user_id] = user.name
+    
+    # Punches stored before the user existed now join a rollup group
+    if added_users:
+        refresh_user_rollup(cursor, added_users)
+
+def store_device_punches(cursor, device_ip, device_port, attendance_records, shift_map, full_sync=False):
+    """Import the punches from the device's watermark on; returns the records newly stored"""
+    # Load this device's high-water mark (timestamp of the last imported punch)
+    sync_state = cursor.execute('''SELECT last_timestamp FROM device_sync_state 
+                                   WHERE device_ip = ? AND device_port = ?''', 
+                                (device_ip, device_port)).fetchone()
+    watermark = sync_state['last_timestamp'] if sync_state else None
+    
+    if full_sync:
+        # Replace this device's punch log; the caller rebuilds the daily records once
+        # all devices are loaded (rebuild_attendance)
+        cursor.execute('DELETE FROM device_punches WHERE device_ip = ? AND device_port = ?', 
+                      (device_ip, device_port))
+        new_records = insert_device_punches(cursor, device_ip, device_port, attendance_records)
+    else:
+        # Punches in the watermark's own second are offered again (device uids are user
+        # slots, not a sequence); UNIQUE(userid, timestamp) drops the ones already stored.
+        # A device without a watermark offers everything the same way.
+        candidates = [record for record in attendance_records
+                      if not watermark or record.timestamp.strftime('%Y-%m-%d %H:%M:%S') >= watermark]
+        new_records = ingest_device_punches(cursor, device_ip, device_port, candidates, shift_map)
+    logger.info("Imported %d new attendance records from %s:%s (%s sync)", 
+                len(new_records), device_ip, device_port, 'full' if full_sync else 'incremental')
+    
+    # Advance the watermark to the newest punch held by the device
+    if attendance_records:
+        latest = max(record.timestamp for record in attendance_records).strftime('%Y-%m-%d %H:%M:%S')
+        if full_sync or not watermark or latest > watermark:
+            cursor.execute('''INSERT OR REPLACE INTO device_sync_state 
+                             (device_ip, device_port, last_timestamp, last_sync) 
+                             VALUES (?, ?, ?, ?)''', 
+                          (device_ip, device_port, latest, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    
+    return new_records
+
+def pull_data_from_device(device_ip, device_port, full_sync=False, timeout=5, retries=0):
+    """Pull users and attendance data from device (incremental unless full_sync=True)"""
+    try:
+        device_port = int(device_port)
+        users, attendance_records = fetch_device_data(device_ip, device_port, timeout=timeout, retries=retries)
     except Exception as e:
-        print(f"Error connecting to device: {e}")
+        logger.error("Error connecting to device: %s", e)
         return False, f"Error connecting to device: {str(e)}"
+    
+    def store(cursor):
+        store_device_users(cursor, users)
+        
+        # Shift types for every user, loaded once and shared by the pairing stage
+        shift_map = load_user_shift_map(cursor)
+        new_records = store_device_punches(cursor, device_ip, device_port, attendance_records, 
+                                           shift_map, full_sync=full_sync)
+        if full_sync:
+            rebuild_attendance(cursor, shift_map)
+        return new_records
+    
+    try:
+        new_records = db_writer.execute_long(store)
+        bump_data_version()
+    except Exception as e:
+        return False, f"Error processing device data: {str(e)}"
+    
+    logger.info("Successfully pulled data from %s:%s", device_ip, device_port)
+    return True, (f"Successfully pulled {len(users)} users and {len(new_records)} new attendance records "
+                  f"({len(attendance_records)} on device, {'full' if full_sync else 'incremental'} sync)")
+
+def get_active_devices():
+    """Return the registered devices that take part in fleet syncs"""
+    conn = get_db_connection()
+    devices = conn.execute('SELECT * FROM devices WHERE is_active = 1 ORDER BY id').fetchall()
+    conn.close()
+    return [dict(device) for device in devices]
+
+def sync_device_fleet(full_sync=False):
+    """Pull every active device concurrently, then import all of them in one transaction"""
+    devices = get_active_devices()
+    if not devices:
+        return False, "No active devices registered", []
+    
+    # pyzk blocks on socket I/O, so device reads run in a bounded thread pool
+    fetched = []
+    results = []
+    with ThreadPoolExecutor(max_workers=min(FLEET_SYNC_WORKERS, len(devices))) as executor:
+        futures = {executor.submit(fetch_device_data, device['ip'], device['port'], 
+                                   device['timeout'], device['retries']): device 
+                   for device in devices}
+        for future in as_completed(futures):
+            device = futures[future]
+            try:
+                users, attendance_records = future.result()
+                fetched.append((device, users, attendance_records))
+            except Exception as e:
+                results.append({'device_id': device['id'], 'name': device['name'], 
+                                'device': f"{device['ip']}:{device['port']}", 
+                                'success': False, 'message': str(e)})
+    
+    def store(cursor):
+        for device, users, _ in fetched:
+            store_device_users(cursor, users)
+        
+        shift_map = load_user_shift_map(cursor)
+        stored = []
+        for device, users, attendance_records in fetched:
+            new_records = store_device_punches(cursor, device['ip'], device['port'], 
+                                               attendance_records, shift_map, full_sync=full_sync)
+            stored.append({'device_id': device['id'], 'name': device['name'], 
+                           'device': f"{device['ip']}:{device['port']}", 
+                           'success': True, 'users': len(users), 
+                           'new_records': len(new_records), 
+                           'full_sync': full_sync,
+                           'message': f"{len(new_records)} new attendance records"})
+        
+        # Every device's punch log is reloaded first, so the table is rebuilt once per pass
+        if full_sync:
+            rebuild_attendance(cursor, shift_map)
+        return stored
+    
+    if fetched:
+        fetched.sort(key=lambda item: item[0]['id'])
+        try:
+            results.extend(db_writer.execute_long(store))
+            bump_data_version()
+        except Exception as e:
+            return False, f"Error processing device data: {str(e)}", results
+    
+    synced = [result for result in results if result['success']]
+    message = (f"Synced {len(synced)} of {len(devices)} devices, "
+               f"{sum(result['new_records'] for result in synced)} new attendance records")
+    failed = [result['device'] for result in results if not result['success']]
+    if failed:
+        message += f" (failed: {', '.join(failed)})"
+    return bool(synced), message, results
+
+# Latest health probe result per device, keyed by "ip:port"
+device_health = {}
+device_health_lock = threading.Lock()
+
+def probe_device_health(device):
+    """Open a TCP connection to a device and measure how long it takes"""
+    started = time.monotonic()
+    try:
+        with socket.create_connection((device['ip'], int(device['port'])), timeout=DEVICE_HEALTH_TIMEOUT):
+            pass
+        return True, round((time.monotonic() - started) * 1000, 1), None
+    except OSError as e:
+        return False, None, str(e)
+
+def refresh_device_health():
+    """Probe every active device concurrently and update the cached status"""
+    try:
+        devices = get_active_devices()
+    except Exception as e:
+        logger.warning("Device health check skipped: %s", e)
+        return
+    
+    if not devices:
+        return
+    
+    with ThreadPoolExecutor(max_workers=min(FLEET_SYNC_WORKERS, len(devices))) as executor:
+        results = list(executor.map(probe_device_health, devices))
+    
+    checked_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with device_health_lock:
+        active_keys = set()
+        for device, (online, latency_ms, error) in zip(devices, results):
+            key = f"{device['ip']}:{device['port']}"
+            active_keys.add(key)
+            previous = device_health.get(key, {})
+            device_health[key] = {
+                'device_id': device['id'],
+                'name': device['name'],
+                'ip': device['ip'],
+                'port': device['port'],
+                'online': online,
+                'latency_ms': latency_ms,
+                'error': error,
+                'last_checked': checked_at,
+                'last_seen': checked_at if online else previous.get('last_seen')
+            }
+        
+        # Forget devices that were removed or deactivated
+        for key in set(device_health) - active_keys:
+            del device_health[key]
+
+def get_device_health(device_ip=None, device_port=None):
+    """Return the cached health of one device, or of all devices when no address is given"""
+    with device_health_lock:
+        if device_ip is None:
+            return [dict(status) for status in device_health.values()]
+        status = device_health.get(f"{device_ip}:{device_port}")
+        return dict(status) if status else None
+
+# Probe devices in the background so pages never wait on an unreachable terminal
+scheduler.add_job(
+    func=refresh_device_health,
+    trigger=IntervalTrigger(seconds=DEVICE_HEALTH_INTERVAL),
+    id='device_health_monitor',
+    name='Probe device health',
+    max_instances=1,
+    coalesce=True,
+    replace_existing=True
+)
 
 def sync_users_from_device(device_ip, device_port):
     """Sync only user data from device (preserve existing custom data)"""
@@ -1147,37 +1799,42 @@ def sync_users_from_device(device_ip, device_port):
         try:
             # Get users from device
             users = conn.get_users()
-            print(f"Found {len(users)} users on device")
+            logger.info("Found %d users on %s:%s", len(users), device_ip, device_port)
             
             # Process users
-            db_conn = get_db_connection()
-            cursor = db_conn.cursor()
-            
-            users_added = 0
-            users_updated = 0
-            
-            # Insert or update users (preserve existing custom data)
-            for user in users:
-                # Check if user already exists
-                existing_user = cursor.execute('SELECT * FROM users WHERE userid = ?', (user.user_id,)).fetchone()
+            def store(cursor):
+                users_added = 0
+                users_updated = 0
+                added_users = []
                 
-                if existing_user:
-                    # User exists - only update name if it changed, preserve all other custom data
-                    if existing_user['name'] != user.name:
-                        cursor.execute('UPDATE users SET name = ? WHERE userid = ?', (user.name, user.user_id))
-                        print(f"Updated name for user {user.user_id}: {user.name}")
-                        users_updated += 1
-                else:
-                    # New user - insert with default values
-                    cursor.execute('''INSERT INTO users 
-                        (userid, name, company_name, shift_start_time, shift_end_time, shift_type, working_hours_per_day, monthly_salary, created_date) 
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                        (user.user_id, user.name, 'Absolute Global Outsourcing', '09:00', '18:00', 'day', 8.0, 15000.0, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-                    print(f"Added new user: {user.name} (ID: {user.user_id})")
-                    users_added += 1
+                # Insert or update users (preserve existing custom data)
+                for user in users:
+                    # Check if user already exists
+                    existing_user = cursor.execute('SELECT * FROM users WHERE userid = ?', (user.user_id,)).fetchone()
+                    
+                    if existing_user:
+                        # User exists - only update name if it changed, preserve all other custom data
+                        if existing_user['name'] != user.name:
+                            cursor.execute('UPDATE users SET name = ? WHERE userid = ?', (user.name, user.user_id))
+                            row_logger.debug("Updated name for user %s: %s", user.user_id, user.name)
+                            users_updated += 1
+                    else:
+                        # New user - insert with default values
+                        cursor.execute('''INSERT INTO users 
+                            (userid, name, company_name, shift_start_time, shift_end_time, shift_type, working_hours_per_day, monthly_salary, created_date) 
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
+                            (user.user_id, user.name, 'Absolute Global Outsourcing', '09:00', '18:00', 'day', 8.0, 15000.0, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                        row_logger.debug("Added new user: %s (ID: %s)", user.name, user.user_id)
+                        users_added += 1
+                        added_users.append(user.user_id)
+                
+                # Punches stored before these users existed now join a rollup group
+                if added_users:
+                    refresh_user_rollup(cursor, added_users)
+                return users_added, users_updated
             
-            db_conn.commit()
-            db_conn.close()
+            users_added, users_updated = db_writer.execute_long(store)
+            bump_data_version()
             
             # Properly disconnect from device
             if conn and hasattr(conn, 'disconnect'):
@@ -1213,20 +1870,6 @@ def sync_users_from_device(device_ip, device_port):
     except Exception as e:
         return False, f"Error connecting to device: {str(e)}"
 
-def pull_latest_data_from_device():
-    """Pull latest data from the default device"""
-    try:
-        # Test connection first
-        if not test_device_connection(DEFAULT_DEVICE_IP, DEFAULT_DEVICE_PORT):
-            return False, f"Device at {DEFAULT_DEVICE_IP}:{DEFAULT_DEVICE_PORT} is not reachable"
-        
-        # Pull data
-        success, message = pull_data_from_device(DEFAULT_DEVICE_IP, DEFAULT_DEVICE_PORT)
-        return success, message
-        
-    except Exception as e:
-        return False, f"Error pulling latest data: {str(e)}"
-
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     """Admin login page"""
@@ -1272,8 +1915,8 @@ def dashboard():
     
     # Get today's attendance
     today = datetime.now().strftime('%Y-%m-%d')
-    today_attendance = conn.execute('''SELECT COUNT(*) FROM attendance 
-                                     WHERE DATE(timestamp) = ?''', (today,)).fetchone()[0]
+    today_attendance = conn.execute('''SELECT IFNULL(SUM(present_count), 0) FROM daily_rollup 
+                                     WHERE date = ?''', (today,)).fetchone()[0]
     
     # Get recent attendance records
     recent_records = conn.execute('''SELECT u.name, a.timestamp, a.check_in 
@@ -1281,8 +1924,9 @@ def dashboard():
                                    JOIN users u ON a.userid = u.userid 
                                    ORDER BY a.timestamp DESC LIMIT 10''').fetchall()
     
-    # Check device status
-    device_status = test_device_connection(DEFAULT_DEVICE_IP, DEFAULT_DEVICE_PORT)
+    # Device status comes from the background health monitor's cache
+    device_health_status = get_device_health(DEFAULT_DEVICE_IP, DEFAULT_DEVICE_PORT)
+    device_status = bool(device_health_status and device_health_status['online'])
     
     conn.close()
     
@@ -1292,6 +1936,7 @@ def dashboard():
                          today_attendance=today_attendance,
                          recent_records=recent_records,
                          device_status=device_status,
+                         device_health=device_health_status,
                          device_ip=DEFAULT_DEVICE_IP,
                          device_port=DEFAULT_DEVICE_PORT,
                          company_name=COMPANY_NAME,
@@ -1321,6 +1966,64 @@ def users():
                          developer_name=DEVELOPER_NAME, 
                          admin_username=session.get('admin_username'))
 
+def fetch_attendance_page(conn, from_date, to_date, user_id='', company_id='', 
+                          after_timestamp=None, after_id=None, limit=ATTENDANCE_PAGE_SIZE):
+    """Return (records, next_cursor) for one page of attendance, newest first, keyed on (timestamp, id)"""
+    query = '''SELECT a.id, u.name, u.userid, a.timestamp, a.check_in, a.check_out, 
+                      a.working_hours, c.name as company_name
+               FROM attendance a 
+               JOIN users u ON a.userid = u.userid 
+               LEFT JOIN companies c ON u.company_id = c.id
+               WHERE a.punch_date >= ? AND a.punch_date <= ?'''
+    params = [from_date, to_date]
+    
+    if user_id:
+        query += ' AND u.userid = ?'
+        params.append(user_id)
+    elif company_id:
+        query += ' AND u.company_id = ?'
+        params.append(company_id)
+    
+    # Keyset pagination: continue strictly after the last (timestamp, id) already shown
+    if after_timestamp is not None and after_id is not None:
+        query += ' AND (a.timestamp < ? OR (a.timestamp = ? AND a.id < ?))'
+        params.extend([after_timestamp, after_timestamp, after_id])
+    
+    query += ' ORDER BY a.timestamp DESC, a.id DESC LIMIT ?'
+    params.append(limit + 1)
+    
+    rows = conn.execute(query, params).fetchall()
+    
+    records = []
+    for row in rows[:limit]:
+        record = dict(row)
+        record['working_hours'] = record['working_hours'] or 0.0
+        record['check_in_time'] = str(record['check_in']).split(' ')[-1] if record['check_in'] else None
+        record['check_out_time'] = str(record['check_out']).split(' ')[-1] if record['check_out'] else None
+        records.append(record)
+    
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = {'timestamp': records[-1]['timestamp'], 'id': records[-1]['id']}
+    
+    return records, next_cursor
+
+def count_attendance_records(conn, from_date, to_date, user_id='', company_id=''):
+    """Count the attendance rows matching the attendance view filters"""
+    query = '''SELECT COUNT(*) FROM attendance a 
+               JOIN users u ON a.userid = u.userid 
+               WHERE a.punch_date >= ? AND a.punch_date <= ?'''
+    params = [from_date, to_date]
+    
+    if user_id:
+        query += ' AND u.userid = ?'
+        params.append(user_id)
+    elif company_id:
+        query += ' AND u.company_id = ?'
+        params.append(company_id)
+    
+    return conn.execute(query, params).fetchone()[0]
+
 @app.route('/attendance')
 @login_required
 def attendance():
@@ -1342,191 +2045,9 @@ def attendance():
     if not to_date:
         to_date = datetime.now().strftime('%Y-%m-%d')
     
-    # Get attendance records based on filters
-    if user_id:
-        records = conn.execute('''SELECT u.name, u.userid, a.timestamp, a.check_in, a.check_out, 
-                                   a.working_hours, c.name as company_name
-                                   FROM attendance a 
-                                   JOIN users u ON a.userid = u.userid 
-                                   LEFT JOIN companies c ON u.company_id = c.id
-                                   WHERE DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ? AND u.userid = ?
-                                   ORDER BY a.timestamp DESC''', (from_date, to_date, user_id)).fetchall()
-    elif company_id:
-        records = conn.execute('''SELECT u.name, u.userid, a.timestamp, a.check_in, a.check_out, 
-                                   a.working_hours, c.name as company_name
-                                   FROM attendance a 
-                                   JOIN users u ON a.userid = u.userid 
-                                   LEFT JOIN companies c ON u.company_id = c.id
-                                   WHERE DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ? AND u.company_id = ?
-                                   ORDER BY a.timestamp DESC''', (from_date, to_date, company_id)).fetchall()
-    else:
-        records = conn.execute('''SELECT u.name, u.userid, a.timestamp, a.check_in, a.check_out, 
-                                   a.working_hours, c.name as company_name
-                                   FROM attendance a 
-                                   JOIN users u ON a.userid = u.userid 
-                                   LEFT JOIN companies c ON u.company_id = c.id
-                                   WHERE DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ?
-                                   ORDER BY a.timestamp DESC''', (from_date, to_date)).fetchall()
-    
-    # Process records to add working hours and format data
-    processed_records = []
-    for record in records:
-        record_dict = dict(record)
-        
-        # Use working hours from database if available, otherwise calculate
-        if record_dict.get('working_hours') is not None and record_dict['working_hours'] > 0:
-            # Use the stored working hours from database
-            working_hours = record_dict['working_hours']
-        else:
-            # Calculate working hours if not available in database
-            working_hours = 0.0
-            
-            if record_dict['check_in'] and record_dict['check_out']:
-                try:
-                    # Parse check-in and check-out times
-                    check_in_str = str(record_dict['check_in'])
-                    check_out_str = str(record_dict['check_out'])
-                    
-                    # Extract time part if it's a full datetime
-                    if ' ' in check_in_str:
-                        check_in_time = check_in_str.split(' ')[1]
-                    else:
-                        check_in_time = check_in_str
-                        
-                    if ' ' in check_out_str:
-                        check_out_time = check_out_str.split(' ')[1]
-                    else:
-                        check_out_time = check_out_str
-                    
-                    # Check if check-in and check-out are the same time
-                    if check_in_time == check_out_time:
-                        # Same time means 0 working hours (single punch or incomplete record)
-                        working_hours = 0.0
-                    else:
-                        # Parse times
-                        check_in_parts = check_in_time.split(':')
-                        check_out_parts = check_out_time.split(':')
-                        
-                        if len(check_in_parts) >= 2 and len(check_out_parts) >= 2:
-                            try:
-                                # Get user's shift information first
-                                user_conn = get_db_connection()
-                                user_shift = user_conn.execute('''SELECT shift_type, shift_start_time, shift_end_time 
-                                                               FROM users WHERE userid = ?''', 
-                                                            (record_dict['userid'],)).fetchone()
-                                user_conn.close()
-                                
-                                # Parse time components
-                                check_in_hour = int(check_in_parts[0])
-                                check_in_minute = int(check_in_parts[1])
-                                check_in_second = int(check_in_parts[2]) if len(check_in_parts) > 2 else 0
-                                
-                                check_out_hour = int(check_out_parts[0])
-                                check_out_minute = int(check_out_parts[1])
-                                check_out_second = int(check_out_parts[2]) if len(check_out_parts) > 2 else 0
-                                
-                                # For night shifts, the biometric device ALWAYS flips check-in and check-out
-                                # So we need to ALWAYS swap them, not just when we detect a reversal
-                                if user_shift and user_shift['shift_type'] == 'night':
-                                    # For night shifts, ALWAYS swap the times:
-                                    # What device shows as "check-in" (evening) is actually check-out
-                                    # What device shows as "check-out" (morning) is actually check-in
-                                    
-                                    # Swap the times
-                                    temp_hour = check_in_hour
-                                    temp_minute = check_in_minute
-                                    temp_second = check_in_second
-                                    
-                                    check_in_hour = check_out_hour
-                                    check_in_minute = check_out_minute
-                                    check_in_second = check_out_second
-                                    
-                                    check_out_hour = temp_hour
-                                    check_out_minute = temp_minute
-                                    check_out_second = temp_second
-                                    
-                                    print(f"Swapped times for night shift user {record_dict['userid']}: "
-                                          f"Device check-in ({temp_hour:02d}:{temp_minute:02d}:{temp_second:02d}) → Real check-out, "
-                                          f"Device check-out ({check_in_hour:02d}:{check_in_minute:02d}:{check_in_second:02d}) → Real check-in")
-                                    
-                                    # Now create proper datetime objects with correct dates
-                                    # Check-in is on current day (morning, but actually evening after swap)
-                                    check_in_date = datetime.now().date()
-                                    # Check-out is on next day (evening, but actually morning after swap)
-                                    check_out_date = check_in_date + timedelta(days=1)
-                                    
-                                    check_in_dt = datetime.combine(check_in_date, datetime.min.time().replace(
-                                        hour=check_in_hour, minute=check_in_minute, second=check_in_second
-                                    ))
-                                    
-                                    check_out_dt = datetime.combine(check_out_date, datetime.min.time().replace(
-                                        hour=check_out_hour, minute=check_out_minute, second=check_out_second
-                                    ))
-                                    
-                                    # For night shift, if check-out is earlier than check-in, add 1 day
-                                    if check_out_dt < check_in_dt:
-                                        check_out_dt += timedelta(days=1)
-                                    
-                                else:
-                                    # For day shifts, use standard logic
-                                    today = datetime.now().date()
-                                    
-                                    check_in_dt = datetime.combine(today, datetime.min.time().replace(
-                                        hour=check_in_hour, minute=check_in_minute, second=check_in_second
-                                    ))
-                                    
-                                    check_out_dt = datetime.combine(today, datetime.min.time().replace(
-                                        hour=check_out_hour, minute=check_out_minute, second=check_out_second
-                                    ))
-                                    
-                                    # For day shift, if check-out is earlier than check-in, it's likely next day
-                                    if check_out_dt < check_in_dt:
-                                        check_out_dt += timedelta(days=1)
-                                
-                                # Calculate the difference
-                                time_diff = check_out_dt - check_in_dt
-                                working_hours = time_diff.total_seconds() / 3600.0
-                                
-                                # Cap working hours at 10 for night shifts
-                                if user_shift and user_shift['shift_type'] == 'night' and working_hours > 10.0:
-                                    working_hours = 10.0
-                                
-                                # Format working hours to 2 decimal places
-                                working_hours = round(working_hours, 2)
-                                
-                                # Store formatted time strings for display
-                                record_dict['check_in_formatted'] = f"{check_in_hour:02d}:{check_in_minute:02d}:{check_in_second:02d}"
-                                record_dict['check_out_formatted'] = f"{check_out_hour:02d}:{check_out_minute:02d}:{check_out_second:02d}"
-                                
-                            except Exception as e:
-                                print(f"Error calculating working hours for user {record_dict['userid']}: {e}")
-                                working_hours = 0.0
-                                
-                except Exception as e:
-                    print(f"Error processing check-in/check-out times for user {record_dict['userid']}: {e}")
-                    working_hours = 0.0
-        
-        # Add working hours to record
-        record_dict['working_hours'] = working_hours
-        
-        # Format the record for display
-        if record_dict['check_in']:
-            if ' ' in str(record_dict['check_in']):
-                record_dict['check_in_time'] = str(record_dict['check_in']).split(' ')[1]
-            else:
-                record_dict['check_in_time'] = str(record_dict['check_in'])
-        else:
-            record_dict['check_in_time'] = None
-            
-        if record_dict['check_out']:
-            if ' ' in str(record_dict['check_out']):
-                record_dict['check_out_time'] = str(record_dict['check_out']).split(' ')[1]
-            else:
-                record_dict['check_out_time'] = str(record_dict['check_out'])
-        else:
-            record_dict['check_out_time'] = None
-        
-        processed_records.append(record_dict)
+    # First page only; stored working hours are authoritative (the backfill job fills gaps)
+    records, next_cursor = fetch_attendance_page(conn, from_date, to_date, user_id, company_id)
+    total_records = count_attendance_records(conn, from_date, to_date, user_id, company_id)
     
     # Get all users for filter dropdown
     users = conn.execute('SELECT * FROM users ORDER BY name').fetchall()
@@ -1540,7 +2061,9 @@ def attendance():
     conn.close()
     
     return render_template('attendance.html', 
-                         records=processed_records, 
+                         records=records, 
+                         total_records=total_records,
+                         next_cursor=next_cursor,
                          users=users, 
                          companies=companies,
                          selected_user=user_id, 
@@ -1554,11 +2077,41 @@ def attendance():
                          developer_name=DEVELOPER_NAME,
                          admin_username=session.get('admin_username'))
 
+@app.route('/api/attendance_records')
+@login_required
+def api_attendance_records():
+    """Get one page of attendance records for the attendance view"""
+    try:
+        # Get filter parameters
+        user_id = request.args.get('user_id', '')
+        from_date = request.args.get('from_date', '')
+        to_date = request.args.get('to_date', '')
+        company_id = request.args.get('company_id', '')
+        after_timestamp = request.args.get('after_timestamp')
+        after_id = request.args.get('after_id', type=int)
+        limit = max(1, min(request.args.get('limit', ATTENDANCE_PAGE_SIZE, type=int), 1000))
+        
+        # Set default date range if not provided (last 30 days)
+        if not from_date:
+            from_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+        if not to_date:
+            to_date = datetime.now().strftime('%Y-%m-%d')
+        
+        conn = get_db_connection()
+        records, next_cursor = fetch_attendance_page(conn, from_date, to_date, user_id, company_id, 
+                                                     after_timestamp, after_id, limit)
+        conn.close()
+        
+        return jsonify({'success': True, 'records': records, 'next_cursor': next_cursor})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
 @app.route('/device')
 @login_required
 def device():
     """Device management page"""
-    return render_template('device.html', company_name=COMPANY_NAME, developer_name=DEVELOPER_NAME, admin_username=session.get('admin_username'))
+    return render_template('device.html', health_interval=DEVICE_HEALTH_INTERVAL, company_name=COMPANY_NAME, developer_name=DEVELOPER_NAME, admin_username=session.get('admin_username'))
 
 @app.route('/companies')
 @login_required
@@ -1588,8 +2141,9 @@ def api_pull_data():
         data = request.get_json()
         device_ip = data.get('device_ip', DEFAULT_DEVICE_IP)
         device_port = data.get('device_port', DEFAULT_DEVICE_PORT)
+        full_sync = bool(data.get('full_sync', False))
         
-        success, message = pull_data_from_device(device_ip, device_port)
+        success, message = pull_data_from_device(device_ip, device_port, full_sync=full_sync)
         
         if success:
             return jsonify({'success': True, 'message': message})
@@ -1601,9 +2155,72 @@ def api_pull_data():
 
 @app.route('/api/pull_latest_data', methods=['POST'])
 def pull_latest_data():
-    """API endpoint to pull latest data from default device"""
-    success, message = pull_latest_data_from_device()
-    return jsonify({'success': success, 'message': message})
+    """API endpoint to pull latest data from all active devices"""
+    try:
+        data = request.get_json(silent=True) or {}
+        success, message, results = sync_device_fleet(full_sync=bool(data.get('full_sync', False)))
+        return jsonify({'success': success, 'message': message, 'devices': results})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error pulling latest data: {str(e)}'})
+
+@app.route('/api/devices', methods=['GET'])
+def get_devices():
+    """API endpoint to get all registered devices"""
+    try:
+        conn = get_db_connection()
+        devices = conn.execute('''SELECT d.*, s.last_timestamp, s.last_sync 
+                                 FROM devices d 
+                                 LEFT JOIN device_sync_state s ON s.device_ip = d.ip AND s.device_port = d.port 
+                                 ORDER BY d.id''').fetchall()
+        conn.close()
+        
+        return jsonify({'success': True, 'devices': [dict(device) for device in devices]})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/api/device_health', methods=['GET'])
+def api_device_health():
+    """API endpoint to poll the cached device health status"""
+    return jsonify({'success': True, 'devices': get_device_health(), 'interval': DEVICE_HEALTH_INTERVAL})
+
+@app.route('/api/devices', methods=['POST'])
+def add_device():
+    """API endpoint to register a device (or update an existing one) for fleet syncs"""
+    try:
+        data = request.get_json()
+        ip = (data.get('ip') or '').strip()
+        port = int(data.get('port', DEFAULT_DEVICE_PORT))
+        name = data.get('name') or f'Device {ip}'
+        timeout = int(data.get('timeout', 5))
+        retries = int(data.get('retries', 2))
+        
+        if not ip:
+            return jsonify({'success': False, 'message': 'Device IP is required'})
+        
+        db_writer.execute(lambda cursor: cursor.execute(
+            '''INSERT INTO devices (name, ip, port, timeout, retries, is_active, created_date) 
+               VALUES (?, ?, ?, ?, ?, 1, ?) 
+               ON CONFLICT(ip, port) DO UPDATE SET 
+                   name = excluded.name, timeout = excluded.timeout, 
+                   retries = excluded.retries, is_active = 1''', 
+            (name, ip, port, timeout, retries, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))))
+        
+        return jsonify({'success': True, 'message': f'Device {ip}:{port} registered successfully'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/api/devices/<int:device_id>', methods=['DELETE'])
+def delete_device(device_id):
+    """API endpoint to remove a device from fleet syncs"""
+    try:
+        deleted = db_writer.execute(
+            lambda cursor: cursor.execute('DELETE FROM devices WHERE id = ?', (device_id,)).rowcount)
+        
+        if deleted:
+            return jsonify({'success': True, 'message': 'Device removed successfully'})
+        return jsonify({'success': False, 'message': 'Device not found'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
 @app.route('/api/sync_users_only', methods=['POST'])
 def sync_users_only():
@@ -1703,37 +2320,44 @@ def update_user(userid):
         if not name:
             return jsonify({'success': False, 'message': 'Name is required'})
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def save(cursor):
+            # Check if user exists
+            cursor.execute('SELECT userid, shift_type FROM users WHERE userid = ?', (userid,))
+            existing_user = cursor.fetchone()
+            if not existing_user:
+                return False
+            
+            # Get or create company
+            cursor.execute('SELECT id FROM companies WHERE name = ?', (company_name,))
+            company = cursor.fetchone()
+            
+            if company:
+                company_id = company['id']
+            else:
+                # Create new company if it doesn't exist
+                cursor.execute('INSERT INTO companies (name, description) VALUES (?, ?)', 
+                             (company_name, f'Company for user {name}'))
+                company_id = cursor.lastrowid
+            
+            # Update user
+            cursor.execute('''UPDATE users 
+                             SET name = ?, company_name = ?, company_id = ?, shift_start_time = ?, 
+                                 shift_end_time = ?, shift_type = ?, working_hours_per_day = ?, monthly_salary = ?
+                             WHERE userid = ?''', 
+                          (name, company_name, company_id, shift_start_time, shift_end_time, 
+                           shift_type, working_hours_per_day, monthly_salary, userid))
+            
+            # A shift change alters how every one of the user's days is calculated
+            if existing_user['shift_type'] != shift_type:
+                mark_user_days_dirty(cursor, userid)
+            
+            # The user's company or shift may have moved their days to other rollup groups
+            refresh_user_rollup(cursor, [userid])
+            return True
         
-        # Check if user exists
-        cursor.execute('SELECT userid FROM users WHERE userid = ?', (userid,))
-        if not cursor.fetchone():
-            conn.close()
+        if not db_writer.execute(save):
             return jsonify({'success': False, 'message': 'User not found'})
-        
-        # Get or create company
-        cursor.execute('SELECT id FROM companies WHERE name = ?', (company_name,))
-        company = cursor.fetchone()
-        
-        if company:
-            company_id = company['id']
-        else:
-            # Create new company if it doesn't exist
-            cursor.execute('INSERT INTO companies (name, description) VALUES (?, ?)', 
-                         (company_name, f'Company for user {name}'))
-            company_id = cursor.lastrowid
-        
-        # Update user
-        cursor.execute('''UPDATE users 
-                         SET name = ?, company_name = ?, company_id = ?, shift_start_time = ?, 
-                             shift_end_time = ?, shift_type = ?, working_hours_per_day = ?, monthly_salary = ?
-                         WHERE userid = ?''', 
-                      (name, company_name, company_id, shift_start_time, shift_end_time, 
-                       shift_type, working_hours_per_day, monthly_salary, userid))
-        
-        conn.commit()
-        conn.close()
+        bump_data_version()
         
         return jsonify({'success': True, 'message': f'User {name} updated successfully'})
     except Exception as e:
@@ -1743,28 +2367,33 @@ def update_user(userid):
 def delete_user(userid):
     """API endpoint to delete a user"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def delete(cursor):
+            # Check if user exists
+            cursor.execute('SELECT name FROM users WHERE userid = ?', (userid,))
+            user = cursor.fetchone()
+            if not user:
+                return None
+            
+            # Delete user's attendance records first
+            cursor.execute('SELECT DISTINCT punch_date FROM attendance WHERE userid = ?', (userid,))
+            rollup_dates = [row[0] for row in cursor.fetchall()]
+            cursor.execute('DELETE FROM attendance WHERE userid = ?', (userid,))
+            cursor.execute('DELETE FROM device_punches WHERE userid = ?', (userid,))
+            cursor.execute('DELETE FROM attendance_marking WHERE userid = ?', (userid,))
+            cursor.execute('DELETE FROM salary_calculations WHERE userid = ?', (userid,))
+            
+            # Delete user
+            cursor.execute('DELETE FROM users WHERE userid = ?', (userid,))
+            
+            refresh_daily_rollup(cursor, rollup_dates)
+            return user['name']
         
-        # Check if user exists
-        cursor.execute('SELECT name FROM users WHERE userid = ?', (userid,))
-        user = cursor.fetchone()
-        if not user:
-            conn.close()
+        name = db_writer.execute(delete)
+        if name is None:
             return jsonify({'success': False, 'message': 'User not found'})
+        bump_data_version()
         
-        # Delete user's attendance records first
-        cursor.execute('DELETE FROM attendance WHERE userid = ?', (userid,))
-        cursor.execute('DELETE FROM attendance_marking WHERE userid = ?', (userid,))
-        cursor.execute('DELETE FROM salary_calculations WHERE userid = ?', (userid,))
-        
-        # Delete user
-        cursor.execute('DELETE FROM users WHERE userid = ?', (userid,))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'success': True, 'message': f'User {user["name"]} deleted successfully'})
+        return jsonify({'success': True, 'message': f'User {name} deleted successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
@@ -1785,36 +2414,38 @@ def create_user():
         if not userid or not name:
             return jsonify({'success': False, 'message': 'User ID and Name are required'})
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def save(cursor):
+            # Check if user ID already exists
+            cursor.execute('SELECT userid FROM users WHERE userid = ?', (userid,))
+            if cursor.fetchone():
+                return False
+            
+            # Get or create company
+            cursor.execute('SELECT id FROM companies WHERE name = ?', (company_name,))
+            company = cursor.fetchone()
+            
+            if company:
+                company_id = company['id']
+            else:
+                # Create new company if it doesn't exist
+                cursor.execute('INSERT INTO companies (name, description) VALUES (?, ?)', 
+                             (company_name, f'Company for user {name}'))
+                company_id = cursor.lastrowid
+            
+            # Create user
+            cursor.execute('''INSERT INTO users (userid, name, company_name, company_id, shift_start_time, 
+                                               shift_end_time, shift_type, working_hours_per_day, monthly_salary)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
+                          (userid, name, company_name, company_id, shift_start_time, shift_end_time, 
+                           shift_type, working_hours_per_day, monthly_salary))
+            
+            # Attendance already pulled for this userid now joins a rollup group
+            refresh_user_rollup(cursor, [userid])
+            return True
         
-        # Check if user ID already exists
-        cursor.execute('SELECT userid FROM users WHERE userid = ?', (userid,))
-        if cursor.fetchone():
-            conn.close()
+        if not db_writer.execute(save):
             return jsonify({'success': False, 'message': 'User ID already exists'})
-        
-        # Get or create company
-        cursor.execute('SELECT id FROM companies WHERE name = ?', (company_name,))
-        company = cursor.fetchone()
-        
-        if company:
-            company_id = company['id']
-        else:
-            # Create new company if it doesn't exist
-            cursor.execute('INSERT INTO companies (name, description) VALUES (?, ?)', 
-                         (company_name, f'Company for user {name}'))
-            company_id = cursor.lastrowid
-        
-        # Create user
-        cursor.execute('''INSERT INTO users (userid, name, company_name, company_id, shift_start_time, 
-                                           shift_end_time, shift_type, working_hours_per_day, monthly_salary)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                      (userid, name, company_name, company_id, shift_start_time, shift_end_time, 
-                       shift_type, working_hours_per_day, monthly_salary))
-        
-        conn.commit()
-        conn.close()
+        bump_data_version()
         
         return jsonify({'success': True, 'message': f'User {name} created successfully'})
     except Exception as e:
@@ -1830,8 +2461,8 @@ def get_stats():
     
     # Get today's attendance
     today = datetime.now().strftime('%Y-%m-%d')
-    today_attendance = conn.execute('''SELECT COUNT(*) FROM attendance 
-                                     WHERE DATE(timestamp) = ?''', (today,)).fetchone()[0]
+    today_attendance = conn.execute('''SELECT IFNULL(SUM(present_count), 0) FROM daily_rollup 
+                                     WHERE date = ?''', (today,)).fetchone()[0]
     
     conn.close()
     
@@ -1841,6 +2472,12 @@ def get_stats():
         'today_attendance': today_attendance
     })
 
+@app.route('/api/db_writer_stats')
+@login_required
+def get_db_writer_stats():
+    """API endpoint to get the write queue depth and group-commit counters"""
+    return jsonify({'success': True, 'stats': db_writer.stats()})
+
 @app.route('/api/companies', methods=['GET'])
 def get_companies():
     """API endpoint to get all companies"""
@@ -1896,34 +2533,36 @@ def update_company(company_id):
         if not name:
             return jsonify({'success': False, 'message': 'Company name is required'})
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if company exists
-        cursor.execute('SELECT id FROM companies WHERE id = ?', (company_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify({'success': False, 'message': 'Company not found'})
-        
-        # Check if name already exists for another company
-        cursor.execute('SELECT id FROM companies WHERE name = ? AND id != ?', (name, company_id))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify({'success': False, 'message': 'Company name already exists'})
-        
-        # Update company
-        cursor.execute('''UPDATE companies 
-                         SET name = ?, description = ?
-                         WHERE id = ?''', 
-                      (name, description, company_id))
-        
-        # Update users with this company
-        cursor.execute('''UPDATE users 
-                         SET company_name = ?
-                         WHERE company_id = ?''', (name, company_id))
-        
-        conn.commit()
-        conn.close()
+        def save(cursor):
+            # Check if company exists
+            cursor.execute('SELECT id FROM companies WHERE id = ?', (company_id,))
+            if not cursor.fetchone():
+                return 'Company not found'
+            
+            # Check if name already exists for another company
+            cursor.execute('SELECT id FROM companies WHERE name = ? AND id != ?', (name, company_id))
+            if cursor.fetchone():
+                return 'Company name already exists'
+            
+            # Update company
+            cursor.execute('''UPDATE companies 
+                             SET name = ?, description = ?
+                             WHERE id = ?''', 
+                          (name, description, company_id))
+            
+            # Update users with this company
+            cursor.execute('''UPDATE users 
+                             SET company_name = ?
+                             WHERE company_id = ?''', (name, company_id))
+            
+            # The rollup is keyed on the company name, so move their days to the new one
+            cursor.execute('SELECT userid FROM users WHERE company_id = ?', (company_id,))
+            refresh_user_rollup(cursor, [row[0] for row in cursor.fetchall()])
+        
+        error = db_writer.execute(save)
+        if error:
+            return jsonify({'success': False, 'message': error})
+        bump_data_version()
         
         return jsonify({'success': True, 'message': f'Company {name} updated successfully'})
     except Exception as e:
@@ -1933,31 +2572,26 @@ def update_company(company_id):
 def delete_company(company_id):
     """API endpoint to delete a company"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if company exists
-        cursor.execute('SELECT name FROM companies WHERE id = ?', (company_id,))
-        company = cursor.fetchone()
-        if not company:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Company not found'})
-        
-        # Check if any users are using this company
-        cursor.execute('SELECT COUNT(*) FROM users WHERE company_id = ?', (company_id,))
-        user_count = cursor.fetchone()[0]
-        
-        if user_count > 0:
-            conn.close()
-            return jsonify({'success': False, 'message': f'Cannot delete company. {user_count} users are still assigned to this company.'})
-        
-        # Delete company
-        cursor.execute('DELETE FROM companies WHERE id = ?', (company_id,))
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({'success': True, 'message': f'Company {company["name"]} deleted successfully'})
+        def delete(cursor):
+            # Check if company exists
+            cursor.execute('SELECT name FROM companies WHERE id = ?', (company_id,))
+            company = cursor.fetchone()
+            if not company:
+                return False, 'Company not found'
+            
+            # Check if any users are using this company
+            cursor.execute('SELECT COUNT(*) FROM users WHERE company_id = ?', (company_id,))
+            user_count = cursor.fetchone()[0]
+            
+            if user_count > 0:
+                return False, f'Cannot delete company. {user_count} users are still assigned to this company.'
+            
+            # Delete company
+            cursor.execute('DELETE FROM companies WHERE id = ?', (company_id,))
+            return True, f'Company {company["name"]} deleted successfully'
+        
+        success, message = db_writer.execute(delete)
+        return jsonify({'success': success, 'message': message})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
@@ -1972,153 +2606,121 @@ def create_company():
         if not name:
             return jsonify({'success': False, 'message': 'Company name is required'})
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def save(cursor):
+            # Check if company name already exists
+            cursor.execute('SELECT id FROM companies WHERE name = ?', (name,))
+            if cursor.fetchone():
+                return False
+            
+            # Create company
+            cursor.execute('''INSERT INTO companies (name, description)
+                             VALUES (?, ?)''', 
+                          (name, description))
+            return True
         
-        # Check if company name already exists
-        cursor.execute('SELECT id FROM companies WHERE name = ?', (name,))
-        if cursor.fetchone():
-            conn.close()
+        if not db_writer.execute(save):
             return jsonify({'success': False, 'message': 'Company name already exists'})
         
-        # Create company
-        cursor.execute('''INSERT INTO companies (name, description)
-                         VALUES (?, ?)''', 
-                      (name, description))
-        
-        conn.commit()
-        conn.close()
-        
         return jsonify({'success': True, 'message': f'Company {name} created successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+def mark_user_days_dirty(cursor, userid):
+    """Queue every attendance day of a user for working hours recalculation"""
+    cursor.execute('''INSERT OR IGNORE INTO attendance_dirty (userid, punch_date) 
+                     SELECT userid, punch_date FROM attendance WHERE userid = ?''', (userid,))
+
+def mark_all_days_dirty(cursor):
+    """Queue every attendance day for working hours recalculation"""
+    cursor.execute('''INSERT OR IGNORE INTO attendance_dirty (userid, punch_date) 
+                     SELECT userid, punch_date FROM attendance WHERE punch_date IS NOT NULL''')
+
+def recalculated_working_hours(check_in, check_out, shift_type):
+    """Working hours for one check-in/check-out pair under the recalculation rules, or None if unparseable"""
+    # Check if check-in and check-out are the same time
+    if str(check_in).split(' ')[-1] == str(check_out).split(' ')[-1]:
+        return 0.0
+    
+    try:
+        check_in_dt = datetime.fromisoformat(str(check_in))
+        check_out_dt = datetime.fromisoformat(str(check_out))
+    except ValueError:
+        return None
+    
+    # Pairing already stores the evening punch as check-in; the check-out only
+    # needs moving to the next day when it is recorded on the same date
+    if check_out_dt < check_in_dt:
+        check_out_dt += timedelta(days=1)
+    
+    working_hours = (check_out_dt - check_in_dt).total_seconds() / 3600.0
+    
+    # Cap working hours at 10 for night shifts
+    if shift_type == 'night' and working_hours > 10.0:
+        working_hours = 10.0
+    
+    return round(working_hours, 2)
+
+def recalculate_attendance_hours(cursor, full=False, limit=None):
+    """Recalculate working hours for the dirty user-days (up to limit of them, or every row when full); returns rows updated"""
+    if full:
+        cursor.execute('''SELECT a.id, a.punch_date, a.check_in, a.check_out, u.shift_type
+                         FROM attendance a 
+                         JOIN users u ON a.userid = u.userid 
+                         WHERE a.check_in IS NOT NULL AND a.check_out IS NOT NULL''')
+    else:
+        # A negative LIMIT means no limit in SQLite
+        dirty = '''(SELECT userid, punch_date FROM attendance_dirty 
+                    ORDER BY userid, punch_date LIMIT ?)'''
+        dirty_days = [tuple(row) for row in cursor.execute(f'SELECT * FROM {dirty}', (limit or -1,)).fetchall()]
+        cursor.execute(f'''SELECT a.id, a.punch_date, a.check_in, a.check_out, u.shift_type
+                          FROM {dirty} d 
+                          JOIN attendance a ON a.userid = d.userid AND a.punch_date = d.punch_date 
+                          JOIN users u ON a.userid = u.userid 
+                          WHERE a.check_in IS NOT NULL AND a.check_out IS NOT NULL''', (limit or -1,))
+    
+    updates = []
+    dates = set()
+    for record in cursor.fetchall():
+        working_hours = recalculated_working_hours(record['check_in'], record['check_out'], record['shift_type'])
+        if working_hours is None:
+            row_logger.warning("Error processing record %s: unparseable check-in/check-out", record['id'])
+            continue
+        updates.append((working_hours, record['id']))
+        dates.add(record['punch_date'])
+    
+    cursor.executemany('UPDATE attendance SET working_hours = ? WHERE id = ?', updates)
+    
+    # Only clear the days read above; days marked dirty meanwhile wait for the next run
+    if full:
+        cursor.execute('DELETE FROM attendance_dirty')
+    else:
+        cursor.executemany('DELETE FROM attendance_dirty WHERE userid = ? AND punch_date = ?', dirty_days)
+    refresh_daily_rollup(cursor, None if full else dates)
+    
+    return len(updates)
+
+def recalculate_attendance_chunk(cursor, limit=DB_WRITE_CHUNK_SIZE):
+    """Recalculate the next chunk of dirty user-days; returns (rows updated, whether dirty days remain)"""
+    updated_count = recalculate_attendance_hours(cursor, limit=limit)
+    return updated_count, bool(cursor.execute('SELECT EXISTS (SELECT 1 FROM attendance_dirty)').fetchone()[0])
+
 @app.route('/api/recalculate_working_hours', methods=['POST'])
 def recalculate_working_hours():
-    """Recalculate working hours for all attendance records"""
+    """Recalculate working hours for changed attendance records (all records with "full": true)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get all attendance records with check-in and check-out times
-        records = cursor.execute('''SELECT a.id, a.userid, a.check_in, a.check_out, u.shift_type
-                                   FROM attendance a 
-                                   JOIN users u ON a.userid = u.userid 
-                                   WHERE a.check_in IS NOT NULL AND a.check_out IS NOT NULL''').fetchall()
+        data = request.get_json(silent=True) or {}
+        full = bool(data.get('full'))
         
+        # A full recalculation queues every day, then works through them chunk by chunk
+        # like an incremental one, so saves queued meanwhile are not held up behind it
+        if full:
+            db_writer.execute(mark_all_days_dirty)
         updated_count = 0
-        
-        for record in records:
-            try:
-                check_in_str = str(record['check_in'])
-                check_out_str = str(record['check_out'])
-                shift_type = record['shift_type']
-                
-                # Parse times
-                if ' ' in check_in_str:
-                    check_in_time = check_in_str.split(' ')[1]
-                else:
-                    check_in_time = check_in_str
-                    
-                if ' ' in check_out_str:
-                    check_out_time = check_out_str.split(' ')[1]
-                else:
-                    check_out_time = check_out_str
-                
-                # Check if check-in and check-out are the same time
-                if check_in_time == check_out_time:
-                    working_hours = 0.0
-                else:
-                    # Parse time components
-                    check_in_parts = check_in_time.split(':')
-                    check_out_parts = check_out_time.split(':')
-                    
-                    if len(check_in_parts) >= 2 and len(check_out_parts) >= 2:
-                        # Create datetime objects for calculation
-                        today = datetime.now().date()
-                        
-                        check_in_hour = int(check_in_parts[0])
-                        check_in_minute = int(check_in_parts[1])
-                        check_in_second = int(check_in_parts[2]) if len(check_in_parts) > 2 else 0
-                        
-                        check_out_hour = int(check_out_parts[0])
-                        check_out_minute = int(check_out_parts[1])
-                        check_out_second = int(check_out_parts[2]) if len(check_out_parts) > 2 else 0
-                        
-                        check_in_dt = datetime.combine(today, datetime.min.time().replace(
-                            hour=check_in_hour, minute=check_in_minute, second=check_in_second
-                        ))
-                        
-                        check_out_dt = datetime.combine(today, datetime.min.time().replace(
-                            hour=check_out_hour, minute=check_out_minute, second=check_out_second
-                        ))
-                        
-                        # Handle night shift logic
-                        if shift_type == 'night':
-                            # For night shifts, the biometric device ALWAYS flips check-in and check-out
-                            # So we need to ALWAYS swap them, not just when we detect a reversal
-                            
-                            # Swap the times
-                            temp_hour = check_in_hour
-                            temp_minute = check_in_minute
-                            temp_second = check_in_second
-                            
-                            check_in_hour = check_out_hour
-                            check_in_minute = check_out_minute
-                            check_in_second = check_out_second
-                            
-                            check_out_hour = temp_hour
-                            check_out_minute = temp_minute
-                            check_out_second = temp_second
-                            
-                            print(f"Swapped times for night shift user in recalc: "
-                                  f"Device check-in ({temp_hour:02d}:{temp_minute:02d}:{temp_second:02d}) → Real check-out, "
-                                  f"Device check-out ({check_in_hour:02d}:{check_in_minute:02d}:{check_in_second:02d}) → Real check-in")
-                            
-                            # Now create proper datetime objects with correct dates
-                            # Check-in is on current day (morning, but actually evening after swap)
-                            check_in_date = datetime.now().date()
-                            # Check-out is on next day (evening, but actually morning after swap)
-                            check_out_date = check_in_date + timedelta(days=1)
-                            
-                            check_in_dt = datetime.combine(check_in_date, datetime.min.time().replace(
-                                hour=check_in_hour, minute=check_in_minute, second=check_in_second
-                            ))
-                            
-                            check_out_dt = datetime.combine(check_out_date, datetime.min.time().replace(
-                                hour=check_out_hour, minute=check_out_minute, second=check_out_second
-                            ))
-                            
-                            # For night shift, if check-out is earlier than check-in, add 1 day
-                            if check_out_dt < check_in_dt:
-                                check_out_dt += timedelta(days=1)
-                        else:
-                            # For day shifts, if check-out is earlier than check-in, it's likely next day
-                            if check_out_dt < check_in_dt:
-                                check_out_dt += timedelta(days=1)
-                        
-                        # Calculate working hours
-                        time_diff = check_out_dt - check_in_dt
-                        working_hours = time_diff.total_seconds() / 3600.0
-                        
-                        # Cap working hours at 10 for night shifts
-                        if shift_type == 'night' and working_hours > 10.0:
-                            working_hours = 10.0
-                        
-                        # Format working hours to 2 decimal places
-                        working_hours = round(working_hours, 2)
-                
-                # Update working hours in database
-                cursor.execute('UPDATE attendance SET working_hours = ? WHERE id = ?', 
-                             (working_hours, record['id']))
-                updated_count += 1
-                
-            except Exception as e:
-                print(f"Error processing record {record['id']}: {e}")
-                continue
-        
-        conn.commit()
-        conn.close()
+        remaining = True
+        while remaining:
+            chunk_count, remaining = db_writer.execute(recalculate_attendance_chunk)
+            updated_count += chunk_count
+            bump_data_version()
         
         return jsonify({
             'success': True, 
@@ -2128,13 +2730,63 @@ def recalculate_working_hours():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+@app.cli.command('recalculate-hours')
+@click.option('--full', is_flag=True, help='Recalculate every attendance row, not just the changed ones.')
+def recalculate_hours_command(full):
+    """Recalculate attendance working hours for changed user-days"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated_count = recalculate_attendance_hours(cursor, full=full)
+    conn.commit()
+    bump_data_version()
+    conn.close()
+    print(f"Recalculated working hours for {updated_count} records{' (full)' if full else ''}")
+
+def backfill_working_hours(cursor):
+    """Store working hours for completed attendance rows that have none yet; returns rows filled"""
+    cursor.execute('''SELECT a.id, a.punch_date, a.check_in, a.check_out, u.shift_type
+                     FROM attendance a 
+                     JOIN users u ON a.userid = u.userid 
+                     WHERE (a.working_hours IS NULL OR a.working_hours = 0) 
+                     AND a.check_in IS NOT NULL AND a.check_out IS NOT NULL''')
+    
+    updates = []
+    dates = set()
+    for record in cursor.fetchall():
+        working_hours = recalculated_working_hours(record['check_in'], record['check_out'], record['shift_type'])
+        if working_hours:
+            updates.append((working_hours, record['id']))
+            dates.add(record['punch_date'])
+    
+    cursor.executemany('UPDATE attendance SET working_hours = ? WHERE id = ?', updates)
+    refresh_daily_rollup(cursor, dates)
+    return len(updates)
+
+def run_working_hours_backfill():
+    """Scheduler job: fill in missing working hours so the attendance view never computes them"""
+    try:
+        filled_count = db_writer.execute_long(backfill_working_hours)
+        
+        if filled_count:
+            bump_data_version()
+            logger.info("Backfilled working hours for %d attendance records", filled_count)
+    except Exception as e:
+        logger.error("Error backfilling working hours: %s", e)
+
+scheduler.add_job(
+    func=run_working_hours_backfill,
+    trigger=IntervalTrigger(seconds=WORKING_HOURS_BACKFILL_INTERVAL),
+    id='working_hours_backfill',
+    name='Backfill attendance working hours',
+    max_instances=1,
+    coalesce=True,
+    replace_existing=True
+)
+
 @app.route('/api/add_sample_data', methods=['POST'])
 def add_sample_data():
     """Add sample attendance data for testing"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Sample attendance records for demonstration
         sample_attendance = [
             # Today's records - Night shift pattern
@@ -2154,17 +2806,19 @@ def add_sample_data():
             (41, '2025-08-16 19:00:00', '2025-08-16 19:00:00', '2025-08-17 04:00:00', 9.0),
         ]
         
-        # Clear existing attendance records first
-        cursor.execute('DELETE FROM attendance')
-        
-        # Insert new sample records
-        for record in sample_attendance:
-            cursor.execute('''INSERT INTO attendance 
-                            (userid, timestamp, check_in, check_out, working_hours) 
-                            VALUES (?, ?, ?, ?, ?)''', record)
+        def save(cursor):
+            # Clear existing attendance records first
+            cursor.execute('DELETE FROM attendance')
+            
+            # Insert new sample records
+            cursor.executemany('''INSERT INTO attendance 
+                                 (userid, timestamp, check_in, check_out, working_hours) 
+                                 VALUES (?, ?, ?, ?, ?)''', sample_attendance)
+            
+            refresh_daily_rollup(cursor)
         
-        conn.commit()
-        conn.close()
+        db_writer.execute(save)
+        bump_data_version()
         
         return jsonify({
             'success': True, 
@@ -2178,14 +2832,14 @@ def add_sample_data():
 def clear_sample_data():
     """Clear sample attendance data"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Clear all attendance records
-        cursor.execute('DELETE FROM attendance')
+        def clear(cursor):
+            # Clear all attendance records
+            cursor.execute('DELETE FROM attendance')
+            
+            refresh_daily_rollup(cursor)
         
-        conn.commit()
-        conn.close()
+        db_writer.execute(clear)
+        bump_data_version()
         
         return jsonify({
             'success': True, 
@@ -2214,14 +2868,14 @@ def push_data_to_device():
             return jsonify({'success': False, 'message': "ZK library not available. Please install it with: pip install pyzk"})
         
         # Connect to device
-        print(f"Attempting to connect to ZK device at {device_ip}:{device_port}...")
+        logger.debug("Attempting to connect to ZK device at %s:%s", device_ip, device_port)
         zk = ZK(device_ip, port=device_port, timeout=5)
         
         try:
             conn = zk.connect()
             if not conn:
                 return jsonify({'success': False, 'message': f"Failed to establish ZK connection to {device_ip}:{device_port}"})
-            print(f"✓ ZK connection established successfully")
+            logger.debug("ZK connection established")
         except Exception as e:
             return jsonify({'success': False, 'message': f"ZK connection error: {str(e)}"})
         
@@ -2238,37 +2892,54 @@ def push_data_to_device():
             if not users:
                 return jsonify({'success': False, 'message': 'No users found in database'})
             
+            # One snapshot of the device's user table, indexed by user_id
+            device_users = {str(device_user.user_id): device_user for device_user in conn.get_users()}
+            used_uids = {device_user.uid for device_user in device_users.values()}
+            next_uid = max(used_uids, default=0) + 1
+            
+            # Diff against the database so only new or renamed users are written
+            changes = []
+            for user in users:
+                existing_device_user = device_users.get(str(user['userid']))
+                if existing_device_user is None:
+                    uid = user['userid'] if user['userid'] not in used_uids else next_uid
+                    used_uids.add(uid)
+                    next_uid = max(next_uid, uid) + 1
+                    changes.append((user, None, uid))
+                elif existing_device_user.name != user['name']:
+                    changes.append((user, existing_device_user, existing_device_user.uid))
+            
             # Push users to device
             users_updated = 0
             users_added = 0
             
-            for user in users:
+            if changes:
+                # Lock the terminal while writing so the whole batch goes through in one pass
+                conn.disable_device()
                 try:
-                    # Check if user exists on device
-                    device_users = conn.get_users()
-                    existing_device_user = None
-                    
-                    for device_user in device_users:
-                        if device_user.user_id == user['userid']:
-                            existing_device_user = device_user
-                            break
-                    
-                    if existing_device_user:
-                        # Update existing user on device
-                        if existing_device_user.name != user['name']:
-                            # Update name on device
-                            conn.set_user(uid=user['userid'], name=user['name'])
-                            print(f"Updated user {user['userid']} name on device: {user['name']}")
-                            users_updated += 1
-                    else:
-                        # Add new user to device
-                        conn.set_user(uid=user['userid'], name=user['name'])
-                        print(f"Added user {user['userid']} to device: {user['name']}")
-                        users_added += 1
-                        
-                except Exception as e:
-                    print(f"Error processing user {user['userid']}: {e}")
-                    continue
+                    for user, existing_device_user, uid in changes:
+                        try:
+                            if existing_device_user:
+                                # Update name on device, keeping its privilege, password and card
+                                conn.set_user(uid=uid, name=user['name'], 
+                                              privilege=existing_device_user.privilege, 
+                                              password=existing_device_user.password, 
+                                              group_id=existing_device_user.group_id, 
+                                              user_id=existing_device_user.user_id, 
+                                              card=existing_device_user.card)
+                                users_updated += 1
+                            else:
+                                # Add new user to device
+                                conn.set_user(uid=uid, name=user['name'], user_id=str(user['userid']))
+                                users_added += 1
+                        except Exception as e:
+                            row_logger.warning("Error processing user %s: %s", user['userid'], e)
+                            continue
+                finally:
+                    conn.enable_device()
+            
+            logger.info("Pushed %d new and %d renamed users to %s:%s (%d unchanged)", 
+                        users_added, users_updated, device_ip, device_port, len(users) - len(changes))
             
             # Properly disconnect from device
             if conn and hasattr(conn, 'disconnect'):
@@ -2330,14 +3001,14 @@ def push_user_to_device():
             return jsonify({'success': False, 'message': "ZK library not available. Please install it with: pip install pyzk"})
         
         # Connect to device
-        print(f"Attempting to connect to ZK device at {device_ip}:{device_port}...")
+        logger.debug("Attempting to connect to ZK device at %s:%s", device_ip, device_port)
         zk = ZK(device_ip, port=device_port, timeout=5)
         
         try:
             conn = zk.connect()
             if not conn:
                 return jsonify({'success': False, 'message': f"Failed to establish ZK connection to {device_ip}:{device_port}"})
-            print(f"✓ ZK connection established successfully")
+            logger.debug("ZK connection established")
         except Exception as e:
             return jsonify({'success': False, 'message': f"ZK connection error: {str(e)}"})
         
@@ -2367,14 +3038,14 @@ def push_user_to_device():
                 # Update existing user on device
                 if existing_device_user.name != user['name']:
                     conn.set_user(uid=user['userid'], name=user['name'])
-                    print(f"Updated user {user['userid']} name on device: {user['name']}")
+                    row_logger.debug("Updated user %s name on device: %s", user['userid'], user['name'])
                     message = f"Updated user {user['name']} on device"
                 else:
                     message = f"User {user['name']} already up to date on device"
             else:
                 # Add new user to device
                 conn.set_user(uid=user['userid'], name=user['name'])
-                print(f"Added user {user['userid']} to device: {user['name']}")
+                row_logger.debug("Added user %s to device: %s", user['userid'], user['name'])
                 message = f"Added user {user['name']} to device"
             
             # Properly disconnect from device
@@ -2480,16 +3151,14 @@ def test_reversed_times():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
-def process_multiple_punches(user_id, date, punches):
+def load_user_shift_map(cursor):
+    """Return {userid (str): shift_type} for all users in a single query"""
+    cursor.execute('SELECT userid, shift_type FROM users')
+    return {str(row['userid']): row['shift_type'] for row in cursor.fetchall()}
+
+def process_multiple_punches(user_id, date, punches, is_night_shift=False):
     """Process multiple punches for a user on a given date to determine check-in/check-out"""
     try:
-        # Get user's shift information
-        user_conn = get_db_connection()
-        user_info = user_conn.execute('SELECT shift_type FROM users WHERE userid = ?', (user_id,)).fetchone()
-        user_conn.close()
-        
-        is_night_shift = user_info and user_info['shift_type'] == 'night' if user_info else False
-        
         if not punches:
             return None, None
         
@@ -2513,9 +3182,9 @@ def process_multiple_punches(user_id, date, punches):
                 check_out_time = min(morning_punches, key=lambda x: x['timestamp'])
                 check_in_time = max(evening_punches, key=lambda x: x['timestamp'])
                 
-                print(f"Night shift multiple punches for user {user_id}: "
-                      f"Check-in: {check_in_time['timestamp']} (evening), "
-                      f"Check-out: {check_out_time['timestamp']} (morning)")
+                row_logger.debug("Night shift multiple punches for user %s: Check-in: %s (evening), "
+                                 "Check-out: %s (morning)", 
+                                 user_id, check_in_time['timestamp'], check_out_time['timestamp'])
                 
                 return check_in_time['timestamp'], check_out_time['timestamp']
             else:
@@ -2527,15 +3196,133 @@ def process_multiple_punches(user_id, date, punches):
             check_in_time = sorted_punches[0]['timestamp']
             check_out_time = sorted_punches[-1]['timestamp']
             
-            print(f"Day shift multiple punches for user {user_id}: "
-                  f"Check-in: {check_in_time}, Check-out: {check_out_time}")
+            row_logger.debug("Day shift multiple punches for user %s: Check-in: %s, Check-out: %s", 
+                             user_id, check_in_time, check_out_time)
             
             return check_in_time, check_out_time
             
     except Exception as e:
-        print(f"Error processing multiple punches for user {user_id}: {e}")
+        row_logger.warning("Error processing multiple punches for user %s: %s", user_id, e)
         return None, None
 
+def calculate_punch_working_hours(check_in_time, check_out_time, is_night_shift=False):
+    """Working hours between paired check-in/check-out timestamps"""
+    check_in_dt = datetime.strptime(check_in_time, '%Y-%m-%d %H:%M:%S')
+    check_out_dt = datetime.strptime(check_out_time, '%Y-%m-%d %H:%M:%S')
+    
+    # For night shifts, if check-out is earlier than check-in, add 24 hours
+    if is_night_shift and check_out_dt < check_in_dt:
+        check_out_dt += timedelta(days=1)
+    
+    working_hours = (check_out_dt - check_in_dt).total_seconds() / 3600.0
+    
+    # Cap working hours at 10 for night shifts
+    if is_night_shift and working_hours > 10.0:
+        working_hours = 10.0
+    
+    return working_hours
+
+def pair_attendance_punches(records, shift_map):
+    """Pair punch rows in memory into (userid, timestamp, punch_date, check_in, check_out, working_hours) day rows"""
+    # Group records by user and date
+    user_date_punches = {}
+    for record in records:
+        user_date_punches.setdefault((str(record['userid']), record['date']), []).append({'timestamp': record['timestamp']})
+    
+    day_rows = []
+    for (user_id, date), punches in user_date_punches.items():
+        is_night_shift = shift_map.get(user_id) == 'night'
+        first_punch = min(punch['timestamp'] for punch in punches)
+        
+        # Use intelligent punch processing
+        check_in_time, check_out_time = process_multiple_punches(user_id, date, punches, is_night_shift)
+        working_hours = 0.0
+        
+        if check_in_time and check_out_time:
+            try:
+                working_hours = calculate_punch_working_hours(check_in_time, check_out_time, is_night_shift)
+            except Exception as e:
+                row_logger.warning("Error calculating working hours for user %s: %s", user_id, e)
+        
+        day_rows.append((user_id, first_punch, date, check_in_time or first_punch, check_out_time, working_hours))
+    
+    return day_rows
+
+def insert_device_punches(cursor, device_ip, device_port, records):
+    """Store raw device punches in one batch, ignoring ones already stored; returns the records actually inserted"""
+    if not records:
+        return []
+    
+    # One range read of the punches already stored for the offered days tells which records are new
+    days = [record.timestamp.strftime('%Y-%m-%d') for record in records]
+    cursor.execute('''SELECT userid, timestamp FROM device_punches 
+                     WHERE punch_date >= ? AND punch_date <= ?''', (min(days), max(days)))
+    stored = {(str(row['userid']), row['timestamp']) for row in cursor.fetchall()}
+    new_punches = {}
+    for record in records:
+        key = (str(record.user_id), record.timestamp.strftime('%Y-%m-%d %H:%M:%S'))
+        if key not in stored:
+            new_punches.setdefault(key, record)
+    
+    cursor.executemany('''INSERT OR IGNORE INTO device_punches 
+                         (userid, timestamp, punch_date, device_ip, device_port, uid) 
+                         VALUES (?, ?, ?, ?, ?, ?)''', 
+                      [(record.user_id, timestamp, timestamp[:10], device_ip, device_port, record.uid) 
+                       for (_, timestamp), record in new_punches.items()])
+    row_logger.debug("Stored %d new punches from %s:%s", cursor.rowcount, device_ip, device_port)
+    return list(new_punches.values())
+
+def upsert_paired_days(cursor, punches, shift_map):
+    """Pair punch rows and upsert one attendance row per user-day; returns the day rows written"""
+    day_rows = pair_attendance_punches(punches, shift_map)
+    cursor.executemany('''INSERT INTO attendance 
+                         (userid, timestamp, punch_date, check_in, check_out, working_hours) 
+                         VALUES (?, ?, ?, ?, ?, ?) 
+                         ON CONFLICT(userid, punch_date) DO UPDATE SET 
+                             timestamp = excluded.timestamp, 
+                             check_in = excluded.check_in, 
+                             check_out = excluded.check_out, 
+                             working_hours = excluded.working_hours''', day_rows)
+    
+    # New punches leave their user-days due for the recalculation rules
+    cursor.executemany('INSERT OR IGNORE INTO attendance_dirty (userid, punch_date) VALUES (?, ?)', 
+                      [(row[0], row[2]) for row in day_rows])
+    return day_rows
+
+def ingest_device_punches(cursor, device_ip, device_port, records, shift_map):
+    """Store raw device punches and re-pair only the user-days that gained a punch; returns the records stored"""
+    new_records = insert_device_punches(cursor, device_ip, device_port, records)
+    if not new_records:
+        return new_records
+    
+    # One range read covering all touched days, then narrow to the touched user-days
+    touched_days = {(str(record.user_id), record.timestamp.strftime('%Y-%m-%d')) for record in new_records}
+    cursor.execute('''SELECT userid, punch_date as date, timestamp 
+                     FROM device_punches 
+                     WHERE punch_date >= ? AND punch_date <= ? 
+                     ORDER BY userid, punch_date, timestamp''', 
+                  (min(day for _, day in touched_days), max(day for _, day in touched_days)))
+    punches = [punch for punch in cursor.fetchall() 
+               if (str(punch['userid']), punch['date']) in touched_days]
+    
+    day_rows = upsert_paired_days(cursor, punches, shift_map)
+    
+    # Keep the daily rollup in step with the user-days just written
+    refresh_daily_rollup(cursor, {row[2] for row in day_rows})
+    logger.info("Updated %d daily attendance records", len(day_rows))
+    return new_records
+
+def rebuild_attendance(cursor, shift_map):
+    """Rebuild the attendance table from every stored device punch (explicit full sync); returns rows written"""
+    cursor.execute('DELETE FROM attendance')
+    cursor.execute('''SELECT userid, punch_date as date, timestamp 
+                     FROM device_punches 
+                     ORDER BY userid, punch_date, timestamp''')
+    day_rows = upsert_paired_days(cursor, cursor.fetchall(), shift_map)
+    refresh_daily_rollup(cursor)
+    logger.info("Rebuilt %d daily attendance records", len(day_rows))
+    return len(day_rows)
+
 @app.route('/holidays')
 @login_required
 def holidays():
@@ -2570,7 +3357,7 @@ def attendance_marking():
                a.check_in, a.check_out, a.working_hours as actual_hours
         FROM users u
         LEFT JOIN attendance_marking am ON u.userid = am.userid AND am.date = ?
-        LEFT JOIN attendance a ON u.userid = a.userid AND DATE(a.timestamp) = ?
+        LEFT JOIN attendance a ON u.userid = a.userid AND a.punch_date = ?
     '''
     
     params = [date_filter, date_filter]
@@ -2677,14 +3464,23 @@ def analytics():
     now = datetime.now()
     return render_template('analytics.html', now=now, timedelta=timedelta)
 
+# Insert a marking, or overwrite the existing one for that user-day and bump its row version
+ATTENDANCE_MARKING_UPSERT = '''INSERT INTO attendance_marking 
+    (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, marked_by)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(userid, date) DO UPDATE SET 
+        status = excluded.status, working_hours = excluded.working_hours, 
+        overtime_hours = excluded.overtime_hours, late_minutes = excluded.late_minutes, 
+        remarks = excluded.remarks, marked_by = excluded.marked_by, 
+        version = attendance_marking.version + 1'''
+
 @app.route('/api/attendance_marking', methods=['POST'])
 # @login_required  # Temporarily commented out for debugging
 def api_attendance_marking():
     """Mark attendance for a user - SIMPLE DIRECT METHOD"""
     try:
         data = request.get_json()
-        print(f"=== ATTENDANCE MARKING API CALLED ===")
-        print(f"Raw data received: {data}")
+        logger.debug("Attendance marking request: %s", data)
         
         userid = data.get('userid')
         date = data.get('date')
@@ -2694,85 +3490,31 @@ def api_attendance_marking():
         late_minutes = data.get('late_minutes', 0)
         remarks = data.get('remarks', '')
         
-        print(f"Parsed values:")
-        print(f"  userid: {userid} (type: {type(userid)})")
-        print(f"  date: {date} (type: {type(date)})")
-        print(f"  status: {status} (type: {type(status)})")
-        print(f"  working_hours: {working_hours}")
-        print(f"  overtime_hours: {overtime_hours}")
-        print(f"  late_minutes: {late_minutes}")
-        print(f"  remarks: {remarks}")
-        
         if not userid or not date or not status:
             error_msg = f"Missing required fields: userid={userid}, date={date}, status={status}"
-            print(f"ERROR: {error_msg}")
+            logger.warning("Attendance marking rejected: %s", error_msg)
             return jsonify({'success': False, 'message': error_msg})
         
         # Convert userid to integer if it's a string
         try:
             userid = int(userid)
         except (ValueError, TypeError):
-            print(f"ERROR: Invalid userid format: {userid}")
+            logger.warning("Attendance marking rejected: invalid userid format %r", userid)
             return jsonify({'success': False, 'message': f'Invalid userid format: {userid}'})
         
-        print(f"=== DATABASE OPERATION STARTING ===")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # First, let's check if the table exists and see its structure
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='attendance_marking'")
-        table_exists = cursor.fetchone()
-        print(f"Table attendance_marking exists: {table_exists is not None}")
-        
-        if table_exists:
-            cursor.execute("PRAGMA table_info(attendance_marking)")
-            columns = cursor.fetchall()
-            print(f"Table columns: {[col[1] for col in columns]}")
-        
-        # Check if marking already exists
-        cursor.execute('SELECT * FROM attendance_marking WHERE userid = ? AND date = ?', (userid, date))
-        existing = cursor.fetchone()
-        print(f"Existing marking found: {existing is not None}")
-        if existing:
-            print(f"Existing data: {dict(existing)}")
-        
-        # Use INSERT OR REPLACE for simplicity - this will either insert new or update existing
-        print(f"=== EXECUTING INSERT OR REPLACE ===")
-        
-        sql = '''INSERT OR REPLACE INTO attendance_marking 
-                 (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, marked_by)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
-        
-        values = (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, 'admin')
-        print(f"SQL: {sql}")
-        print(f"Values: {values}")
-        
-        cursor.execute(sql, values)
-        print(f"SQL executed successfully")
-        
-        # Commit the transaction
-        conn.commit()
-        print(f"Database committed successfully")
-        
-        # Verify the data was saved
-        cursor.execute('SELECT * FROM attendance_marking WHERE userid = ? AND date = ?', (userid, date))
-        saved_data = cursor.fetchone()
-        print(f"Verification query executed")
-        
-        if saved_data:
-            print(f"✓ Data verified successfully:")
-            print(f"  Saved data: {dict(saved_data)}")
-        else:
-            print(f"⚠️  WARNING: Data verification failed - no data found after save!")
-        
-        # Get total count for this user
-        cursor.execute('SELECT COUNT(*) FROM attendance_marking WHERE userid = ?', (userid,))
-        total_count = cursor.fetchone()[0]
-        print(f"Total markings for user {userid}: {total_count}")
+        def save(cursor):
+            # Insert a new marking or update the existing one (bumping its version)
+            cursor.execute(ATTENDANCE_MARKING_UPSERT, 
+                          (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, 'admin'))
+            
+            # Get total count for this user
+            cursor.execute('SELECT COUNT(*) FROM attendance_marking WHERE userid = ?', (userid,))
+            return cursor.fetchone()[0]
         
-        conn.close()
-        print(f"=== DATABASE OPERATION COMPLETED ===")
+        # Queued on the writer thread, which commits it with any other pending writes
+        total_count = db_writer.execute(save)
+        bump_data_version()
+        logger.debug("Marked user %s as %s on %s (%d markings in total)", userid, status, date, total_count)
         
         return jsonify({
             'success': True, 
@@ -2784,12 +3526,7 @@ def api_attendance_marking():
         })
         
     except Exception as e:
-        import traceback
-        print(f"=== ERROR IN ATTENDANCE MARKING API ===")
-        print(f"Error type: {type(e)}")
-        print(f"Error message: {str(e)}")
-        print(f"Full traceback:")
-        traceback.print_exc()
+        logger.exception("Error in attendance marking API")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
 
@@ -2829,14 +3566,9 @@ def api_holidays():
             if not date or not name:
                 return jsonify({'success': False, 'message': 'Missing required fields'})
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''INSERT INTO holidays (date, name, description, is_public_holiday)
-                             VALUES (?, ?, ?, ?)''', (date, name, description, is_public_holiday))
-            
-            conn.commit()
-            conn.close()
+            db_writer.execute(lambda cursor: cursor.execute(
+                '''INSERT INTO holidays (date, name, description, is_public_holiday)
+                   VALUES (?, ?, ?, ?)''', (date, name, description, is_public_holiday)))
             
             return jsonify({'success': True, 'message': 'Holiday added successfully'})
             
@@ -2858,15 +3590,10 @@ def api_holiday_management(holiday_id):
             if not date or not name:
                 return jsonify({'success': False, 'message': 'Missing required fields'})
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''UPDATE holidays 
-                             SET date = ?, name = ?, description = ?, is_public_holiday = ?
-                             WHERE id = ?''', (date, name, description, is_public_holiday, holiday_id))
-            
-            conn.commit()
-            conn.close()
+            db_writer.execute(lambda cursor: cursor.execute(
+                '''UPDATE holidays 
+                   SET date = ?, name = ?, description = ?, is_public_holiday = ?
+                   WHERE id = ?''', (date, name, description, is_public_holiday, holiday_id)))
             
             return jsonify({'success': True, 'message': 'Holiday updated successfully'})
             
@@ -2875,19 +3602,94 @@ def api_holiday_management(holiday_id):
     
     elif request.method == 'DELETE':
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM holidays WHERE id = ?', (holiday_id,))
-            
-            conn.commit()
-            conn.close()
+            db_writer.execute(lambda cursor: cursor.execute('DELETE FROM holidays WHERE id = ?', (holiday_id,)))
             
             return jsonify({'success': True, 'message': 'Holiday deleted successfully'})
             
         except Exception as e:
             return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+# Status codes stored in the payroll users x days grid (0 means no marking)
+PAYROLL_STATUS_CODES = {'present': 1, 'absent': 2, 'leave': 3}
+
+def calculate_monthly_payroll(cursor, month, year):
+    """Return salary_calculations rows for every user from a users x days grid of the month's markings"""
+    from array import array
+    
+    month_number = datetime.strptime(month, '%B').month
+    month_start, month_end = month_date_range(year, month_number)
+    first_day = datetime.strptime(month_start, '%Y-%m-%d')
+    days_in_month = (datetime.strptime(month_end, '%Y-%m-%d') - first_day).days
+    
+    # Working days are the weekdays (Monday to Friday) that are not holidays
+    cursor.execute('SELECT date FROM holidays WHERE date >= ? AND date < ?', (month_start, month_end))
+    holidays = {row['date'] for row in cursor.fetchall()}
+    
+    working_days = 0
+    for offset in range(days_in_month):
+        current_date = first_day + timedelta(days=offset)
+        if current_date.weekday() < 5 and current_date.strftime('%Y-%m-%d') not in holidays:
+            working_days += 1
+    
+    cursor.execute('SELECT userid, monthly_salary, working_hours_per_day FROM users')
+    users = cursor.fetchall()
+    user_index = {user['userid']: index for index, user in enumerate(users)}
+    
+    # Flat users x days grids, one cell per user-day
+    cell_count = len(users) * days_in_month
+    status_grid = array('b', bytes(cell_count))
+    hours_grid = array('d', [0.0]) * cell_count
+    overtime_grid = array('d', [0.0]) * cell_count
+    
+    present = PAYROLL_STATUS_CODES['present']
+    absent = PAYROLL_STATUS_CODES['absent']
+    leave = PAYROLL_STATUS_CODES['leave']
+    
+    # Load the whole month's markings with one range query
+    cursor.execute('''SELECT userid, date, status, working_hours, overtime_hours
+                     FROM attendance_marking 
+                     WHERE date >= ? AND date < ?''', (month_start, month_end))
+    for marking in cursor:
+        index = user_index.get(marking['userid'])
+        status = PAYROLL_STATUS_CODES.get(marking['status'])
+        if index is None or not status:
+            continue
+        
+        cell = index * days_in_month + int(marking['date'][8:10]) - 1
+        status_grid[cell] = status
+        if status == present:
+            hours_grid[cell] = marking['working_hours'] or users[index]['working_hours_per_day'] or 0.0
+            overtime_grid[cell] = marking['overtime_hours'] or 0.0
+    
+    # Reduce each user's row of the grids
+    payroll_rows = []
+    for index, user in enumerate(users):
+        row_start = index * days_in_month
+        row_end = row_start + days_in_month
+        statuses = status_grid[row_start:row_end]
+        
+        present_days = statuses.count(present)
+        absent_days = statuses.count(absent)
+        leave_days = statuses.count(leave)
+        total_working_hours = sum(hours_grid[row_start:row_end])
+        overtime_hours = sum(overtime_grid[row_start:row_end])
+        
+        # Calculate salary based on monthly salary
+        monthly_salary = user['monthly_salary'] or 0
+        daily_hours = user['working_hours_per_day']
+        daily_salary = monthly_salary / working_days if working_days > 0 else 0
+        basic_salary = present_days * daily_salary
+        overtime_pay = (overtime_hours / daily_hours) * daily_salary * 0.5 if daily_hours else 0  # 0.5x daily salary for overtime
+        deductions = absent_days * daily_salary  # Deduct for absent days
+        
+        net_salary = basic_salary + overtime_pay - deductions
+        
+        payroll_rows.append((user['userid'], month, year, working_days, present_days, absent_days, leave_days,
+                             total_working_hours, overtime_hours, basic_salary, overtime_pay,
+                             deductions, net_salary))
+    
+    return payroll_rows
+
 @app.route('/api/calculate_salary', methods=['POST'])
 @login_required
 def api_calculate_salary():
@@ -2900,81 +3702,17 @@ def api_calculate_salary():
         if not month or not year:
             return jsonify({'success': False, 'message': 'Missing month or year'})
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get all users
-        cursor.execute('SELECT userid, monthly_salary, working_hours_per_day FROM users')
-        users = cursor.fetchall()
-        
-        # Calculate working days in month
-        start_date = datetime(int(year), datetime.strptime(month, '%B').month, 1)
-        if start_date.month == 12:
-            end_date = datetime(int(year) + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = datetime(int(year), start_date.month + 1, 1) - timedelta(days=1)
-        
-        working_days = 0
-        current_date = start_date
-        while current_date <= end_date:
-            # Skip weekends
-            if current_date.weekday() < 5:  # Monday to Friday
-                # Check if it's a holiday
-                cursor.execute('SELECT * FROM holidays WHERE date = ?', (current_date.strftime('%Y-%m-%d'),))
-                if not cursor.fetchone():
-                    working_days += 1
-            current_date += timedelta(days=1)
-        
-        # Process each user
-        for user in users:
-            userid = user['userid']
-            monthly_salary = user['monthly_salary']
-            daily_hours = user['working_hours_per_day']
-            
-            # Get attendance marking for the month
-            cursor.execute('''SELECT status, working_hours, overtime_hours, late_minutes
-                             FROM attendance_marking 
-                             WHERE userid = ? AND strftime('%Y-%m', date) = ?''', 
-                          (userid, f"{year:04d}-{datetime.strptime(month, '%B').month:02d}"))
-            
-            monthly_attendance = cursor.fetchall()
-            
-            present_days = 0
-            absent_days = 0
-            leave_days = 0
-            total_working_hours = 0.0
-            overtime_hours = 0.0
-            
-            for record in monthly_attendance:
-                if record['status'] == 'present':
-                    present_days += 1
-                    total_working_hours += record['working_hours'] or daily_hours
-                    overtime_hours += record['overtime_hours'] or 0.0
-                elif record['status'] == 'absent':
-                    absent_days += 1
-                elif record['status'] == 'leave':
-                    leave_days += 1
-            
-            # Calculate salary based on monthly salary
-            daily_salary = monthly_salary / working_days if working_days > 0 else 0
-            basic_salary = present_days * daily_salary
-            overtime_pay = (overtime_hours / daily_hours) * daily_salary * 0.5  # 0.5x daily salary for overtime
-            deductions = absent_days * daily_salary  # Deduct for absent days
-            
-            net_salary = basic_salary + overtime_pay - deductions
+        def save(cursor):
+            payroll_rows = calculate_monthly_payroll(cursor, month, year)
             
-            # Insert or update salary calculation
-            cursor.execute('''INSERT OR REPLACE INTO salary_calculations 
-                             (userid, month, year, total_days, present_days, absent_days, leave_days,
-                              total_working_hours, overtime_hours, basic_salary, overtime_pay, 
-                              deductions, net_salary)
-                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                          (userid, month, year, working_days, present_days, absent_days, leave_days,
-                           total_working_hours, overtime_hours, basic_salary, overtime_pay, 
-                           deductions, net_salary))
-        
-        conn.commit()
-        conn.close()
+            # Insert or update every user's salary calculation in one batch
+            cursor.executemany('''INSERT OR REPLACE INTO salary_calculations 
+                                 (userid, month, year, total_days, present_days, absent_days, leave_days,
+                                  total_working_hours, overtime_hours, basic_salary, overtime_pay, 
+                                  deductions, net_salary)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', payroll_rows)
+        
+        db_writer.execute(save)
         
         return jsonify({'success': True, 'message': f'Salary calculated for {month} {year}'})
         
@@ -2999,37 +3737,54 @@ def api_monthly_attendance():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Build query for users
-        user_query = 'SELECT userid, name, company_name, shift_type, created_date FROM users'
+        # Build the user filter shared by the users, marking and attendance queries
+        user_conditions = []
         user_params = []
         
-        if company_id and employee_id:
-            user_query += ' WHERE company_id = ? AND userid = ?'
-            user_params.extend([company_id, employee_id])
-        elif company_id:
-            user_query += ' WHERE company_id = ?'
+        if company_id:
+            user_conditions.append('u.company_id = ?')
             user_params.append(company_id)
-        elif employee_id:
-            user_query += ' WHERE userid = ?'
+        if employee_id:
+            user_conditions.append('u.userid = ?')
             user_params.append(employee_id)
         
-        user_query += ' ORDER BY userid'
+        user_filter = ''.join(f' AND {condition}' for condition in user_conditions)
         
-        cursor.execute(user_query, user_params)
+        cursor.execute(f'''SELECT u.userid, u.name, u.company_name, u.shift_type, u.created_date 
+                          FROM users u WHERE 1=1{user_filter} 
+                          ORDER BY u.userid''', user_params)
         users = cursor.fetchall()
         
         # Get holidays for the month
-        month_start = f"{year:04d}-{month:02d}-01"
-        if month == 12:
-            month_end = f"{year+1:04d}-01-01"
-        else:
-            month_end = f"{year:04d}-{month+1:02d}-01"
+        month_start, month_end = month_date_range(year, month)
         
         cursor.execute('''SELECT date, name FROM holidays 
                          WHERE date >= ? AND date < ?''', (month_start, month_end))
         holidays = cursor.fetchall()
         
-        # Get attendance marking for the month
+        # Whole-month manual markings and attendance records, keyed by (userid, date)
+        cursor.execute(f'''SELECT m.userid, m.date, m.status, m.working_hours, m.overtime_hours, 
+                                  m.late_minutes, m.remarks
+                           FROM attendance_marking m 
+                           JOIN users u ON u.userid = m.userid 
+                           WHERE m.date >= ? AND m.date < ?{user_filter}''', 
+                      [month_start, month_end] + user_params)
+        manual_markings = {(row['userid'], row['date']): row for row in cursor.fetchall()}
+        
+        cursor.execute(f'''SELECT a.userid, a.punch_date, a.check_in, a.check_out, a.working_hours
+                           FROM attendance a 
+                           JOIN users u ON u.userid = a.userid 
+                           WHERE a.punch_date >= ? AND a.punch_date < ?{user_filter} 
+                           ORDER BY a.timestamp''', 
+                      [month_start, month_end] + user_params)
+        actual_records = {}
+        for row in cursor.fetchall():
+            actual_records.setdefault((row['userid'], row['punch_date']), row)
+        
+        days_in_month = (datetime.strptime(month_end, '%Y-%m-%d') - datetime.strptime(month_start, '%Y-%m-%d')).days
+        month_dates = [f"{year:04d}-{month:02d}-{day:02d}" for day in range(1, days_in_month + 1)]
+        
+        # Assemble each user's daily attendance in memory
         attendance_data = []
         for user in users:
             user_attendance = {
@@ -3043,12 +3798,7 @@ def api_monthly_attendance():
                 'daily_attendance': []
             }
             
-            # Get attendance for each day of the month
-            days_in_month = (datetime(year, month + 1, 1) - datetime(year, month, 1)).days
-            
-            for day in range(1, days_in_month + 1):
-                date_str = f"{year:04d}-{month:02d}-{day:02d}"
-                
+            for date_str in month_dates:
                 # Check if date is before employee join date
                 if user['created_date'] and date_str < user['created_date']:
                     # Employee hasn't joined yet - mark as NA
@@ -3064,23 +3814,11 @@ def api_monthly_attendance():
                     })
                     continue
                 
-                # First check if there's manual marking
-                cursor.execute('''SELECT status, working_hours, overtime_hours, late_minutes, remarks
-                                 FROM attendance_marking 
-                                 WHERE userid = ? AND date = ?''', (user['userid'], date_str))
-                
-                manual_marking = cursor.fetchone()
-                
-                # Then check actual attendance records
-                cursor.execute('''SELECT check_in, check_out, working_hours
-                                 FROM attendance 
-                                 WHERE userid = ? AND DATE(timestamp) = ?''', (user['userid'], date_str))
-                
-                actual_attendance = cursor.fetchone()
+                manual_marking = manual_markings.get((user['userid'], date_str))
+                actual_attendance = actual_records.get((user['userid'], date_str))
                 
                 if manual_marking:
                     # Use manual marking if available
-                    print(f"Using manual marking for user {user['userid']} on {date_str}: {manual_marking['status']}")  # Debug log
                     user_attendance['daily_attendance'].append({
                         'date': date_str,
                         'status': manual_marking['status'],
@@ -3093,7 +3831,6 @@ def api_monthly_attendance():
                     })
                 elif actual_attendance:
                     # Use actual attendance records
-                    print(f"Using actual attendance for user {user['userid']} on {date_str}")  # Debug log
                     user_attendance['daily_attendance'].append({
                         'date': date_str,
                         'status': '',  # Will be auto-marked by frontend
@@ -3106,7 +3843,6 @@ def api_monthly_attendance():
                     })
                 else:
                     # No attendance data
-                    print(f"No attendance data for user {user['userid']} on {date_str}")  # Debug log
                     user_attendance['daily_attendance'].append({
                         'date': date_str,
                         'status': '',
@@ -3122,14 +3858,6 @@ def api_monthly_attendance():
         
         conn.close()
         
-        # Debug: Print what we're returning
-        print(f"Returning attendance data for {len(attendance_data)} users")
-        for user_data in attendance_data[:2]:  # Show first 2 users
-            print(f"User {user_data['userid']} ({user_data['name']}): {len(user_data['daily_attendance'])} days")
-            for day in user_data['daily_attendance'][:5]:  # Show first 5 days
-                if day['status']:
-                    print(f"  {day['date']}: {day['status']}")
-        
         return jsonify({
             'success': True,
             'attendance': attendance_data,
@@ -3158,16 +3886,16 @@ def export_salary_excel():
         # Build query based on filters
         query = '''
             SELECT u.userid, u.name, u.company_name, u.monthly_salary,
-                   COUNT(DISTINCT DATE(a.timestamp)) as present_days,
-                   COUNT(DISTINCT DATE(a.timestamp)) as total_days,
+                   COUNT(DISTINCT a.punch_date) as present_days,
+                   COUNT(DISTINCT a.punch_date) as total_days,
                    SUM(a.working_hours) as total_working_hours,
                    SUM(CASE WHEN a.working_hours > 8 THEN a.working_hours - 8 ELSE 0 END) as overtime_hours
             FROM users u
             LEFT JOIN attendance a ON u.userid = a.userid 
-                AND strftime('%Y-%m', a.timestamp) = ?
+                AND a.punch_date >= ? AND a.punch_date < ?
             WHERE 1=1
         '''
-        params = [f"{year}-{month:02d}"]
+        params = list(month_date_range(year, month))
         
         if company_id:
             query += ' AND u.company_name = (SELECT name FROM companies WHERE id = ?)'
@@ -3177,62 +3905,33 @@ def export_salary_excel():
         query += ' ORDER BY u.name'
         
         cursor.execute(query, params)
-        records = cursor.fetchall()
-        conn.close()
+        first_record = cursor.fetchone()
         
-        if not records:
+        if not first_record:
+            conn.close()
             return jsonify({'success': False, 'message': 'No salary data found for the selected period'})
         
-        # Generate Excel file
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-        from io import BytesIO
-        
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"Salary Report - {month} {year}"
+        # Generate Excel file, streaming the rows straight from the cursor
+        export = ExcelExport()
+        ws = export.add_sheet(f"Salary Report - {month} {year}")
         
-        # Define styles
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Add title
-        ws.merge_cells('A1:L1')
-        title_cell = ws['A1']
-        title_cell.value = f"Salary Report - {month} {year}"
-        title_cell.font = Font(size=16, bold=True)
-        title_cell.alignment = Alignment(horizontal="center")
-        
-        # Add company info
-        ws.merge_cells('A2:L2')
-        company_cell = ws['A2']
-        company_cell.value = f"Company: {COMPANY_NAME}"
-        company_cell.font = Font(size=12)
-        company_cell.alignment = Alignment(horizontal="center")
+        ws.title(f"Salary Report - {month} {year}", 12)
+        ws.title(f"Company: {COMPANY_NAME}", 12, 'export_subtitle')
+        ws.blank()
         
         # Add headers
         headers = [
             'ID', 'Name', 'Company', 'Monthly Salary', 'Present Days', 'Total Days',
             'Working Hours', 'Overtime Hours', 'Basic Salary', 'Overtime Pay', 'Deductions', 'Net Salary'
         ]
+        ws.append(headers, 'export_header')
         
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=4, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
+        # Salary columns get a currency format, hours columns two decimals
+        row_styles = ['export_cell'] * 3 + ['export_currency', 'export_cell', 'export_cell',
+                      'export_hours', 'export_hours'] + ['export_currency'] * 4
         
         # Add data
-        for row, record in enumerate(records, 5):
+        for record in itertools.chain([first_record], cursor):
             # Calculate salary components
             monthly_salary = record['monthly_salary'] or 0
             present_days = record['present_days'] or 0
@@ -3256,8 +3955,7 @@ def export_salary_excel():
             # Calculate net salary
             net_salary = basic_salary + overtime_pay - deductions
             
-            # Add row data
-            row_data = [
+            ws.append([
                 record['userid'],
                 record['name'],
                 record['company_name'],
@@ -3270,49 +3968,11 @@ def export_salary_excel():
                 round(overtime_pay, 2),
                 round(deductions, 2),
                 round(net_salary, 2)
-            ]
-            
-            for col, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row, column=col, value=value)
-                cell.border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
-                
-                # Format numbers
-                if col in [4, 9, 10, 11, 12]:  # Salary columns
-                    cell.number_format = '#,##0.00'
-                elif col in [7, 8]:  # Hours columns
-                    cell.number_format = '0.00'
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+            ], row_styles)
         
-        # Save to BytesIO
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
+        conn.close()
         
-        # Return Excel file as response
-        from flask import send_file
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f'salary_report_{month}_{year}.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return export.send(f'salary_report_{month}_{year}.xlsx')
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error generating Excel: {str(e)}'})
@@ -3368,9 +4028,9 @@ def get_employee_attendance(user_id, year, month):
             end_date = f"{year:04d}-{month + 1:02d}-01"
         
         cursor.execute('''
-            SELECT DATE(timestamp) as date, check_in, check_out, working_hours
+            SELECT punch_date as date, check_in, check_out, working_hours
             FROM attendance 
-            WHERE userid = ? AND DATE(timestamp) >= ? AND DATE(timestamp) < ?
+            WHERE userid = ? AND punch_date >= ? AND punch_date < ?
             ORDER BY timestamp
         ''', (user_id, start_date, end_date))
         
@@ -3418,9 +4078,9 @@ def export_employee_attendance(user_id, year, month):
             end_date = f"{year:04d}-{month + 1:02d}-01"
         
         cursor.execute('''
-            SELECT DATE(timestamp) as date, check_in, check_out, working_hours
+            SELECT punch_date as date, check_in, check_out, working_hours
             FROM attendance 
-            WHERE userid = ? AND DATE(timestamp) >= ? AND DATE(timestamp) < ?
+            WHERE userid = ? AND punch_date >= ? AND punch_date < ?
             ORDER BY timestamp
         ''', (user_id, start_date, end_date))
         
@@ -3529,106 +4189,85 @@ def get_employees():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+def assign_holiday_markings(cursor, from_date, to_date, name, employee_ids=None, company_id=None):
+    """Mark every selected employee as on holiday for each day of a range; returns (inserted, updated)"""
+    # Days in the range come from a recursive CTE, employees from the selector
+    days = '''WITH RECURSIVE days(date) AS (
+                   SELECT date(?) UNION ALL
+                   SELECT date(date, '+1 day') FROM days WHERE date < date(?)
+               )'''
+    params = [from_date, to_date]
+    if employee_ids:
+        employee_filter = f"u.userid IN ({','.join('?' * len(employee_ids))})"
+        params.extend(employee_ids)
+    elif company_id:
+        employee_filter = 'u.company_id = ?'
+        params.append(company_id)
+    else:
+        employee_filter = '1'
+    
+    # Markings that already exist are overwritten rather than inserted
+    cursor.execute(days + f'''
+        SELECT COUNT(*) FROM days 
+        JOIN users u ON {employee_filter}
+        JOIN attendance_marking m ON m.userid = u.userid AND m.date = days.date''', params)
+    updated = cursor.fetchone()[0]
+    
+    cursor.execute(f'''
+        INSERT INTO attendance_marking 
+            (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, marked_by)
+        {days}
+        SELECT u.userid, days.date, 'holiday', 0, 0, 0, ?, 'admin'
+        FROM days JOIN users u ON {employee_filter}
+        WHERE 1
+        ON CONFLICT(userid, date) DO UPDATE SET 
+            status = 'holiday', working_hours = 0, overtime_hours = 0, late_minutes = 0, 
+            remarks = excluded.remarks, marked_by = excluded.marked_by, 
+            version = attendance_marking.version + 1''', params[:2] + [name] + params[2:])
+    # An upsert's rowcount covers both the inserted and the updated rows
+    return cursor.rowcount - updated, updated
+
 @app.route('/api/assign_holiday', methods=['POST'])
 @login_required
 def assign_holiday():
-    """Assign holiday to specific employees or company"""
+    """Assign a holiday over a date range to specific employees, a company or everyone"""
     try:
         data = request.get_json()
-        date = data.get('date')
+        from_date = data.get('from_date') or data.get('date')
+        to_date = data.get('to_date') or from_date
         name = data.get('name')
         company_id = data.get('company_id')
         employee_ids = data.get('employee_ids', [])
         
-        if not date or not name:
+        if not from_date or not name:
             return jsonify({'success': False, 'message': 'Date and name are required'})
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # If specific employees are selected, assign holiday to them
-        if employee_ids:
-            for userid in employee_ids:
-                # Check if holiday already exists for this employee and date
-                cursor.execute('''
-                    SELECT id FROM attendance_marking 
-                    WHERE userid = ? AND date = ? AND status = 'holiday'
-                ''', (userid, date))
-                
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # Update existing holiday marking
-                    cursor.execute('''
-                        UPDATE attendance_marking 
-                        SET remarks = ? 
-                        WHERE userid = ? AND date = ? AND status = 'holiday'
-                    ''', (name, userid, date))
-                else:
-                    # Create new holiday marking
-                    cursor.execute('''
-                        INSERT INTO attendance_marking 
-                        (userid, date, status, working_hours, overtime_hours, late_minutes, remarks)
-                        VALUES (?, ?, 'holiday', 0, 0, 0, ?)
-                    ''', (userid, date, name))
-        
-        # If company is selected, assign holiday to all employees in that company
-        elif company_id:
-            cursor.execute('''
-                SELECT userid FROM users WHERE company_id = ?
-            ''', (company_id,))
-            
-            company_employees = cursor.fetchall()
-            
-            for emp in company_employees:
-                userid = emp['userid']
-                
-                # Check if holiday already exists
-                cursor.execute('''
-                    SELECT id FROM attendance_marking 
-                    WHERE userid = ? AND date = ? AND status = 'holiday'
-                ''', (userid, date))
-                
-                existing = cursor.fetchone()
-                
-                if not existing:
-                    # Create new holiday marking
-                    cursor.execute('''
-                        INSERT INTO attendance_marking 
-                        (userid, date, status, working_hours, overtime_hours, late_minutes, remarks)
-                        VALUES (?, ?, 'holiday', 0, 0, 0, ?)
-                    ''', (userid, date, name))
-        
-        # If no specific employees or company, assign to all employees
-        else:
-            cursor.execute('SELECT userid FROM users')
-            all_employees = cursor.fetchall()
-            
-            for emp in all_employees:
-                userid = emp['userid']
-                
-                # Check if holiday already exists
-                cursor.execute('''
-                    SELECT id FROM attendance_marking 
-                    WHERE userid = ? AND date = ? AND status = 'holiday'
-                ''', (userid, date))
-                
-                existing = cursor.fetchone()
-                
-                if not existing:
-                    # Create new holiday marking
-                    cursor.execute('''
-                        INSERT INTO attendance_marking 
-                        (userid, date, status, working_hours, overtime_hours, late_minutes, remarks)
-                        VALUES (?, ?, 'holiday', 0, 0, 0, ?)
-                    ''', (userid, date, name))
-        
-        conn.commit()
-        conn.close()
-        
+        try:
+            start = datetime.strptime(from_date, '%Y-%m-%d')
+            end = datetime.strptime(to_date, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Dates must be in YYYY-MM-DD format'})
+        
+        from_date, to_date = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+        days = (end - start).days + 1
+        if days < 1:
+            return jsonify({'success': False, 'message': 'End date must not be before start date'})
+        if days > HOLIDAY_ASSIGN_MAX_DAYS:
+            return jsonify({'success': False, 'message': f'Holiday range is limited to {HOLIDAY_ASSIGN_MAX_DAYS} days'})
+        
+        # One set-based upsert for the whole range, committed as a single transaction
+        inserted, updated = db_writer.execute(assign_holiday_markings, from_date, to_date, name, 
+                                              employee_ids=employee_ids, company_id=company_id)
+        bump_data_version()
+        
+        period = from_date if from_date == to_date else f'{from_date} to {to_date}'
         return jsonify({
             'success': True,
-            'message': f'Holiday "{name}" assigned successfully for {date}'
+            'message': f'Holiday "{name}" assigned successfully for {period} '
+                       f'({inserted} added, {updated} updated)',
+            'days': days,
+            'inserted': inserted,
+            'updated': updated
         })
         
     except Exception as e:
@@ -3646,25 +4285,23 @@ def update_holiday_name():
         if not date or not name:
             return jsonify({'success': False, 'message': 'Date and name are required'})
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Update holiday names in attendance_marking table
-        cursor.execute('''
-            UPDATE attendance_marking 
-            SET remarks = ? 
-            WHERE date = ? AND status = 'holiday'
-        ''', (name, date))
-        
-        # Also update the holidays table if it exists
-        cursor.execute('''
-            UPDATE holidays 
-            SET name = ? 
-            WHERE date = ?
-        ''', (name, date))
+        def save(cursor):
+            # Update holiday names in attendance_marking table
+            cursor.execute('''
+                UPDATE attendance_marking 
+                SET remarks = ? 
+                WHERE date = ? AND status = 'holiday'
+            ''', (name, date))
+            
+            # Also update the holidays table if it exists
+            cursor.execute('''
+                UPDATE holidays 
+                SET name = ? 
+                WHERE date = ?
+            ''', (name, date))
         
-        conn.commit()
-        conn.close()
+        db_writer.execute(save)
+        bump_data_version()
         
         return jsonify({
             'success': True,
@@ -3686,14 +4323,10 @@ def clear_attendance_marking():
         if not userid or not date:
             return jsonify({'success': False, 'message': 'User ID and date are required'})
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Delete the attendance marking
-        cursor.execute('DELETE FROM attendance_marking WHERE userid = ? AND date = ?', (userid, date))
-        
-        conn.commit()
-        conn.close()
+        db_writer.execute(lambda cursor: cursor.execute(
+            'DELETE FROM attendance_marking WHERE userid = ? AND date = ?', (userid, date)))
+        bump_data_version()
         
         return jsonify({
             'success': True,
@@ -3715,14 +4348,11 @@ def test_insert_attendance():
         test_date = '2025-01-01'
         test_status = 'present'
         
-        # Insert test data
-        cursor.execute('''INSERT OR REPLACE INTO attendance_marking 
-                         (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, marked_by)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', 
-                      (test_userid, test_date, test_status, 8.0, 0.0, 0, 'Test data', 'system'))
-        
-        conn.commit()
-        print(f"Test data inserted: userid={test_userid}, date={test_date}, status={test_status}")
+        # Insert test data through the writer thread
+        db_writer.execute(lambda cursor: cursor.execute(ATTENDANCE_MARKING_UPSERT, 
+            (test_userid, test_date, test_status, 8.0, 0.0, 0, 'Test data', 'system')))
+        bump_data_version()
+        logger.debug("Test data inserted: userid=%s, date=%s, status=%s", test_userid, test_date, test_status)
         
         # Retrieve test data
         cursor.execute('SELECT * FROM attendance_marking WHERE userid = ? AND date = ?', (test_userid, test_date))
@@ -3804,7 +4434,7 @@ def echo():
     """Simple echo endpoint for testing"""
     try:
         data = request.get_json()
-        print(f"Echo received: {data}")
+        logger.debug("Echo received: %s", data)
         return jsonify({
             'success': True,
             'message': 'Echo successful',
@@ -3840,7 +4470,7 @@ def export_attendance_csv():
                    FROM attendance a 
                    JOIN users u ON a.userid = u.userid 
                    LEFT JOIN companies c ON u.company_id = c.id
-                   WHERE DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ?'''
+                   WHERE a.punch_date >= ? AND a.punch_date <= ?'''
         
         params = [from_date, to_date]
         
@@ -3854,41 +4484,54 @@ def export_attendance_csv():
         
         query += ' ORDER BY a.timestamp DESC'
         
-        records = conn.execute(query, params).fetchall()
-        conn.close()
+        cursor = conn.execute(query, params)
+        first_record = cursor.fetchone()
         
-        if not records:
+        if not first_record:
+            conn.close()
             return jsonify({'success': False, 'message': 'No data found for the specified period'})
         
-        # Create CSV content
-        import csv
-        import io
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        writer.writerow(['Employee Name', 'Employee ID', 'Date', 'Check In', 'Check Out', 'Working Hours', 'Company'])
-        
-        # Write data
-        for record in records:
-            writer.writerow([
-                record['name'],
-                record['userid'],
-                record['timestamp'],
-                record['check_in'],
-                record['check_out'],
-                record['working_hours'],
-                record['company_name']
-            ])
+        # Gzip is opt-in (?gzip=1) and only used when the client accepts it
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes') and \
+            'gzip' in request.accept_encodings
+        
+        def generate():
+            """Stream the CSV from the cursor in CSV_EXPORT_CHUNK_ROWS batches"""
+            def records():
+                yield first_record
+                while True:
+                    batch = cursor.fetchmany(CSV_EXPORT_CHUNK_ROWS)
+                    if not batch:
+                        break
+                    yield from batch
+            
+            try:
+                yield from iter_csv_chunks(
+                    ['Employee Name', 'Employee ID', 'Date', 'Check In', 'Check Out', 'Working Hours', 'Company'],
+                    ([
+                        record['name'],
+                        record['userid'],
+                        record['timestamp'],
+                        record['check_in'],
+                        record['check_out'],
+                        record['working_hours'],
+                        record['company_name']
+                    ] for record in records()),
+                    compress
+                )
+            finally:
+                conn.close()
         
-        output.seek(0)
+        headers = {'Content-Disposition': f'attachment; filename=attendance_report_{from_date}_to_{to_date}.csv'}
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
         
-        from flask import Response
+        from flask import Response, stream_with_context
         return Response(
-            output.getvalue(),
+            stream_with_context(generate()),
             mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=attendance_report_{from_date}_to_{to_date}.csv'}
+            headers=headers
         )
         
     except Exception as e:
@@ -3917,7 +4560,7 @@ def export_attendance_excel():
                    a.timestamp, a.check_in, a.check_out, a.working_hours
             FROM users u
             LEFT JOIN attendance a ON u.userid = a.userid 
-                AND DATE(a.timestamp) BETWEEN ? AND ?
+                AND a.punch_date BETWEEN ? AND ?
             WHERE 1=1
         '''
         params = [start_date, end_date]
@@ -3929,67 +4572,36 @@ def export_attendance_excel():
         query += ' ORDER BY u.name, a.timestamp'
         
         cursor.execute(query, params)
-        records = cursor.fetchall()
-        conn.close()
+        first_record = cursor.fetchone()
         
-        if not records:
+        if not first_record:
+            conn.close()
             return jsonify({'success': False, 'message': 'No attendance data found for the selected period'})
         
-        # Generate Excel file
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-        from io import BytesIO
-        
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"Attendance Report - {start_date} to {end_date}"
+        # Generate Excel file, streaming the rows straight from the cursor
+        export = ExcelExport()
+        ws = export.add_sheet(f"Attendance Report - {start_date} to {end_date}")
         
-        # Define styles
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Add title
-        ws.merge_cells('A1:H1')
-        title_cell = ws['A1']
-        title_cell.value = f"Attendance Report - {start_date} to {end_date}"
-        title_cell.font = Font(size=16, bold=True)
-        title_cell.alignment = Alignment(horizontal="center")
-        
-        # Add company info
-        ws.merge_cells('A2:H2')
-        company_cell = ws['A2']
-        company_cell.value = f"Company: {COMPANY_NAME}"
-        company_cell.font = Font(size=12)
-        company_cell.alignment = Alignment(horizontal="center")
+        ws.title(f"Attendance Report - {start_date} to {end_date}", 8)
+        ws.title(f"Company: {COMPANY_NAME}", 8, 'export_subtitle')
+        ws.blank()
         
         # Add headers
         headers = [
             'ID', 'Name', 'Company', 'Shift Type', 'Date', 'Check In', 'Check Out', 'Working Hours'
         ]
+        ws.append(headers, 'export_header')
         
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=4, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
+        row_styles = ['export_cell'] * 7 + ['export_hours']
         
         # Add data
-        for row, record in enumerate(records, 5):
+        for record in itertools.chain([first_record], cursor):
             # Format date and times
             date_str = record['timestamp'].split(' ')[0] if record['timestamp'] else ''
             check_in = record['check_in'].split(' ')[1] if record['check_in'] else ''
             check_out = record['check_out'].split(' ')[1] if record['check_out'] else ''
             
-            row_data = [
+            ws.append([
                 record['userid'],
                 record['name'],
                 record['company_name'],
@@ -3998,47 +4610,11 @@ def export_attendance_excel():
                 check_in,
                 check_out,
                 round(record['working_hours'], 2) if record['working_hours'] else 0
-            ]
-            
-            for col, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row, column=col, value=value)
-                cell.border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
-                
-                # Format numbers
-                if col == 8:  # Working hours column
-                    cell.number_format = '0.00'
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+            ], row_styles)
         
-        # Save to BytesIO
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
+        conn.close()
         
-        # Return Excel file as response
-        from flask import send_file
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f'attendance_report_{start_date}_to_{end_date}.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return export.send(f'attendance_report_{start_date}_to_{end_date}.xlsx')
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error generating Excel: {str(e)}'})
@@ -4053,63 +4629,32 @@ def export_users_excel():
         cursor.execute('''SELECT userid, name, company_name, shift_type, shift_start_time, 
                                 shift_end_time, working_hours_per_day, monthly_salary, created_date
                          FROM users ORDER BY name''')
-        users = cursor.fetchall()
-        conn.close()
+        first_user = cursor.fetchone()
         
-        if not users:
+        if not first_user:
+            conn.close()
             return jsonify({'success': False, 'message': 'No users found'})
         
-        # Generate Excel file
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-        from io import BytesIO
-        
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Users Report"
-        
-        # Define styles
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
+        # Generate Excel file, streaming the rows straight from the cursor
+        export = ExcelExport()
+        ws = export.add_sheet("Users Report")
         
-        # Add title
-        ws.merge_cells('A1:I1')
-        title_cell = ws['A1']
-        title_cell.value = "Employee Master List"
-        title_cell.font = Font(size=16, bold=True)
-        title_cell.alignment = Alignment(horizontal="center")
-        
-        # Add company info
-        ws.merge_cells('A2:I2')
-        company_cell = ws['A2']
-        company_cell.value = f"Company: {COMPANY_NAME}"
-        company_cell.font = Font(size=12)
-        company_cell.alignment = Alignment(horizontal="center")
+        ws.title("Employee Master List", 9)
+        ws.title(f"Company: {COMPANY_NAME}", 9, 'export_subtitle')
+        ws.blank()
         
         # Add headers
         headers = [
             'ID', 'Name', 'Company', 'Shift Type', 'Shift Start', 'Shift End', 
             'Daily Hours', 'Monthly Salary', 'Created Date'
         ]
+        ws.append(headers, 'export_header')
         
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=4, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
+        row_styles = ['export_cell'] * 6 + ['export_decimal', 'export_currency', 'export_cell']
         
         # Add data
-        for row, user in enumerate(users, 5):
-            row_data = [
+        for user in itertools.chain([first_user], cursor):
+            ws.append([
                 user['userid'],
                 user['name'],
                 user['company_name'],
@@ -4119,49 +4664,11 @@ def export_users_excel():
                 user['working_hours_per_day'],
                 user['monthly_salary'],
                 user['created_date']
-            ]
-            
-            for col, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row, column=col, value=value)
-                cell.border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
-                
-                # Format numbers
-                if col == 8:  # Monthly salary column
-                    cell.number_format = '#,##0.00'
-                elif col == 7:  # Daily hours column
-                    cell.number_format = '0.0'
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+            ], row_styles)
         
-        # Save to BytesIO
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
+        conn.close()
         
-        # Return Excel file as response
-        from flask import send_file
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name='users_export.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return export.send('users_export.xlsx')
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error generating Excel: {str(e)}'})
@@ -4240,6 +4747,33 @@ def get_analytics_companies():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+@app.route('/api/analytics/bundle', methods=['POST'])
+@login_required
+def get_analytics_bundle_api():
+    """Get every analytics widget's data in one response"""
+    try:
+        data = request.get_json()
+        company = data.get('company')
+        from_date = data.get('fromDate')
+        to_date = data.get('toDate')
+        shift = data.get('shift')
+        
+        bundle = compute_analytics(company, from_date, to_date, shift)
+        return jsonify({'success': True, 'data': bundle})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/api/analytics/cache-stats', methods=['GET'])
+@login_required
+def get_analytics_cache_stats_api():
+    """Get analytics cache hit rate and size"""
+    try:
+        return jsonify({'success': True, 'stats': analytics_cache.stats()})
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
 @app.route('/api/analytics/quick-stats', methods=['POST'])
 @login_required
 def get_analytics_quick_stats_api():
@@ -4251,7 +4785,7 @@ def get_analytics_quick_stats_api():
         to_date = data.get('toDate')
         shift = data.get('shift')
         
-        stats = get_analytics_quick_stats(company, from_date, to_date, shift)
+        stats = compute_analytics(company, from_date, to_date, shift)['quickStats']
         return jsonify({'success': True, 'stats': stats})
         
     except Exception as e:
@@ -4268,7 +4802,7 @@ def get_analytics_attendance_trend_api():
         to_date = data.get('toDate')
         shift = data.get('shift')
         
-        chart_data = get_attendance_trend_data(company, from_date, to_date, shift)
+        chart_data = compute_analytics(company, from_date, to_date, shift)['attendanceTrend']
         return jsonify({'success': True, 'data': chart_data})
         
     except Exception as e:
@@ -4279,7 +4813,7 @@ def get_analytics_attendance_trend_api():
 def get_analytics_company_distribution_api():
     """Get company distribution data for pie chart"""
     try:
-        chart_data = get_company_distribution_data()
+        chart_data = compute_analytics()['companyDistribution']
         return jsonify({'success': True, 'data': chart_data})
         
     except Exception as e:
@@ -4296,7 +4830,7 @@ def get_analytics_working_hours_api():
         to_date = data.get('toDate')
         shift = data.get('shift')
         
-        chart_data = get_working_hours_data(company, from_date, to_date, shift)
+        chart_data = compute_analytics(company, from_date, to_date, shift)['workingHours']
         return jsonify({'success': True, 'data': chart_data})
         
     except Exception as e:
@@ -4313,7 +4847,7 @@ def get_analytics_overtime_trend_api():
         to_date = data.get('toDate')
         shift = data.get('shift')
         
-        chart_data = get_overtime_trend_data(company, from_date, to_date, shift)
+        chart_data = compute_analytics(company, from_date, to_date, shift)['overtimeTrend']
         return jsonify({'success': True, 'data': chart_data})
         
     except Exception as e:
@@ -4330,7 +4864,7 @@ def get_analytics_performance_table_api():
         to_date = data.get('toDate')
         shift = data.get('shift')
         
-        performance_data = get_performance_table_data(company, from_date, to_date, shift)
+        performance_data = compute_analytics(company, from_date, to_date, shift)['performance']
         return jsonify({'success': True, 'data': performance_data})
         
     except Exception as e:
@@ -4347,90 +4881,55 @@ def export_analytics_excel():
         to_date = data.get('toDate')
         shift = data.get('shift')
         
-        # Get all analytics data
-        quick_stats = get_analytics_quick_stats(company, from_date, to_date, shift)
-        attendance_trend = get_attendance_trend_data(company, from_date, to_date, shift)
-        performance_data = get_performance_table_data(company, from_date, to_date, shift)
+        # Get all analytics data from one pass
+        bundle = compute_analytics(company, from_date, to_date, shift)
+        quick_stats = bundle['quickStats']
+        performance_data = bundle['performance']
         
         # Create Excel workbook
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from openpyxl.utils import get_column_letter
-        
-        wb = Workbook()
+        export = ExcelExport()
         
         # Summary sheet
-        ws1 = wb.active
-        ws1.title = "Summary"
+        ws1 = export.add_sheet("Summary")
         
         # Add title
-        ws1['A1'] = f"Analytics Report - {COMPANY_NAME}"
-        ws1['A1'].font = Font(size=16, bold=True)
-        ws1.merge_cells('A1:D1')
+        ws1.title(f"Analytics Report - {COMPANY_NAME}", 4)
+        ws1.blank()
         
         # Add filters
-        ws1['A3'] = "Filters Applied:"
-        ws1['A3'].font = Font(bold=True)
-        ws1['A4'] = f"Company: {company if company else 'All'}"
-        ws1['A5'] = f"Date Range: {from_date} to {to_date}"
-        ws1['A6'] = f"Shift: {shift if shift else 'All'}"
+        ws1.append(["Filters Applied:"], 'export_label')
+        ws1.append([f"Company: {company if company else 'All'}"])
+        ws1.append([f"Date Range: {from_date} to {to_date}"])
+        ws1.append([f"Shift: {shift if shift else 'All'}"])
+        ws1.blank()
         
         # Add quick stats
-        ws1['A8'] = "Quick Statistics"
-        ws1['A8'].font = Font(bold=True, size=14)
-        ws1['A9'] = "Total Employees"
-        ws1['B9'] = quick_stats['totalEmployees']
-        ws1['A10'] = "Present Today"
-        ws1['B10'] = quick_stats['presentToday']
-        ws1['A11'] = "Late Today"
-        ws1['B11'] = quick_stats['lateToday']
-        ws1['A12'] = "Average Working Hours"
-        ws1['B12'] = quick_stats['avgWorkingHours']
+        ws1.append(["Quick Statistics"], 'export_section')
+        ws1.append(["Total Employees", quick_stats['totalEmployees']])
+        ws1.append(["Present Today", quick_stats['presentToday']])
+        ws1.append(["Late Today", quick_stats['lateToday']])
+        ws1.append(["Average Working Hours", quick_stats['avgWorkingHours']])
         
         # Performance sheet
-        ws2 = wb.create_sheet("Performance")
+        ws2 = export.add_sheet("Performance")
         
         # Add headers
         headers = ['Employee', 'Company', 'Attendance Rate %', 'Avg Working Hours', 'Overtime Hours', 'Late Arrivals', 'Performance Score']
-        for col, header in enumerate(headers, 1):
-            cell = ws2.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+        ws2.append(headers, 'export_header_grey')
         
         # Add data
-        for row, employee in enumerate(performance_data, 2):
-            ws2.cell(row=row, column=1, value=employee['name'])
-            ws2.cell(row=row, column=2, value=employee['company_name'])
-            ws2.cell(row=row, column=3, value=employee['attendanceRate'])
-            ws2.cell(row=row, column=4, value=employee['avgWorkingHours'])
-            ws2.cell(row=row, column=5, value=employee['overtimeHours'])
-            ws2.cell(row=row, column=6, value=employee['lateArrivals'])
-            ws2.cell(row=row, column=7, value=employee['performanceScore'])
-        
-        # Auto-adjust column widths
-        for sheet in [ws1, ws2]:
-            for column in sheet.columns:
-                max_length = 0
-                column_letter = get_column_letter(column[0].column)
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                sheet.column_dimensions[column_letter].width = adjusted_width
-        
-        # Save to temporary file
-        import tempfile
-        import os
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-            wb.save(tmp.name)
-            tmp_path = tmp.name
+        for employee in performance_data:
+            ws2.append([
+                employee['name'],
+                employee['company_name'],
+                employee['attendanceRate'],
+                employee['avgWorkingHours'],
+                employee['overtimeHours'],
+                employee['lateArrivals'],
+                employee['performanceScore']
+            ])
         
-        return send_file(tmp_path, as_attachment=True, 
-                        download_name=f'analytics_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
+        return export.send(f'analytics_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error exporting analytics: {str(e)}'})
@@ -4522,8 +5021,6 @@ def send_test_email():
 def api_test_device_connection():
     """Test connection to biometric device"""
     try:
-        print(f"=== TEST DEVICE CONNECTION API CALLED ===")
-        
         # Try to connect to device
         try:
             from zk import ZK
@@ -4540,31 +5037,28 @@ def api_test_device_connection():
                 }
                 conn.disconnect()
                 
-                print(f"✓ Device connected successfully: {device_info}")
+                logger.info("Device connected successfully: %s", device_info)
                 return jsonify({
                     'success': True,
                     'message': 'Device connected successfully',
                     'device_info': f"ESSL Identix K90 - {device_info.get('name', 'Connected')}"
                 })
             else:
-                print(f"⚠️ Could not establish connection to device")
+                logger.warning("Could not establish connection to device")
                 return jsonify({
                     'success': False,
                     'message': 'Could not establish connection to device'
                 })
                 
         except Exception as e:
-            print(f"⚠️ Device connection error: {str(e)}")
+            logger.warning("Device connection error: %s", e)
             return jsonify({
                 'success': False,
                 'message': f'Device connection error: {str(e)}'
             })
             
     except Exception as e:
-        import traceback
-        print(f"=== ERROR IN TEST DEVICE CONNECTION API ===")
-        print(f"Error: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in test device connection API")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
 @app.route('/api/get_attendance')
@@ -4577,21 +5071,9 @@ def api_get_attendance():
         if not userid or not date:
             return jsonify({'success': False, 'message': 'Missing userid or date'})
         
-        print(f"=== GET ATTENDANCE API CALLED ===")
-        print(f"userid: {userid}, date: {date}")
-        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='attendance_marking'")
-        table_exists = cursor.fetchone()
-        print(f"Table exists: {table_exists is not None}")
-        
-        if not table_exists:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Attendance marking table does not exist'})
-        
         # Get attendance data
         cursor.execute('''SELECT * FROM attendance_marking 
                          WHERE userid = ? AND date = ?''', (userid, date))
@@ -4600,7 +5082,6 @@ def api_get_attendance():
         conn.close()
         
         if attendance:
-            print(f"Found attendance: {dict(attendance)}")
             return jsonify({
                 'success': True,
                 'attendance': {
@@ -4615,14 +5096,47 @@ def api_get_attendance():
                 }
             })
         else:
-            print(f"No attendance found for user {userid} on {date}")
             return jsonify({'success': True, 'attendance': None})
         
     except Exception as e:
-        import traceback
-        print(f"=== ERROR IN GET ATTENDANCE API ===")
-        print(f"Error: {str(e)}")
-        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+ATTENDANCE_RANGE_COLUMNS = ['userid', 'date', 'status', 'working_hours', 'overtime_hours', 'late_minutes', 'remarks', 
+                            'version']
+
+@app.route('/api/get_attendance_range', methods=['POST'])
+def api_get_attendance_range():
+    """Get attendance markings for a set of users over a date range in one response"""
+    try:
+        data = request.get_json()
+        from_date = data.get('from_date')
+        to_date = data.get('to_date')
+        userids = [int(userid) for userid in data.get('userids') or []]
+        
+        if not from_date or not to_date:
+            return jsonify({'success': False, 'message': 'Missing from_date or to_date'})
+        
+        query = f'''SELECT {', '.join(ATTENDANCE_RANGE_COLUMNS)} 
+                    FROM attendance_marking 
+                    WHERE date >= ? AND date <= ?'''
+        params = [from_date, to_date]
+        
+        if userids:
+            query += f" AND userid IN ({', '.join('?' * len(userids))})"
+            params.extend(userids)
+        
+        conn = get_db_connection()
+        rows = conn.execute(query + ' ORDER BY userid, date', params).fetchall()
+        conn.close()
+        
+        # Rows are returned as arrays in ATTENDANCE_RANGE_COLUMNS order to keep the payload small
+        return jsonify({
+            'success': True,
+            'columns': ATTENDANCE_RANGE_COLUMNS,
+            'rows': [list(row) for row in rows]
+        })
+        
+    except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
 @app.route('/api/test_simple_save', methods=['POST'])
@@ -4630,54 +5144,46 @@ def api_test_simple_save():
     """Simple test endpoint to verify database saving works"""
     try:
         data = request.get_json()
-        print(f"=== TEST SIMPLE SAVE API CALLED ===")
-        print(f"Data received: {data}")
+        logger.debug("Test simple save request: %s", data)
         
         userid = data.get('userid', 1)
         date = data.get('date', '2024-01-01')
         status = data.get('status', 'present')
         
-        print(f"Test values: userid={userid}, date={date}, status={status}")
-        
         conn = get_db_connection()
         cursor = conn.cursor()
         
         # Check if table exists
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='attendance_marking'")
         table_exists = cursor.fetchone()
-        print(f"Table exists: {table_exists is not None}")
+        logger.debug("Table exists: %s", table_exists is not None)
         
         if table_exists:
             # Check table structure
             cursor.execute("PRAGMA table_info(attendance_marking)")
             columns = cursor.fetchall()
-            print(f"Table columns: {[col[1] for col in columns]}")
-            
-            # Try to insert a test record
-            sql = '''INSERT OR REPLACE INTO attendance_marking 
-                     (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, marked_by)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+            logger.debug("Table columns: %s", [col[1] for col in columns])
             
+            # Try to insert a test record through the writer thread
             values = (userid, date, status, 8.0, 0.0, 0, 'Test entry', 'test')
-            print(f"Executing: {sql}")
-            print(f"Values: {values}")
+            logger.debug("Executing: %s with %s", ATTENDANCE_MARKING_UPSERT, values)
             
-            cursor.execute(sql, values)
-            conn.commit()
-            print(f"✓ Test record inserted successfully")
+            db_writer.execute(lambda write_cursor: write_cursor.execute(ATTENDANCE_MARKING_UPSERT, values))
+            bump_data_version()
+            logger.debug("Test record inserted")
             
             # Verify it was saved
             cursor.execute('SELECT * FROM attendance_marking WHERE userid = ? AND date = ?', (userid, date))
             saved = cursor.fetchone()
             if saved:
-                print(f"✓ Verification successful: {dict(saved)}")
+                logger.debug("Verification successful: %s", dict(saved))
             else:
-                print(f"⚠️ Verification failed - no record found")
+                logger.warning("Test save verification failed - no record found")
             
             # Get total count
             cursor.execute('SELECT COUNT(*) FROM attendance_marking')
             total = cursor.fetchone()[0]
-            print(f"Total records in table: {total}")
+            logger.debug("Total records in table: %d", total)
         
         conn.close()
         
@@ -4689,135 +5195,153 @@ def api_test_simple_save():
         })
         
     except Exception as e:
-        import traceback
-        print(f"=== ERROR IN TEST SIMPLE SAVE ===")
-        print(f"Error: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in test simple save API")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+def save_attendance_changes(cursor, changes):
+    """Apply marking changes whose row version is still current; returns (saved, conflicts)"""
+    userids = sorted({change[0] for change in changes})
+    dates = [change[1] for change in changes]
+    
+    # Current version of every cell the save touches (a missing cell is version 0)
+    cursor.execute(f'''SELECT userid, date, status, version FROM attendance_marking 
+                       WHERE date >= ? AND date <= ? AND userid IN ({', '.join('?' * len(userids))})''', 
+                   [min(dates), max(dates)] + userids)
+    current = {(row['userid'], row['date']): row for row in cursor.fetchall()}
+    
+    saved = []
+    conflicts = []
+    rows = []
+    for userid, date, status, working_hours, overtime_hours, late_minutes, remarks, version in changes:
+        existing = current.get((userid, date))
+        current_version = existing['version'] if existing else 0
+        
+        # Someone else saved this cell after the client loaded it: report it instead of overwriting
+        if current_version != version:
+            conflicts.append({'userid': userid, 'date': date, 'version': current_version, 
+                              'status': existing['status'] if existing else None})
+            continue
+        
+        rows.append((userid, date, status, working_hours, overtime_hours, late_minutes, remarks, 'admin'))
+        saved.append({'userid': userid, 'date': date, 'version': current_version + 1})
+    
+    cursor.executemany(ATTENDANCE_MARKING_UPSERT, rows)
+    return saved, conflicts
+
 @app.route('/api/save_monthly_attendance', methods=['POST'])
 @login_required
 def api_save_monthly_attendance():
-    """Save all monthly attendance data - SIMPLE DIRECT METHOD"""
+    """Save the changed monthly attendance cells, each checked against the row version it was loaded with"""
     try:
         data = request.get_json()
-        print(f"=== SAVE MONTHLY ATTENDANCE API CALLED ===")
-        print(f"Raw data received: {data}")
-        
-        if not data or 'attendance_data' not in data:
-            error_msg = "No attendance_data field in request"
-            print(f"ERROR: {error_msg}")
-            return jsonify({'success': False, 'message': error_msg})
+        changes = (data or {}).get('changes')
         
-        attendance_data = data['attendance_data']
-        print(f"Attendance data array length: {len(attendance_data) if attendance_data else 0}")
+        if not changes:
+            return jsonify({'success': False, 'message': 'No changes to save'})
         
-        if not attendance_data:
-            return jsonify({'success': False, 'message': 'Empty attendance data array'})
-        
-        print(f"=== DATABASE OPERATION STARTING ===")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check table structure
-        cursor.execute("PRAGMA table_info(attendance_marking)")
-        columns = cursor.fetchall()
-        print(f"Table columns: {[col[1] for col in columns]}")
-        
-        saved_count = 0
-        error_count = 0
+        # Later changes to the same cell win within one save
+        rows = {}
         errors = []
-        
-        for i, entry in enumerate(attendance_data):
+        for i, change in enumerate(changes):
+            userid = change.get('userid')
+            date = change.get('date')
+            status = change.get('status')
+            
+            if not userid or not date or not status:
+                errors.append(f"Missing required fields in change {i+1}: userid={userid}, date={date}, status={status}")
+                continue
+            
             try:
-                print(f"--- Processing entry {i+1}/{len(attendance_data)} ---")
-                print(f"Entry data: {entry}")
-                
-                userid = entry.get('userid')
-                date = entry.get('date')
-                status = entry.get('status')
-                working_hours = entry.get('working_hours', 0.0)
-                overtime_hours = entry.get('overtime_hours', 0.0)
-                late_minutes = entry.get('late_minutes', 0)
-                remarks = entry.get('remarks', '')
-                
-                print(f"Parsed values:")
-                print(f"  userid: {userid} (type: {type(userid)})")
-                print(f"  date: {date} (type: {type(date)})")
-                print(f"  status: {status} (type: {type(status)})")
-                
-                if not userid or not date or not status:
-                    error_msg = f"Missing required fields in entry {i+1}: userid={userid}, date={date}, status={status}"
-                    print(f"ERROR: {error_msg}")
-                    errors.append(error_msg)
-                    error_count += 1
-                    continue
-                
-                # Convert userid to integer
-                try:
-                    userid = int(userid)
-                except (ValueError, TypeError):
-                    error_msg = f"Invalid userid format in entry {i+1}: {userid}"
-                    print(f"ERROR: {error_msg}")
-                    errors.append(error_msg)
-                    error_count += 1
-                    continue
-                
-                # Use INSERT OR REPLACE for simplicity
-                sql = '''INSERT OR REPLACE INTO attendance_marking 
-                         (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, marked_by)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
-                
-                values = (userid, date, status, working_hours, overtime_hours, late_minutes, remarks, 'admin')
-                print(f"Executing SQL: {sql}")
-                print(f"With values: {values}")
-                
-                cursor.execute(sql, values)
-                print(f"✓ Entry {i+1} saved successfully")
-                
-                saved_count += 1
-                
-            except Exception as e:
-                error_msg = f"Error processing entry {i+1}: {str(e)}"
-                print(f"ERROR: {error_msg}")
-                errors.append(error_msg)
-                error_count += 1
-        
-        print(f"=== COMMITTING TRANSACTION ===")
-        conn.commit()
-        print(f"✓ Database committed successfully")
-        
-        # Verify some saved data
-        if saved_count > 0:
-            cursor.execute('SELECT COUNT(*) FROM attendance_marking')
-            total_markings = cursor.fetchone()[0]
-            print(f"Total markings in database: {total_markings}")
+                userid = int(userid)
+                version = int(change.get('version') or 0)
+            except (ValueError, TypeError):
+                errors.append(f"Invalid userid or version in change {i+1}: {userid}")
+                continue
+            
+            rows[(userid, date)] = (userid, date, status, change.get('working_hours', 0.0), 
+                                    change.get('overtime_hours', 0.0), change.get('late_minutes', 0), 
+                                    change.get('remarks', ''), version)
         
-        conn.close()
-        print(f"=== DATABASE OPERATION COMPLETED ===")
+        saved, conflicts = [], []
+        if rows:
+            saved, conflicts = db_writer.execute(save_attendance_changes, list(rows.values()))
+        if saved:
+            bump_data_version()
+        logger.info("Saved %d monthly attendance changes (%d conflicts, %d errors)", 
+                    len(saved), len(conflicts), len(errors))
         
-        message = f'Successfully saved {saved_count} attendance records'
-        if error_count > 0:
-            message += f', {error_count} errors encountered'
+        message = f'Successfully saved {len(saved)} attendance records'
+        if conflicts:
+            message += f', {len(conflicts)} changed by someone else since they were loaded'
+        if errors:
+            message += f', {len(errors)} errors encountered'
         
         return jsonify({
             'success': True, 
             'message': message, 
-            'saved_count': saved_count, 
-            'error_count': error_count,
+            'saved_count': len(saved), 
+            'saved': saved,
+            'conflict_count': len(conflicts),
+            'conflicts': conflicts,
+            'error_count': len(errors),
             'errors': errors
         })
         
     except Exception as e:
-        import traceback
-        print(f"=== ERROR IN SAVE MONTHLY ATTENDANCE API ===")
-        print(f"Error type: {type(e)}")
-        print(f"Error message: {str(e)}")
-        print(f"Full traceback:")
-        traceback.print_exc()
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+def format_attendance_cell(check_in, check_out, working_hours):
+    """Format one attendance record as the time-only cell used by the horizontal views"""
+    check_in_time = str(check_in).split(' ')[1] if check_in and ' ' in str(check_in) else str(check_in) if check_in else '-'
+    
+    if check_in and check_out:
+        return {
+            'check_in': check_in_time,
+            'check_out': str(check_out).split(' ')[1] if ' ' in str(check_out) else str(check_out),
+            'working_hours': working_hours if working_hours else 0.0
+        }
+    
+    # Single punch or incomplete record
+    return {
+        'check_in': check_in_time,
+        'check_out': '-',
+        'working_hours': 0.0
+    }
+
+def build_attendance_grid(conn, from_date, to_date, company_id=''):
+    """Return (date_list, employees, {userid: {date: cell}}) for a date range from one ordered query"""
+    # Generate list of dates in range
+    start_date = datetime.strptime(from_date, '%Y-%m-%d')
+    end_date = datetime.strptime(to_date, '%Y-%m-%d')
+    date_list = [(start_date + timedelta(days=offset)).strftime('%Y-%m-%d') 
+                 for offset in range((end_date - start_date).days + 1)]
+    
+    # Get all employees (filtered by company if specified)
+    company_filter = ' AND u.company_id = ?' if company_id else ''
+    params = (company_id,) if company_id else ()
+    employees = [dict(employee) for employee in conn.execute(f'''SELECT u.*, c.name as company_name 
+                                   FROM users u 
+                                   LEFT JOIN companies c ON u.company_id = c.id 
+                                   WHERE 1=1{company_filter}
+                                   ORDER BY u.name''', params).fetchall()]
+    
+    # Initialize all dates with None, then pivot the whole range in one pass
+    attendance_data = {employee['userid']: dict.fromkeys(date_list) for employee in employees}
+    
+    records = conn.execute(f'''SELECT a.userid, a.punch_date as date, a.check_in, a.check_out, a.working_hours
+                               FROM attendance a 
+                               JOIN users u ON u.userid = a.userid 
+                               WHERE a.punch_date >= ? AND a.punch_date <= ?{company_filter}
+                               ORDER BY a.userid, a.timestamp''', (from_date, to_date) + params)
+    
+    for record in records:
+        cells = attendance_data.get(record['userid'])
+        if cells is not None and record['date'] in cells:
+            cells[record['date']] = format_attendance_cell(record['check_in'], record['check_out'], 
+                                                           record['working_hours'])
+    
+    return date_list, employees, attendance_data
+
 @app.route('/attendance_horizontal')
 @login_required
 def attendance_horizontal():
@@ -4837,78 +5361,8 @@ def attendance_horizontal():
     if not to_date:
         to_date = datetime.now().strftime('%Y-%m-%d')
     
-    # Convert dates to datetime objects for iteration
-    start_date = datetime.strptime(from_date, '%Y-%m-%d')
-    end_date = datetime.strptime(to_date, '%Y-%m-%d')
-    
-    # Generate list of dates in range
-    date_list = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_list.append(current_date.strftime('%Y-%m-%d'))
-        current_date += timedelta(days=1)
-    
-    # Get all employees (filtered by company if specified)
-    if company_id:
-        employees = conn.execute('''SELECT u.*, c.name as company_name 
-                                   FROM users u 
-                                   LEFT JOIN companies c ON u.company_id = c.id 
-                                   WHERE u.company_id = ? 
-                                   ORDER BY u.name''', (company_id,)).fetchall()
-    else:
-        employees = conn.execute('''SELECT u.*, c.name as company_name 
-                                   FROM users u 
-                                   LEFT JOIN companies c ON u.company_id = c.id 
-                                   ORDER BY u.name''').fetchall()
-    
-    # Get attendance data for the date range
-    attendance_data = {}
-    for employee in employees:
-        employee_id = employee['userid']
-        attendance_data[employee_id] = {}
-        
-        # Initialize all dates with None
-        for date in date_list:
-            attendance_data[employee_id][date] = None
-        
-        # Get actual attendance records
-        records = conn.execute('''SELECT DATE(a.timestamp) as date, a.check_in, a.check_out, a.working_hours
-                                   FROM attendance a 
-                                   WHERE a.userid = ? AND DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ?
-                                   ORDER BY a.timestamp''', (employee_id, from_date, to_date)).fetchall()
-        
-        for record in records:
-            date = record['date']
-            if date in attendance_data[employee_id]:
-                # Format the attendance data
-                check_in = record['check_in']
-                check_out = record['check_out']
-                working_hours = record['working_hours']
-                
-                if check_in and check_out:
-                    # Format times for display
-                    if ' ' in str(check_in):
-                        check_in_time = str(check_in).split(' ')[1]
-                    else:
-                        check_in_time = str(check_in)
-                        
-                    if ' ' in str(check_out):
-                        check_out_time = str(check_out).split(' ')[1]
-                    else:
-                        check_out_time = str(check_out)
-                    
-                    attendance_data[employee_id][date] = {
-                        'check_in': check_in_time,
-                        'check_out': check_out_time,
-                        'working_hours': working_hours if working_hours else 0.0
-                    }
-                else:
-                    # Single punch or incomplete record
-                    attendance_data[employee_id][date] = {
-                        'check_in': str(check_in).split(' ')[1] if check_in and ' ' in str(check_in) else str(check_in) if check_in else '-',
-                        'check_out': '-',
-                        'working_hours': 0.0
-                    }
+    # Employees x dates grid loaded with a single range query
+    date_list, employees, attendance_data = build_attendance_grid(conn, from_date, to_date, company_id)
     
     # Get all companies for filter dropdown
     companies = conn.execute('SELECT * FROM companies ORDER BY name').fetchall()
@@ -4934,10 +5388,6 @@ def attendance_horizontal():
 def export_excel_horizontal():
     """Export horizontal attendance data to Excel"""
     from datetime import datetime, timedelta
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-    import io
     
     conn = get_db_connection()
     
@@ -4952,346 +5402,120 @@ def export_excel_horizontal():
     if not to_date:
         to_date = datetime.now().strftime('%Y-%m-%d')
     
-    # Convert dates to datetime objects for iteration
-    start_date = datetime.strptime(from_date, '%Y-%m-%d')
-    end_date = datetime.strptime(to_date, '%Y-%m-%d')
-    
-    # Generate list of dates in range
-    date_list = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_list.append(current_date.strftime('%Y-%m-%d'))
-        current_date += timedelta(days=1)
-    
-    # Get all employees (filtered by company if specified)
-    if company_id:
-        employees = conn.execute('''SELECT u.*, c.name as company_name 
-                                   FROM users u 
-                                   LEFT JOIN companies c ON u.company_id = c.id 
-                                   WHERE u.company_id = ? 
-                                   ORDER BY u.name''', (company_id,)).fetchall()
-    else:
-        employees = conn.execute('''SELECT u.*, c.name as company_name 
-                                   FROM users u 
-                                   LEFT JOIN companies c ON u.company_id = c.id 
-                                   ORDER BY u.name''').fetchall()
+    # Employees x dates grid loaded with a single range query
+    date_list, employees, attendance_data = build_attendance_grid(conn, from_date, to_date, company_id)
     
     # Get all companies for reference
     companies = conn.execute('SELECT * FROM companies ORDER BY name').fetchall()
     
-    # Get attendance data for the date range
-    attendance_data = {}
-    for employee in employees:
-        try:
-            # Get employee ID - handle both dictionary and tuple formats
-            if hasattr(employee, 'keys'):
-                employee_id = employee.get('userid')
-            else:
-                employee_id = str(employee[1]) if len(employee) > 1 else 'Unknown'
-            
-            attendance_data[employee_id] = {}
-            
-            # Initialize all dates with None
-            for date in date_list:
-                attendance_data[employee_id][date] = None
-            
-            # Get actual attendance records
-            records = conn.execute('''SELECT DATE(a.timestamp) as date, a.check_in, a.check_out, a.working_hours
-                                       FROM attendance a 
-                                       WHERE a.userid = ? AND DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ?
-                                       ORDER BY a.timestamp''', (employee_id, from_date, to_date)).fetchall()
-            
-            for record in records:
-                try:
-                    # Get date from record - handle both dictionary and tuple formats
-                    if hasattr(record, 'keys'):
-                        date = record.get('date')
-                        check_in = record.get('check_in')
-                        check_out = record.get('check_out')
-                        working_hours = record.get('working_hours')
-                    else:
-                        date = str(record[0]) if len(record) > 0 else None
-                        check_in = record[1] if len(record) > 1 else None
-                        check_out = record[2] if len(record) > 2 else None
-                        working_hours = record[3] if len(record) > 3 else 0.0
-                    
-                    if date and date in attendance_data[employee_id]:
-                        # Format the attendance data
-                        if check_in and check_out:
-                            # Format times for display
-                            if ' ' in str(check_in):
-                                check_in_time = str(check_in).split(' ')[1]
-                            else:
-                                check_in_time = str(check_in)
-                                
-                            if ' ' in str(check_out):
-                                check_out_time = str(check_out).split(' ')[1]
-                            else:
-                                check_out_time = str(check_out)
-                            
-                            attendance_data[employee_id][date] = {
-                                'check_in': check_in_time,
-                                'check_out': check_out_time,
-                                'working_hours': working_hours if working_hours else 0.0
-                            }
-                        else:
-                            # Single punch or incomplete record
-                            attendance_data[employee_id][date] = {
-                                'check_in': str(check_in).split(' ')[1] if check_in and ' ' in str(check_in) else str(check_in) if check_in else '-',
-                                'check_out': '-',
-                                'working_hours': 0.0
-                            }
-                except Exception as e:
-                    print(f"Error processing attendance record for employee {employee_id}: {e}")
-                    continue
-        except Exception as e:
-            print(f"Error processing employee for attendance data: {e}")
-            continue
-    
     conn.close()
     
-    # Create Excel workbook
-    wb = openpyxl.Workbook()
-    
-    # Create Summary Sheet
-    summary_ws = wb.active
-    summary_ws.title = "Summary"
-    
-    # Create Attendance Sheet
-    ws = wb.create_sheet("Attendance Details")
+    # Create Excel workbook; sheets keep the order they are added in
+    export = ExcelExport()
+    summary_ws = export.add_sheet("Summary", column_widths={1: 20, 2: 15, 3: 15, 4: 15})
+    ws = export.add_sheet("Attendance Details", max_width=30)
+    instructions_ws = export.add_sheet("Instructions & Legend", column_widths={1: 25, 2: 60})
     
-    # Define styles
-    header_font = Font(bold=True, color="000000")
-    header_fill = PatternFill(start_color="FFC107", end_color="FFC107", fill_type="solid")
-    date_fill = PatternFill(start_color="FFA500", end_color="FFA500", fill_type="solid")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                    top=Side(style='thin'), bottom=Side(style='thin'))
-    center_alignment = Alignment(horizontal='center', vertical='center')
+    display_dates = [f"{date.split('-')[2]}/{date.split('-')[1]}/{date.split('-')[0]}" for date in date_list]
     
     # Add title
-    ws.merge_cells('A1:' + get_column_letter(4 + len(date_list)) + '1')
-    title_cell = ws['A1']
-    title_cell.value = f"Horizontal Attendance Report - {from_date} to {to_date}"
-    title_cell.font = Font(bold=True, size=16)
-    title_cell.alignment = center_alignment
+    ws.title(f"Horizontal Attendance Report - {from_date} to {to_date}", 4 + len(date_list))
+    ws.blank()
     
     # Add headers
-    headers = ['Employee Name', 'Emp ID', 'Company', 'Shift Type']
-    for date in date_list:
-        headers.append(f"{date.split('-')[2]}/{date.split('-')[1]}/{date.split('-')[0]}")
+    headers = ['Employee Name', 'Emp ID', 'Company', 'Shift Type'] + display_dates
+    ws.append(headers, ['export_header_employee'] * 4 + ['export_header_date'] * len(date_list))
+    
+    row_styles = ['export_cell'] * 4 + ['export_cell_centered'] * len(date_list)
     
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill if col <= 4 else date_fill
-        cell.border = border
-        cell.alignment = center_alignment
+    # Daily statistics for the summary sheet are counted while the rows are written
+    present_counts = [0] * len(date_list)
+    absent_counts = [0] * len(date_list)
+    single_punch_counts = [0] * len(date_list)
     
     # Add data rows
-    for row, employee in enumerate(employees, 4):
-        try:
-            # Employee info - ensure we're accessing the data correctly
-            if hasattr(employee, 'keys'):  # Dictionary-like object
-                emp_name = employee.get('name', 'Unknown')
-                emp_id = employee.get('userid', 'Unknown')
-                emp_company = employee.get('company_name', 'N/A')
-                emp_shift = employee.get('shift_type', 'Day')
-            else:  # Tuple or other object
-                emp_name = str(employee[0]) if len(employee) > 0 else 'Unknown'
-                emp_id = str(employee[1]) if len(employee) > 1 else 'Unknown'
-                emp_company = str(employee[2]) if len(employee) > 2 else 'N/A'
-                emp_shift = str(employee[3]) if len(employee) > 3 else 'Day'
-            
-            ws.cell(row=row, column=1, value=emp_name).border = border
-            ws.cell(row=row, column=2, value=emp_id).border = border
-            ws.cell(row=row, column=3, value=emp_company).border = border
-            ws.cell(row=row, column=4, value=emp_shift).border = border
-            
-            # Attendance data for each date
-            for col, date in enumerate(date_list, 5):
-                cell = ws.cell(row=row, column=col)
-                cell.border = border
-                cell.alignment = center_alignment
-                
-                # Get employee ID for attendance lookup
-                if hasattr(employee, 'keys'):
-                    emp_userid = employee.get('userid')
-                else:
-                    emp_userid = str(employee[1]) if len(employee) > 1 else 'Unknown'
-                
-                attendance = attendance_data.get(emp_userid, {}).get(date)
-                if attendance:
-                    if attendance.get('check_out') != '-':
-                        # Format: Check-in | Check-out | Hours
-                        cell.value = f"{attendance.get('check_in', '-')} | {attendance.get('check_out', '-')} | {attendance.get('working_hours', 0):.2f}h"
-                    else:
-                        cell.value = f"{attendance.get('check_in', '-')} | Single Punch"
+    for employee in employees:
+        row_data = [
+            employee.get('name', 'Unknown'),
+            employee.get('userid', 'Unknown'),
+            employee.get('company_name', 'N/A'),
+            employee.get('shift_type', 'Day')
+        ]
+        
+        # Attendance data for each date
+        employee_attendance = attendance_data.get(employee.get('userid'), {})
+        for index, date in enumerate(date_list):
+            attendance = employee_attendance.get(date)
+            if attendance:
+                if attendance.get('check_out') != '-':
+                    # Format: Check-in | Check-out | Hours
+                    row_data.append(f"{attendance.get('check_in', '-')} | {attendance.get('check_out', '-')} | {attendance.get('working_hours', 0):.2f}h")
+                    present_counts[index] += 1
                 else:
-                    cell.value = "No Record"
-        except Exception as e:
-            print(f"Error processing employee row {row}: {e}")
-            # Set default values if there's an error
-            ws.cell(row=row, column=1, value="Error").border = border
-            ws.cell(row=row, column=2, value="Error").border = border
-            ws.cell(row=row, column=3, value="Error").border = border
-            ws.cell(row=row, column=4, value="Error").border = border
-            continue
-    
-    # Auto-adjust column widths
-    for col_num in range(1, ws.max_column + 1):
-        max_length = 0
-        column_letter = get_column_letter(col_num)
-        for row_num in range(1, ws.max_row + 1):
-            cell = ws.cell(row=row_num, column=col_num)
-            try:
-                if cell.value and len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 30)
-        ws.column_dimensions[column_letter].width = adjusted_width
+                    row_data.append(f"{attendance.get('check_in', '-')} | Single Punch")
+                    single_punch_counts[index] += 1
+            else:
+                row_data.append("No Record")
+                absent_counts[index] += 1
+        
+        ws.append(row_data, row_styles)
     
     # Create Summary Sheet
-    summary_ws.merge_cells('A1:D1')
-    summary_title = summary_ws['A1']
-    summary_title.value = f"Attendance Summary Report - {from_date} to {to_date}"
-    summary_title.font = Font(bold=True, size=16)
-    summary_title.alignment = center_alignment
+    summary_ws.title(f"Attendance Summary Report - {from_date} to {to_date}", 4)
+    summary_ws.blank()
     
     # Add summary statistics
-    summary_ws['A3'] = "Total Employees:"
-    summary_ws['B3'] = len(employees)
-    summary_ws['A4'] = "Date Range:"
-    summary_ws['B4'] = f"{from_date} to {to_date}"
-    summary_ws['A5'] = "Total Days:"
-    summary_ws['B5'] = len(date_list)
+    summary_styles = ['export_label', 'export_value']
+    summary_ws.append(["Total Employees:", len(employees)], summary_styles)
+    summary_ws.append(["Date Range:", f"{from_date} to {to_date}"], summary_styles)
+    summary_ws.append(["Total Days:", len(date_list)], summary_styles)
     
     # Add company filter info
     if company_id:
-        try:
-            company_name = next((c['name'] for c in companies if str(c['id']) == str(company_id)), 'Unknown')
-        except:
-            company_name = 'Unknown'
-        summary_ws['A6'] = "Company Filter:"
-        summary_ws['B6'] = company_name
+        company_name = next((c['name'] for c in companies if str(c['id']) == str(company_id)), 'Unknown')
+        summary_ws.append(["Company Filter:", company_name])
+    else:
+        summary_ws.blank()
+    summary_ws.blank()
     
     # Add attendance statistics
-    summary_ws['A8'] = "Attendance Statistics:"
-    summary_ws['A9'] = "Date"
-    summary_ws['B9'] = "Present"
-    summary_ws['C9'] = "Absent"
-    summary_ws['D9'] = "Single Punch"
+    summary_ws.append(["Attendance Statistics:"], 'export_section')
+    summary_ws.append(["Date", "Present", "Absent", "Single Punch"], 'export_header_grey')
     
-    # Calculate daily statistics
-    for i, date in enumerate(date_list, 10):
-        summary_ws[f'A{i}'] = f"{date.split('-')[2]}/{date.split('-')[1]}/{date.split('-')[0]}"
-        
-        present_count = 0
-        absent_count = 0
-        single_punch_count = 0
-        
-        for employee in employees:
-            try:
-                # Get employee ID for attendance lookup
-                if hasattr(employee, 'keys'):
-                    emp_userid = employee.get('userid')
-                else:
-                    emp_userid = str(employee[1]) if len(employee) > 1 else 'Unknown'
-                
-                attendance = attendance_data.get(emp_userid, {}).get(date)
-                if attendance:
-                    if attendance.get('check_out') != '-':
-                        present_count += 1
-                    else:
-                        single_punch_count += 1
-                else:
-                    absent_count += 1
-            except Exception as e:
-                print(f"Error processing attendance for employee: {e}")
-                absent_count += 1
-        
-        summary_ws[f'B{i}'] = present_count
-        summary_ws[f'C{i}'] = absent_count
-        summary_ws[f'D{i}'] = single_punch_count
-    
-    # Style summary sheet
-    for row in range(3, 6):
-        summary_ws[f'A{row}'].font = Font(bold=True)
-        summary_ws[f'B{row}'].font = Font(bold=True, color="007ACC")
-    
-    summary_ws['A8'].font = Font(bold=True, size=14)
-    summary_ws['A9:D9'].font = Font(bold=True)
-    summary_ws['A9:D9'].fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-    
-    # Auto-adjust summary sheet widths
-    summary_ws.column_dimensions['A'].width = 20
-    summary_ws.column_dimensions['B'].width = 15
-    summary_ws.column_dimensions['C'].width = 15
-    summary_ws.column_dimensions['D'].width = 15
-    
-    # Create Instructions Sheet
-    instructions_ws = wb.create_sheet("Instructions & Legend")
+    for index, display_date in enumerate(display_dates):
+        summary_ws.append([display_date, present_counts[index], absent_counts[index], single_punch_counts[index]])
     
     # Add instructions
-    instructions_ws['A1'] = "How to Read This Report"
-    instructions_ws['A1'].font = Font(bold=True, size=16)
-    instructions_ws['A1'].alignment = center_alignment
-    instructions_ws.merge_cells('A1:D1')
-    
-    instructions_ws['A3'] = "Report Structure:"
-    instructions_ws['A3'].font = Font(bold=True, size=14)
-    
-    instructions_ws['A4'] = "• Summary Sheet: Overview and daily statistics"
-    instructions_ws['A5'] = "• Attendance Details: Complete attendance data by employee and date"
-    instructions_ws['A6'] = "• Instructions & Legend: This sheet with explanations"
-    
-    instructions_ws['A8'] = "Data Format:"
-    instructions_ws['A8'].font = Font(bold=True, size=14)
-    
-    instructions_ws['A9'] = "• Complete Record: Check-in | Check-out | Working Hours"
-    instructions_ws['A10'] = "• Single Punch: Check-in | Single Punch (incomplete record)"
-    instructions_ws['A11'] = "• No Record: Employee was not present on this date"
-    
-    instructions_ws['A13'] = "Color Coding:"
-    instructions_ws['A13'].font = Font(bold=True, size=14)
-    
-    instructions_ws['A14'] = "• Yellow Headers: Employee information columns"
-    instructions_ws['A15'] = "• Orange Headers: Date columns"
-    instructions_ws['A16'] = "• White Background: Data cells"
-    
-    instructions_ws['A18'] = "Example:"
-    instructions_ws['A18'].font = Font(bold=True, size=14)
-    
-    instructions_ws['A19'] = "09:14:15 | 17:57:29 | 8.72h"
-    instructions_ws['A19'].font = Font(color="007ACC")
-    instructions_ws['B19'] = "= Check-in at 9:14 AM, Check-out at 5:57 PM, Worked 8.72 hours"
-    
-    instructions_ws['A20'] = "18:26:59 | Single Punch"
-    instructions_ws['A20'].font = Font(color="FF6B35")
-    instructions_ws['B20'] = "= Checked in at 6:26 PM, no check-out recorded"
-    
-    instructions_ws['A21'] = "No Record"
-    instructions_ws['A21'].font = Font(color="999999")
-    instructions_ws['B21'] = "= Employee was not present on this date"
-    
-    # Style instructions sheet
-    instructions_ws.column_dimensions['A'].width = 25
-    instructions_ws.column_dimensions['B'].width = 60
-    
-    # Save to bytes
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    # Create response
-    filename = f"horizontal_attendance_{from_date}_to_{to_date}.xlsx"
-    
-    return send_file(
-        io.BytesIO(output.getvalue()),
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=filename
-    )
+    instructions_ws.title("How to Read This Report", 4)
+    instructions_ws.blank()
+    
+    instructions_ws.append(["Report Structure:"], 'export_section')
+    instructions_ws.append(["• Summary Sheet: Overview and daily statistics"])
+    instructions_ws.append(["• Attendance Details: Complete attendance data by employee and date"])
+    instructions_ws.append(["• Instructions & Legend: This sheet with explanations"])
+    instructions_ws.blank()
+    
+    instructions_ws.append(["Data Format:"], 'export_section')
+    instructions_ws.append(["• Complete Record: Check-in | Check-out | Working Hours"])
+    instructions_ws.append(["• Single Punch: Check-in | Single Punch (incomplete record)"])
+    instructions_ws.append(["• No Record: Employee was not present on this date"])
+    instructions_ws.blank()
+    
+    instructions_ws.append(["Color Coding:"], 'export_section')
+    instructions_ws.append(["• Yellow Headers: Employee information columns"])
+    instructions_ws.append(["• Orange Headers: Date columns"])
+    instructions_ws.append(["• White Background: Data cells"])
+    instructions_ws.blank()
+    
+    instructions_ws.append(["Example:"], 'export_section')
+    instructions_ws.append(["09:14:15 | 17:57:29 | 8.72h", "= Check-in at 9:14 AM, Check-out at 5:57 PM, Worked 8.72 hours"], 
+                           ['export_legend_complete', None])
+    instructions_ws.append(["18:26:59 | Single Punch", "= Checked in at 6:26 PM, no check-out recorded"], 
+                           ['export_legend_single', None])
+    instructions_ws.append(["No Record", "= Employee was not present on this date"], 
+                           ['export_legend_missing', None])
+    
+    return export.send(f"horizontal_attendance_{from_date}_to_{to_date}.xlsx")
 
 @app.route('/export_pdf_horizontal')
 @login_required
@@ -5318,78 +5542,8 @@ def export_pdf_horizontal():
     if not to_date:
         to_date = datetime.now().strftime('%Y-%m-%d')
     
-    # Convert dates to datetime objects for iteration
-    start_date = datetime.strptime(from_date, '%Y-%m-%d')
-    end_date = datetime.strptime(to_date, '%Y-%m-%d')
-    
-    # Generate list of dates in range
-    date_list = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_list.append(current_date.strftime('%Y-%m-%d'))
-        current_date += timedelta(days=1)
-    
-    # Get all employees (filtered by company if specified)
-    if company_id:
-        employees = conn.execute('''SELECT u.*, c.name as company_name 
-                                   FROM users u 
-                                   LEFT JOIN companies c ON u.company_id = c.id 
-                                   WHERE u.company_id = ? 
-                                   ORDER BY u.name''', (company_id,)).fetchall()
-    else:
-        employees = conn.execute('''SELECT u.*, c.name as company_name 
-                                   FROM users u 
-                                   LEFT JOIN companies c ON u.company_id = c.id 
-                                   ORDER BY u.name''').fetchall()
-    
-    # Get attendance data for the date range
-    attendance_data = {}
-    for employee in employees:
-        employee_id = employee['userid']
-        attendance_data[employee_id] = {}
-        
-        # Initialize all dates with None
-        for date in date_list:
-            attendance_data[employee_id][date] = None
-        
-        # Get actual attendance records
-        records = conn.execute('''SELECT DATE(a.timestamp) as date, a.check_in, a.check_out, a.working_hours
-                                   FROM attendance a 
-                                   WHERE a.userid = ? AND DATE(a.timestamp) >= ? AND DATE(a.timestamp) <= ?
-                                   ORDER BY a.timestamp''', (employee_id, from_date, to_date)).fetchall()
-        
-        for record in records:
-            date = record['date']
-            if date in attendance_data[employee_id]:
-                # Format the attendance data
-                check_in = record['check_in']
-                check_out = record['check_out']
-                working_hours = record['working_hours']
-                
-                if check_in and check_out:
-                    # Format times for display
-                    if ' ' in str(check_in):
-                        check_in_time = str(check_in).split(' ')[1]
-                    else:
-                        check_in_time = str(check_in)
-                        
-                    if ' ' in str(check_out):
-                        check_out_time = str(check_out).split(' ')[1]
-                    else:
-                        check_out_time = str(check_out)
-                    
-                    attendance_data[employee_id][date] = {
-                        'check_in': check_in_time,
-                        'check_out': check_out_time,
-                        'working_hours': working_hours if working_hours else 0.0
-                    }
-                else:
-                    # Single punch or incomplete record
-                    attendance_data[employee_id][date] = {
-                        'check_in': str(check_in).split(' ')[1] if check_in and ' ' in str(check_in) else str(check_in) if check_in else '-',
-                        'check_out': '-',
-                        'working_hours': 0.0
-                    }
+    # Employees x dates grid loaded with a single range query
+    date_list, employees, attendance_data = build_attendance_grid(conn, from_date, to_date, company_id)
     
     conn.close()
     
@@ -5489,7 +5643,7 @@ def export_pdf_horizontal():
             
             table_data.append(row)
         except Exception as e:
-            print(f"Error processing employee for PDF: {e}")
+            row_logger.warning("Error processing employee for PDF: %s", e)
             # Add error row
             error_row = ['Error', 'Error', 'Error', 'Error']
             for date in date_list:
@@ -5555,11 +5709,10 @@ if __name__ == '__main__':
             replace_existing=True
         )
         
-        print("✅ Automated email schedules configured successfully!")
+        logger.info("Automated email schedules configured")
         
     except Exception as e:
-        print(f"⚠️ Warning: Could not setup automated emails: {e}")
-        print("You can still send manual reports via the web interface")
+        logger.warning("Could not setup automated emails (manual reports still work): %s", e)
     
     print("Starting Attendance System Web App...")
     print("Open your browser and go to: http://localhost:5000")
@@ -5577,12 +5730,12 @@ def send_daily_report_automated():
         if html_content:
             subject = f"Daily Attendance Summary - {datetime.now().strftime('%Y-%m-%d')} - {COMPANY_NAME}"
             send_email_notification(subject, default_recipients, html_content)
-            print(f"✅ Automated daily report sent at {datetime.now()}")
+            logger.info("Automated daily report sent")
         else:
-            print(f"⚠️ No attendance data for automated daily report at {datetime.now()}")
+            logger.warning("No attendance data for automated daily report")
             
     except Exception as e:
-        print(f"❌ Error sending automated daily report: {e}")
+        logger.error("Error sending automated daily report: %s", e)
 
 def send_monthly_report_automated():
     """Automated monthly salary report (called by scheduler)"""
@@ -5599,9 +5752,9 @@ def send_monthly_report_automated():
         if html_content:
             subject = f"Monthly Salary Summary - {month} {year} - {COMPANY_NAME}"
             send_email_notification(subject, default_recipients, html_content)
-            print(f"✅ Automated monthly report sent at {datetime.now()}")
+            logger.info("Automated monthly report sent")
         else:
-            print(f"⚠️ No salary data for automated monthly report at {datetime.now()}")
+            logger.warning("No salary data for automated monthly report")
             
     except Exception as e:
-        print(f"❌ Error sending automated monthly report: {e}")
+        logger.error("Error sending automated monthly report: %s", e)